@@ -0,0 +1,315 @@
+"""
+Benchmarks for the phases of a py2app build
+
+This script generates a synthetic project (see synthetic.py), and
+times the phases of a build of that project that also run on
+platforms other than macOS:
+
+- modulegraph: creating the module graph
+- recipes: running the recipes
+- metadata scan: indexing the installed distributions, with and
+  without a metadata index from an earlier build
+- byte_compile: byte-compiling the modules into a directory
+- copy_tree: copying the package directories (data files and
+  extensions)
+- make_lib_archive: creating the zipfile with python modules
+
+Every phase is run "--repeat" times with fresh build directories,
+and the median is compared to the baseline for this platform and
+Python version in baselines.json. The script exits with status 1
+when a phase is slower than its baseline by more than the tolerance,
+and with status 2 when there is no baseline to compare with.
+
+Timings depend on the machine they were recorded on, and the
+baselines.json in the repository is empty for that reason. Record a
+baseline on the machine used for comparing with "--update-baseline"
+before making changes, using the same project options as the runs
+that are compared to it. Baselines for other project options are
+not used.
+
+Worker processes for "--jobs" are new interpreters that don't run
+the __main__ module (see py2app._process_pool), the same as in a
+build from a setup.py file without a ``__name__ == "__main__"`` guard.
+
+Usage::
+
+    python benchmarks/run.py [--packages N] [--modules N] [--repeat N]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import ProjectSpec, generate_project  # noqa: E402
+
+BASELINE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baselines.json"
+)
+
+PHASES = [
+    "modulegraph",
+    "recipes",
+    "metadata scan",
+    "metadata scan (warm)",
+    "byte_compile",
+    "copy_tree",
+    "make_lib_archive",
+]
+
+# Differences smaller than this number of seconds are never
+# reported as a regression, those are mostly noise.
+MIN_DELTA = 0.05
+
+
+def baseline_key():
+    return (
+        f"{platform.system()}-{platform.machine()}-"
+        f"py{sys.version_info[0]}.{sys.version_info[1]}"
+    )
+
+
+@contextlib.contextmanager
+def timed(timings, phase):
+    start = time.perf_counter()
+    yield
+    timings[phase] = time.perf_counter() - start
+
+
+def make_command(project, build_dir, jobs):
+    from setuptools import Distribution
+
+    from py2app.build_app import py2app
+
+    dist = Distribution()
+    dist.app = [project.script]
+    dist.plugin = None
+
+    cmd = py2app(dist)
+    cmd.progress_level = 0
+    cmd.bdist_base = os.path.join(build_dir, "build")
+    cmd.dist_dir = os.path.join(build_dir, "dist")
+    cmd.jobs = jobs
+
+    # The tkinter recipe needs a display on Linux, and the
+    # test package is not something applications include.
+    cmd.excludes = ["test", "tkinter"]
+    cmd.ensure_finalized()
+    return cmd
+
+
+def run_once(project, build_dir, jobs):
+    """
+    Build *project* in *build_dir* and return the time
+    spent in every phase.
+    """
+    from py2app import util
+    from py2app._pkg_meta import MetadataIndex
+
+    timings = {}
+    cmd = make_command(project, build_dir, jobs)
+    try:
+        cmd.create_directories()
+        cmd.fixup_distribution()
+        cmd.initialize_plist()
+        cmd.additional_paths = []
+        cmd.initialize_prescripts()
+
+        with timed(timings, "modulegraph"):
+            mf = cmd.get_modulefinder()
+
+        filters = cmd.collect_filters()
+        loader_files = []
+        with timed(timings, "recipes"):
+            cmd.process_recipes(mf, filters, {}, loader_files)
+
+        cmd.filter_dependencies(mf, filters)
+        py_files, extensions = cmd.finalize_modulefinder(mf)
+
+        index_file = os.path.join(cmd.cache_dir, "metadata-index.json")
+        with timed(timings, "metadata scan"):
+            MetadataIndex(sys.path, index_file).save()
+        with timed(timings, "metadata scan (warm)"):
+            index = MetadataIndex(sys.path, index_file)
+
+        included_metadata = set()
+        for mod in py_files + extensions:
+            if getattr(mod, "filename", None) is not None:
+                dist_info_path = index.owner(mod.filename)
+                if dist_info_path is not None:
+                    included_metadata.add(dist_info_path)
+
+        with timed(timings, "byte_compile"):
+            util.byte_compile(
+                py_files,
+                optimize=cmd.optimize,
+                target_dir=os.path.join(build_dir, "bytecode"),
+                progress=cmd.progress,
+                jobs=cmd.jobs,
+            )
+
+        with timed(timings, "copy_tree"):
+            for package in project.packages:
+                util.copy_tree(
+                    os.path.join(project.site_dir, package),
+                    os.path.join(build_dir, "copy", package),
+                    progress=cmd.progress,
+                )
+
+        with timed(timings, "make_lib_archive"):
+            cmd.make_lib_archive(
+                os.path.join(build_dir, "python.zip"),
+                py_files,
+                sorted(included_metadata),
+                loader_files,
+            )
+    finally:
+        cmd.progress.stop()
+
+    return timings
+
+
+def run_benchmarks(spec, repeat, jobs):
+    """
+    Return the median time for every phase
+    """
+    workdir = tempfile.mkdtemp(prefix="py2app-bench-")
+    try:
+        project = generate_project(os.path.join(workdir, "project"), spec)
+        sys.path.insert(0, project.site_dir)
+        try:
+            samples = {phase: [] for phase in PHASES}
+            for idx in range(repeat):
+                build_dir = os.path.join(workdir, f"build-{idx}")
+                for phase, seconds in run_once(project, build_dir, jobs).items():
+                    samples[phase].append(seconds)
+                shutil.rmtree(build_dir)
+        finally:
+            sys.path.remove(project.site_dir)
+
+        return {phase: statistics.median(values) for phase, values in samples.items()}
+
+    finally:
+        shutil.rmtree(workdir)
+
+
+def load_baselines():
+    try:
+        with open(BASELINE_FILE) as stream:
+            return json.load(stream)
+    except FileNotFoundError:
+        return {}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the results and the baseline, and return the
+    phases that are slower than the baseline.
+    """
+    regressions = []
+    print(f"{'phase':24} {'median':>10} {'baseline':>10} {'change':>8}")
+    for phase in PHASES:
+        value = results[phase]
+        expected = None if baseline is None else baseline.get(phase)
+        if expected is None:
+            print(f"{phase:24} {value:9.3f}s {'-':>10} {'-':>8}")
+            continue
+
+        change = (value - expected) / expected if expected else 0.0
+        flag = ""
+        if change > tolerance and value - expected > MIN_DELTA:
+            regressions.append(phase)
+            flag = "  REGRESSION"
+        print(f"{phase:24} {value:9.3f}s {expected:9.3f}s {change:+8.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    defaults = ProjectSpec()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--packages", type=int, default=defaults.packages)
+    parser.add_argument(
+        "--modules", type=int, default=defaults.modules, help="modules per package"
+    )
+    parser.add_argument(
+        "--data-files",
+        type=int,
+        default=defaults.data_files,
+        help="data files per package",
+    )
+    parser.add_argument(
+        "--extensions",
+        type=int,
+        default=defaults.extensions,
+        help="fake extension modules per package",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown relative to the baseline (default: 0.25)",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="store the results as the baseline for this platform",
+    )
+    args = parser.parse_args(argv)
+
+    spec = defaults._replace(
+        packages=args.packages,
+        modules=args.modules,
+        data_files=args.data_files,
+        extensions=args.extensions,
+    )
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        results = run_benchmarks(spec, args.repeat, args.jobs)
+
+    key = baseline_key()
+    baselines = load_baselines()
+    entry = baselines.get(key)
+    if entry is None:
+        print(f"no baseline for {key}, record one using --update-baseline")
+    elif entry["spec"] != spec._asdict():
+        print(f"baseline for {key} uses another project, not comparing")
+        entry = None
+
+    print(f"{key}: {spec}, {args.repeat} runs")
+    regressions = compare(
+        results, None if entry is None else entry["phases"], args.tolerance
+    )
+
+    if args.update_baseline:
+        baselines[key] = {
+            "spec": spec._asdict(),
+            "phases": {phase: round(value, 4) for phase, value in results.items()},
+        }
+        with open(BASELINE_FILE, "w") as stream:
+            json.dump(baselines, stream, indent=2, sort_keys=True)
+            stream.write("\n")
+        print(f"updated baseline for {key}")
+        return 0
+
+    if entry is None:
+        return 2
+
+    if regressions:
+        print(f"slower than the baseline: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
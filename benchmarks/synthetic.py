@@ -0,0 +1,168 @@
+"""
+Generator for synthetic projects used by the benchmarks
+
+A project consists of a main script and a "site-packages" directory
+with a number of packages. Every package is installed by its own
+distribution (with a dist-info directory and RECORD file), and contains
+a number of modules, data files and fake extension modules.
+
+The fake extension modules have the right suffix for the modulegraph
+to treat them as extensions, but contain random bytes instead of
+machine code. The benchmarks only time the phases that don't need
+to load or sign them.
+"""
+import base64
+import hashlib
+import importlib.machinery
+import os
+import random
+import textwrap
+import typing
+
+MODULE_TEMPLATE = textwrap.dedent(
+    '''\
+    """
+    Synthetic module {name}
+    """
+    import json
+    import os
+
+    from . import {sibling}
+
+    CONSTANT_{index} = {index}
+
+
+    class Class{index}:
+        """Class in module {index}"""
+
+        def __init__(self, value=CONSTANT_{index}):
+            self.value = value
+
+        def method(self, other):
+            return json.dumps({{"value": self.value, "other": other}})
+
+        @property
+        def path(self):
+            return os.path.join("data", str(self.value))
+
+
+    def function_{index}(values):
+        result = []
+        for value in values:
+            if value % 2:
+                result.append(Class{index}(value).method(value))
+            else:
+                result.append({sibling}.__name__)
+        return result
+    '''
+)
+
+
+class ProjectSpec(typing.NamedTuple):
+    packages: int = 20
+    modules: int = 25
+    data_files: int = 10
+    extensions: int = 2
+    data_size: int = 4096
+    extension_size: int = 65536
+
+
+class Project(typing.NamedTuple):
+    root: str
+    script: str
+    site_dir: str
+    packages: typing.List[str]
+
+
+def _record_line(root: str, path: str) -> str:
+    with open(path, "rb") as stream:
+        data = stream.read()
+    digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=")
+    relpath = os.path.relpath(path, root).replace(os.sep, "/")
+    return f"{relpath},sha256={digest.decode()},{len(data)}\n"
+
+
+def _random_bytes(rng: random.Random, size: int) -> bytes:
+    return rng.getrandbits(size * 8).to_bytes(size, "little")
+
+
+def _write(path: str, data: typing.Union[str, bytes]) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = "wb" if isinstance(data, bytes) else "w"
+    with open(path, mode) as stream:
+        stream.write(data)
+    return path
+
+
+def generate_project(root: str, spec: ProjectSpec, seed: int = 0) -> Project:
+    """
+    Generate a synthetic project described by *spec* in *root*,
+    the contents of data files and extensions are generated
+    using a random generator initialized with *seed*.
+    """
+    rng = random.Random(seed)
+    ext_suffix = importlib.machinery.EXTENSION_SUFFIXES[0]
+    site_dir = os.path.join(root, "site-packages")
+    packages = []
+
+    for pkg_idx in range(spec.packages):
+        package = f"synthpkg{pkg_idx}"
+        packages.append(package)
+        pkg_dir = os.path.join(site_dir, package)
+        files = []
+
+        names = [f"mod{idx}" for idx in range(spec.modules)]
+        for idx, name in enumerate(names):
+            files.append(
+                _write(
+                    os.path.join(pkg_dir, name + ".py"),
+                    MODULE_TEMPLATE.format(
+                        name=f"{package}.{name}",
+                        index=idx,
+                        sibling=names[(idx + 1) % len(names)],
+                    ),
+                )
+            )
+
+        for idx in range(spec.data_files):
+            files.append(
+                _write(
+                    os.path.join(pkg_dir, "data", f"file{idx}.dat"),
+                    _random_bytes(rng, spec.data_size),
+                )
+            )
+
+        ext_imports = []
+        for idx in range(spec.extensions):
+            ext_imports.append(f"from . import _ext{idx}\n")
+            files.append(
+                _write(
+                    os.path.join(pkg_dir, f"_ext{idx}{ext_suffix}"),
+                    _random_bytes(rng, spec.extension_size),
+                )
+            )
+
+        files.append(
+            _write(
+                os.path.join(pkg_dir, "__init__.py"),
+                "".join(f"from . import {name}\n" for name in names)
+                + "".join(ext_imports),
+            )
+        )
+
+        dist_info = os.path.join(site_dir, f"{package}-1.0.dist-info")
+        files.append(
+            _write(
+                os.path.join(dist_info, "METADATA"),
+                f"Metadata-Version: 2.1\nName: {package}\nVersion: 1.0\n",
+            )
+        )
+        record = [_record_line(site_dir, path) for path in files]
+        record.append(f"{package}-1.0.dist-info/RECORD,,\n")
+        _write(os.path.join(dist_info, "RECORD"), "".join(record))
+
+    script = _write(
+        os.path.join(root, "main.py"),
+        "".join(f"import {package}\n" for package in packages),
+    )
+    return Project(root, script, site_dir, packages)
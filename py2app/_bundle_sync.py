@@ -0,0 +1,450 @@
+"""
+Incremental updates of bundles in the dist directory
+
+With ``--incremental`` bundles are assembled in a staging directory
+and then merged into the dist directory. A manifest of the files in
+the previous version of the bundle (path, size, hash, mode) is used
+to only replace the files that are different and to remove the files
+that are no longer part of the bundle.
+
+The manifest also records the source of files that were copied into
+the bundle and not changed afterwards. Files that are copied again from
+an unchanged source are staged as a copy of the file in the dist
+directory by :class:`ReusePlan` (a clone on filesystems that support
+that), and are not compared or replaced when the staged copy is still
+unchanged when the dist directory is updated.
+"""
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import typing
+
+from macholib.util import is_platform_file
+
+# Increase this when the layout of the manifest changes
+MANIFEST_VERSION = 1
+
+
+class SyncStats:
+    def __init__(self):
+        self.written = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.bytes_written = 0
+
+    def report(self) -> str:
+        return (
+            f"incremental update: {self.written} written "
+            f"({self.bytes_written / (1024 * 1024):.1f} MB), "
+            f"{self.unchanged} unchanged, {self.removed} removed"
+        )
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as stream:
+        while True:
+            data = stream.read(1024 * 1024)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+def load_manifest(path: str) -> typing.Dict[str, dict]:
+    """
+    Return the manifest stored in *path*, or an empty
+    manifest when there is no valid manifest.
+    """
+    try:
+        with open(path) as stream:
+            data = json.load(stream)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data["files"]
+
+
+def manifest_for(manifest_dir: str, dst: str) -> str:
+    """
+    Return the path of the manifest for bundle *dst*
+    """
+    key = hashlib.sha256(os.path.abspath(dst).encode()).hexdigest()
+    return os.path.join(manifest_dir, key[:16] + ".json")
+
+
+def save_manifest(path: str, files: typing.Dict[str, dict]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmpname = path + ".tmp"
+    with open(tmpname, "w") as stream:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, stream)
+    os.replace(tmpname, path)
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+def _install_file(src: str, dst: str) -> None:
+    """
+    Move *src* to *dst*, replacing *dst* atomically when possible
+    """
+    if os.path.isdir(dst) and not os.path.islink(dst):
+        shutil.rmtree(dst)
+
+    try:
+        os.replace(src, dst)
+    except OSError:
+        # Staging and dist directory are on different
+        # filesystems.
+        tmpname = dst + ".py2app-tmp"
+        shutil.copy2(src, tmpname)
+        os.replace(tmpname, dst)
+
+
+def _dest_hash(path: str, st: os.stat_result, entry: typing.Optional[dict]) -> str:
+    """
+    Return the hash of the file at *path*, using the manifest
+    entry when the file was not touched since it was written.
+    """
+    if (
+        entry is not None
+        and entry.get("sha256") is not None
+        and entry.get("size") == st.st_size
+        and entry.get("mtime") == st.st_mtime_ns
+    ):
+        return entry["sha256"]
+    return _hash_file(path)
+
+
+def _source_stamp(path: str) -> typing.Optional[list]:
+    # Path, size and modification time of a source file, or
+    # None for sources that are not a regular file (for example
+    # files in a zipfile).
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+
+
+class ReusePlan:
+    """
+    Files copied into bundles in *staging_dir* that are the same as
+    in the previous version of the bundle in *dist_dir*.
+
+    A file is reused when it is copied from a source with the same
+    path, size and modification time as recorded in the manifest, and
+    the file in the dist directory was not touched since the previous
+    build. Reused files are staged as a copy of the previous version,
+    the staging directory never shares files with the dist directory.
+    Mach-O files are always copied from their source because they are
+    updated in place after copying.
+    """
+
+    def __init__(self, staging_dir: str, dist_dir: str, manifest_dir: str):
+        self.staging_dir = os.path.abspath(staging_dir)
+        self.dist_dir = os.path.abspath(dist_dir)
+        self.manifest_dir = manifest_dir
+        self.reused = 0
+
+        self._lock = threading.Lock()
+        self._manifests: typing.Dict[str, typing.Dict[str, dict]] = {}
+
+        # Staged path -> (source stamp, size, mtime, reused) after copying
+        self._copies: typing.Dict[str, tuple] = {}
+
+    def _manifest(self, name: str) -> typing.Dict[str, dict]:
+        with self._lock:
+            manifest = self._manifests.get(name)
+            if manifest is None:
+                manifest = self._manifests[name] = load_manifest(
+                    manifest_for(self.manifest_dir, os.path.join(self.dist_dir, name))
+                )
+            return manifest
+
+    def reuse(self, source: str, destination: str) -> bool:
+        """
+        Copy the previous version of *destination* into the staging
+        directory when it can be reused, returns True if it was.
+        """
+        relpath = os.path.relpath(os.path.abspath(destination), self.staging_dir)
+        name, _, relpath = relpath.partition(os.sep)
+        if not relpath or name == os.pardir:
+            return False
+
+        stamp = _source_stamp(source)
+        entry = self._manifest(name).get(relpath)
+        if stamp is None or entry is None or entry.get("source") != stamp:
+            return False
+
+        previous = os.path.join(self.dist_dir, name, relpath)
+        try:
+            st = os.lstat(previous)
+        except OSError:
+            return False
+        if (
+            not stat.S_ISREG(st.st_mode)
+            or st.st_size != entry["size"]
+            or st.st_mtime_ns != entry["mtime"]
+            or is_platform_file(previous)
+        ):
+            return False
+
+        if os.path.lexists(destination):
+            os.unlink(destination)
+        _private_copy(previous, destination)
+        os.chmod(destination, stat.S_IMODE(st.st_mode))
+
+        self._record(stamp, destination, True)
+        with self._lock:
+            self.reused += 1
+        return True
+
+    def record(self, source: str, destination: str) -> None:
+        """
+        Record that *destination* was copied from *source*
+        """
+        stamp = _source_stamp(source)
+        if stamp is not None:
+            self._record(stamp, destination, False)
+
+    def _record(self, stamp, destination, reused):
+        st = os.stat(destination)
+        self._copies[os.path.abspath(destination)] = (
+            stamp,
+            st.st_size,
+            st.st_mtime_ns,
+            reused,
+        )
+
+    def sources(self, bundle: str) -> typing.Dict[str, tuple]:
+        """
+        Return the files copied into *bundle*, as a mapping from the
+        path relative to *bundle* to the source stamp, the size
+        and modification time after copying and if the file was
+        reused from the previous build.
+        """
+        prefix = os.path.abspath(bundle) + os.sep
+        return {
+            path[len(prefix) :]: value
+            for path, value in list(self._copies.items())
+            if path.startswith(prefix)
+        }
+
+
+def _private_copy(src: str, dst: str) -> None:
+    # Copy *src* to a new file *dst*, this clones the file
+    # on filesystems that support that.
+    from py2app.util import _copy_contents
+
+    with open(src, "rb") as fp_in:
+        _copy_contents(fp_in, dst)
+
+
+def _entry(st: os.stat_result, digest, mode, source) -> dict:
+    entry = {
+        "size": st.st_size,
+        "mtime": st.st_mtime_ns,
+        "sha256": digest,
+        "mode": mode,
+    }
+    if source is not None:
+        entry["source"] = source
+    return entry
+
+
+def sync_tree(
+    src: str,
+    dst: str,
+    manifest_path: str,
+    stats: typing.Optional[SyncStats] = None,
+    sources: typing.Optional[typing.Dict[str, tuple]] = None,
+) -> SyncStats:
+    """
+    Make *dst* identical to *src*, only touching files that
+    are different. Files in *src* are moved into place, *src*
+    should not be used afterwards.
+
+    *sources* contains the files copied into *src*, as returned
+    by :meth:`ReusePlan.sources`.
+    """
+    if stats is None:
+        stats = SyncStats()
+    if sources is None:
+        sources = {}
+
+    previous = load_manifest(manifest_path) if os.path.lexists(dst) else {}
+    manifest = {}
+
+    if os.path.lexists(dst) and (os.path.islink(dst) or not os.path.isdir(dst)):
+        _remove(dst)
+        stats.removed += 1
+    os.makedirs(dst, exist_ok=True)
+
+    for dirpath, dirnames, filenames in os.walk(src):
+        reldir = os.path.relpath(dirpath, src)
+        if reldir == os.curdir:
+            reldir = ""
+        destdir = os.path.join(dst, reldir)
+
+        # Symbolic links to directories are reported in
+        # dirnames by os.walk.
+        names = sorted(filenames)
+        for nm in list(dirnames):
+            if os.path.islink(os.path.join(dirpath, nm)):
+                dirnames.remove(nm)
+                names.append(nm)
+        dirnames.sort()
+
+        for nm in dirnames:
+            destpath = os.path.join(destdir, nm)
+            if os.path.islink(destpath) or (
+                os.path.lexists(destpath) and not os.path.isdir(destpath)
+            ):
+                _remove(destpath)
+            os.makedirs(destpath, exist_ok=True)
+            mode = stat.S_IMODE(os.stat(os.path.join(dirpath, nm)).st_mode)
+            os.chmod(destpath, mode)
+
+        for nm in names:
+            relpath = os.path.join(reldir, nm)
+            srcpath = os.path.join(dirpath, nm)
+            destpath = os.path.join(destdir, nm)
+
+            if os.path.islink(srcpath):
+                target = os.readlink(srcpath)
+                if os.path.islink(destpath) and os.readlink(destpath) == target:
+                    stats.unchanged += 1
+                else:
+                    if os.path.lexists(destpath):
+                        _remove(destpath)
+                    os.symlink(target, destpath)
+                    stats.written += 1
+                manifest[relpath] = {"symlink": target}
+                continue
+
+            src_st = os.stat(srcpath)
+            mode = stat.S_IMODE(src_st.st_mode)
+            try:
+                dst_st = os.lstat(destpath)
+            except OSError:
+                dst_st = None
+
+            # The source is only recorded for copies that were
+            # not changed after copying.
+            source = None
+            copied = sources.get(relpath)
+            if copied is not None and copied[1:3] == (
+                src_st.st_size,
+                src_st.st_mtime_ns,
+            ):
+                source = copied[0]
+
+            entry = previous.get(relpath)
+            if (
+                source is not None
+                and copied[3]
+                and dst_st is not None
+                and entry is not None
+                and entry.get("source") == source
+                and (dst_st.st_size, dst_st.st_mtime_ns)
+                == (entry["size"], entry["mtime"])
+            ):
+                # A copy of the file in the dist directory made
+                # by ReusePlan that was not changed afterwards.
+                if stat.S_IMODE(dst_st.st_mode) != mode:
+                    os.chmod(destpath, mode)
+                stats.unchanged += 1
+                manifest[relpath] = _entry(
+                    os.stat(destpath), entry.get("sha256"), mode, source
+                )
+                continue
+
+            digest = None
+            if (
+                dst_st is not None
+                and stat.S_ISREG(dst_st.st_mode)
+                and dst_st.st_size == src_st.st_size
+            ):
+                digest = _hash_file(srcpath)
+                if digest == _dest_hash(destpath, dst_st, previous.get(relpath)):
+                    if stat.S_IMODE(dst_st.st_mode) != mode:
+                        os.chmod(destpath, mode)
+                    stats.unchanged += 1
+                    manifest[relpath] = _entry(os.stat(destpath), digest, mode, source)
+                    continue
+
+            _install_file(srcpath, destpath)
+            os.chmod(destpath, mode)
+            stats.written += 1
+            stats.bytes_written += src_st.st_size
+
+            # The hash is only calculated when needed for a
+            # comparison, and is None otherwise.
+            manifest[relpath] = _entry(os.stat(destpath), digest, mode, source)
+
+    # Remove files that are no longer part of the bundle
+    for dirpath, dirnames, filenames in os.walk(dst, topdown=False):
+        reldir = os.path.relpath(dirpath, dst)
+        if reldir == os.curdir:
+            reldir = ""
+
+        for nm in filenames + dirnames:
+            relpath = os.path.join(reldir, nm)
+            path = os.path.join(dirpath, nm)
+            if relpath in manifest:
+                continue
+            if os.path.isdir(path) and not os.path.islink(path):
+                if os.path.exists(os.path.join(src, relpath)):
+                    continue
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
+            stats.removed += 1
+
+    save_manifest(manifest_path, manifest)
+    return stats
+
+
+def sync_dist_dir(
+    staging_dir: str,
+    dist_dir: str,
+    manifest_dir: str,
+    reuse: typing.Optional[ReusePlan] = None,
+) -> SyncStats:
+    """
+    Move everything in *staging_dir* into *dist_dir*, bundles
+    are updated using :func:`sync_tree`. *reuse* is the plan
+    used for copying files into *staging_dir*.
+    """
+    stats = SyncStats()
+    for nm in sorted(os.listdir(staging_dir)):
+        src = os.path.join(staging_dir, nm)
+        dst = os.path.join(dist_dir, nm)
+
+        if os.path.isdir(src) and not os.path.islink(src):
+            sync_tree(
+                src,
+                dst,
+                manifest_for(manifest_dir, dst),
+                stats,
+                reuse.sources(src) if reuse is not None else None,
+            )
+
+        else:
+            if os.path.lexists(dst):
+                _remove(dst)
+            _install_file(src, dst)
+            stats.written += 1
+    return stats
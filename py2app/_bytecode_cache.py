@@ -0,0 +1,131 @@
+"""
+Persistent cache for byte-compiled modules
+
+The cache is content addressed: the key of an entry is derived
+from the source code and everything else that affects the
+generated bytecode. Entries therefore never have to be invalidated,
+the cache is kept below a maximum size by removing the least
+recently used entries.
+
+Entries contain the marshalled code object without the ".pyc"
+header, the header depends on the modification time of the source
+file and on the invalidation mode and is added when the entry is used.
+"""
+import hashlib
+import importlib.util
+import os
+import sys
+import tempfile
+import typing
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+FORMAT_VERSION = 2
+
+
+class BytecodeCache:
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, source: bytes, dfile: str, optimize: int) -> str:
+        """
+        Return the cache key for compiling *source* with the
+        given *dfile* (stored in the code objects) and
+        optimization level.
+        """
+        h = hashlib.sha256()
+        h.update(b"%d\0" % (FORMAT_VERSION,))
+        h.update(importlib.util.MAGIC_NUMBER)
+        h.update(sys.version.encode())
+        h.update(b"\0%d\0" % (optimize,))
+        h.update(dfile.encode("utf-8", "surrogateescape"))
+        h.update(b"\0")
+        h.update(source)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".pyc")
+
+    def get(self, key: str) -> typing.Optional[bytes]:
+        """
+        Return the cached code for *key*, or None
+        when there is no entry for *key*
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as stream:
+                data = stream.read()
+        except OSError:
+            self.misses += 1
+            return None
+
+        # The modification time is used as the "last used"
+        # time for evicting entries.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        Store *data* in the cache
+        """
+        path = self._path(key)
+        dirname = os.path.dirname(path)
+        os.makedirs(dirname, exist_ok=True)
+
+        # Write to a temporary file and then rename, this
+        # ensures that readers never see partial entries.
+        fd, tmpname = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as stream:
+                stream.write(data)
+            os.replace(tmpname, path)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+
+    def prune(self) -> int:
+        """
+        Remove the least recently used entries until the
+        cache is no larger than the maximum size, returns
+        the number of entries removed.
+        """
+        entries = []
+        total = 0
+        if not os.path.isdir(self.directory):
+            return 0
+
+        for dirpath, _dirnames, filenames in os.walk(self.directory):
+            for fn in filenames:
+                if not fn.endswith(".pyc"):
+                    continue
+                path = os.path.join(dirpath, fn)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        removed = 0
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+
+        return removed
+
+    def report(self) -> str:
+        return f"bytecode cache: {self.hits} hits, {self.misses} misses"
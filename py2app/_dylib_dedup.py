@@ -0,0 +1,253 @@
+"""
+Deduplication of identical dylibs in a bundle (``--dedup-dylibs``)
+
+Wheels often vendor the same native libraries (for example in a
+``.dylibs`` directory next to their extensions), which results in
+several identical copies of those libraries in the bundle. This
+module keeps a single copy of every set of byte-identical dylibs in
+``Contents/Frameworks``, and rewrites the load commands of the binaries
+that link to one of the copies to link to that copy instead.
+
+The other copies are replaced by symbolic links to the remaining
+copy, both for code that loads libraries by path and for load
+commands that cannot be rewritten because the new name doesn't fit
+in the Mach-O header.
+"""
+import collections
+import os
+import shutil
+import typing
+
+from macholib.MachO import MachO
+from macholib.util import flipwritable
+
+from py2app._macho_cache import MachOCache, _file_digest, read_headers
+
+
+class DedupResult(typing.NamedTuple):
+    # The Mach-O files in the bundle after deduplication
+    files: typing.List[str]
+
+    # Number of files replaced by a symbolic link
+    duplicates: int
+
+    # Number of bytes saved by removing the duplicates
+    saved: int
+
+
+def _expand(name: str, loader_dir: str, executable_path: str) -> str:
+    for prefix, base in (
+        ("@executable_path", executable_path),
+        ("@loader_path", loader_dir),
+    ):
+        if name == prefix or name.startswith(prefix + "/"):
+            return base + name[len(prefix) :]
+    return name
+
+
+def _references(headers, loader_dir, executable_path):
+    """
+    Yield the names of the libraries linked by a file with *headers*
+    that is located in *loader_dir*, together with the real path of
+    the file the name refers to (or None when that doesn't exist).
+    """
+    for header in headers:
+        rpaths = [
+            _expand(rpath, loader_dir, executable_path) for rpath in header.rpaths
+        ]
+        for _idx, _kind, name in header.walkRelocatables():
+            if name.startswith("@rpath/"):
+                candidates = [
+                    os.path.join(rpath, name[len("@rpath/") :]) for rpath in rpaths
+                ]
+            else:
+                candidates = [_expand(name, loader_dir, executable_path)]
+
+            for path in candidates:
+                if os.path.exists(path):
+                    yield name, os.path.realpath(path)
+                    break
+            else:
+                yield name, None
+
+
+def _rewrite(path: str, changes: typing.Dict[str, str]) -> typing.Optional[MachO]:
+    """
+    Return a MachO for *path* with the load commands in *changes*
+    rewritten, or None when the new load commands don't fit.
+    """
+    macho = MachO(path)
+    macho.rewriteLoadCommands(changes.get)
+    for header in macho.headers:
+        if header.total_size + header.sizediff > header.low_offset:
+            return None
+    return macho
+
+
+def _write(macho: MachO, path: str) -> None:
+    old_mode = flipwritable(path)
+    try:
+        with open(path, "rb+") as stream:
+            macho.write(stream)
+    finally:
+        flipwritable(path, old_mode)
+
+
+def dedup_dylibs(
+    bundle: str,
+    files: typing.Iterable[str],
+    progress,
+    macho_cache: typing.Optional[MachOCache] = None,
+) -> DedupResult:
+    """
+    Deduplicate the dylibs in *files*, which should be all Mach-O
+    files in *bundle*. Dylibs that are part of a framework are
+    left alone.
+    """
+    contents = os.path.join(bundle, "Contents")
+    frameworks = os.path.join(contents, "Frameworks")
+    executable_path = os.path.join(contents, "MacOS")
+
+    def get_headers(path):
+        if macho_cache is None:
+            return read_headers(path)
+        return macho_cache.headers(path)
+
+    files = sorted({os.path.realpath(fn) for fn in files})
+    headers = {fn: get_headers(fn) for fn in files}
+
+    by_size = collections.defaultdict(list)
+    for fn in files:
+        if not headers[fn] or any(h.filetype != "dylib" for h in headers[fn]):
+            continue
+        if any(part.endswith(".framework") for part in fn.split(os.sep)):
+            continue
+        by_size[os.path.getsize(fn)].append(fn)
+
+    by_digest = collections.defaultdict(list)
+    for paths in by_size.values():
+        if len(paths) > 1:
+            for fn in paths:
+                by_digest[_file_digest(fn)].append(fn)
+
+    # Pick the copy to keep for every set of identical dylibs, that
+    # is a copy in Contents/Frameworks when there is one, and a new
+    # copy of the first file otherwise.
+    canonical_of: typing.Dict[str, str] = {}
+    sources: typing.Dict[str, str] = {}
+    for digest, members in sorted(by_digest.items()):
+        if len(members) < 2:
+            continue
+        members.sort()
+        for fn in members:
+            if os.path.dirname(fn) == frameworks:
+                canonical = fn
+                break
+        else:
+            name = os.path.basename(members[0])
+            canonical = os.path.join(frameworks, name)
+            if os.path.lexists(canonical) or canonical in sources:
+                stem, ext = os.path.splitext(name)
+                canonical = os.path.join(frameworks, f"{stem}-{digest[:8]}{ext}")
+            sources[canonical] = members[0]
+
+        for fn in members:
+            canonical_of[fn] = canonical
+
+    def changes_for(path, loaded_from):
+        # Changes for the load commands of *path*, which has the
+        # same contents as *loaded_from*.
+        changes = {}
+        for name, target in _references(
+            headers[loaded_from], os.path.dirname(loaded_from), executable_path
+        ):
+            if target is None:
+                continue
+            final = canonical_of.get(target, target)
+            if final == target and not (
+                path != loaded_from and name.startswith(("@loader_path", "@rpath"))
+            ):
+                continue
+            if not final.startswith(contents + os.sep):
+                continue
+            new_name = "@loader_path/" + os.path.relpath(final, os.path.dirname(path))
+            if new_name != name:
+                changes[name] = new_name
+        return changes
+
+    # The new copies in Contents/Frameworks need updates for load
+    # commands relative to their location, sets of copies for which
+    # that isn't possible are not deduplicated.
+    rewritten: typing.Dict[str, MachO] = {}
+    while True:
+        dropped = []
+        rewritten.clear()
+        for canonical, source in sources.items():
+            changes = changes_for(canonical, source)
+            if not changes:
+                continue
+            macho = _rewrite(source, changes)
+            if macho is None:
+                dropped.append(canonical)
+            else:
+                rewritten[canonical] = macho
+
+        if not dropped:
+            break
+
+        for canonical in dropped:
+            progress.warning(
+                f"Not deduplicating {sources[canonical]}: "
+                "load commands cannot be rewritten"
+            )
+            del sources[canonical]
+            for fn in [fn for fn, value in canonical_of.items() if value == canonical]:
+                del canonical_of[fn]
+
+    if not canonical_of:
+        return DedupResult(files, 0, 0)
+
+    os.makedirs(frameworks, exist_ok=True)
+    for canonical, source in sources.items():
+        progress.trace(f"Deduplicating {source} as {canonical}")
+        shutil.copy2(source, canonical)
+        if canonical in rewritten:
+            _write(rewritten[canonical], canonical)
+
+    # Plan the updates of the other binaries before replacing the
+    # copies, references to a copy resolve to the remaining copy
+    # after that.
+    remaining = [fn for fn in files if fn not in canonical_of] + sorted(
+        set(canonical_of.values())
+    )
+    updates = []
+    for fn in remaining:
+        if fn in sources:
+            continue
+        changes = changes_for(fn, fn)
+        if not changes:
+            continue
+        macho = _rewrite(fn, changes)
+        if macho is None:
+            progress.warning(
+                f"{fn}: load commands cannot be rewritten, using links instead"
+            )
+            continue
+        updates.append((fn, macho))
+
+    duplicates = saved = 0
+    for fn, canonical in sorted(canonical_of.items()):
+        if fn == canonical:
+            continue
+        progress.trace(f"Replacing {fn} by a link to {canonical}")
+        saved += os.path.getsize(fn)
+        duplicates += 1
+        os.unlink(fn)
+        os.symlink(os.path.relpath(canonical, os.path.dirname(fn)), fn)
+    saved -= sum(os.path.getsize(source) for source in sources.values())
+
+    for fn, macho in updates:
+        progress.trace(f"Updating load commands of {fn}")
+        _write(macho, fn)
+
+    return DedupResult(sorted(remaining), duplicates, saved)
@@ -0,0 +1,204 @@
+"""
+Persistent cache for the global names read by modules
+
+The detect_dunder_file recipe looks for modules that read the
+global name ``__file__``, which requires scanning the bytecode of
+every module that isn't in the standard library. The results are
+stored in a cache file keyed by a hash of the bytecode and names of
+the code objects of a module, and modules that aren't in the cache
+are scanned on a pool of worker processes.
+"""
+import dis
+import hashlib
+import importlib.util
+import json
+import marshal
+import os
+import sys
+import types
+import typing
+
+CACHE_VERSION = 1
+
+# Starting worker processes isn't worth it for a small
+# number of modules.
+MIN_PARALLEL_SCAN = 256
+
+_LOAD_NAME = dis.opmap["LOAD_NAME"]
+_LOAD_GLOBAL = dis.opmap["LOAD_GLOBAL"]
+_EXTENDED_ARG = dis.EXTENDED_ARG
+
+# The low bit of the argument of LOAD_GLOBAL is a flag
+# in Python 3.11 or later.
+_LOAD_GLOBAL_SHIFT = 1 if sys.version_info >= (3, 11) else 0
+
+
+def _code_objects(co: types.CodeType) -> typing.Iterator[types.CodeType]:
+    todo = [co]
+    while todo:
+        co = todo.pop()
+        yield co
+        todo.extend(c for c in reversed(co.co_consts) if isinstance(c, types.CodeType))
+
+
+def code_key(co: types.CodeType) -> str:
+    """
+    Return the cache key for the module code *co*, this only
+    depends on the information used by :func:`scan_global_reads`.
+    """
+    h = hashlib.sha256()
+    h.update(importlib.util.MAGIC_NUMBER)
+    for c in _code_objects(co):
+        h.update(b"%d\0" % (len(c.co_code),))
+        h.update(c.co_code)
+        h.update("\0".join(c.co_names).encode("utf-8", "surrogatepass"))
+        h.update(b"\1")
+    return h.hexdigest()
+
+
+def scan_global_reads(co: types.CodeType) -> typing.Set[str]:
+    """
+    Return the global names read by *co* and
+    the code objects nested in it.
+    """
+    # This walks the wordcode instead of using dis.get_instructions,
+    # which is a lot slower because it also calculates information
+    # (line numbers, jump targets) that isn't needed here.
+    names = set()
+    for c in _code_objects(co):
+        code = c.co_code
+        co_names = c.co_names
+        extended = 0
+        for i in range(0, len(code), 2):
+            op = code[i]
+            arg = code[i + 1] | extended
+            if op == _EXTENDED_ARG:
+                extended = arg << 8
+                continue
+            extended = 0
+
+            if op == _LOAD_NAME:
+                names.add(co_names[arg])
+            elif op == _LOAD_GLOBAL:
+                names.add(co_names[arg >> _LOAD_GLOBAL_SHIFT])
+    return names
+
+
+def _scan_marshalled(data: bytes) -> typing.List[str]:
+    # Code objects cannot be pickled, worker processes
+    # get the marshalled code instead.
+    return sorted(scan_global_reads(marshal.loads(data)))
+
+
+class GlobalNamesCache:
+    """
+    The global names read by modules, stored in *cache_file*
+    between builds. Modules are scanned on a pool of *max_workers*
+    processes, or in this process when *max_workers* is None.
+    """
+
+    def __init__(
+        self,
+        cache_file: typing.Optional[str] = None,
+        max_workers: typing.Optional[int] = None,
+    ):
+        self.cache_file = cache_file
+        self.max_workers = max_workers
+        self.hits = 0
+        self.misses = 0
+
+        self._previous = self._load()
+        self._entries: typing.Dict[str, typing.FrozenSet[str]] = {}
+
+    def _load(self) -> typing.Dict[str, typing.List[str]]:
+        if self.cache_file is None:
+            return {}
+
+        try:
+            with open(self.cache_file) as stream:
+                data = json.load(stream)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return {}
+        return data["entries"]
+
+    def save(self) -> None:
+        """
+        Store the entries used in this build in *cache_file*
+        """
+        if self.cache_file is None:
+            return
+
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmpname = self.cache_file + ".tmp"
+        with open(tmpname, "w") as stream:
+            json.dump(
+                {
+                    "version": CACHE_VERSION,
+                    "entries": {
+                        key: sorted(names) for key, names in self._entries.items()
+                    },
+                },
+                stream,
+            )
+        os.replace(tmpname, self.cache_file)
+
+    def global_reads(
+        self, codes: typing.Mapping[str, types.CodeType]
+    ) -> typing.Dict[str, typing.FrozenSet[str]]:
+        """
+        Return the global names read by the module code in
+        *codes*, which maps module names to code objects.
+        """
+        result = {}
+        todo: typing.Dict[str, typing.List[str]] = {}
+        todo_code: typing.Dict[str, types.CodeType] = {}
+
+        for name, co in codes.items():
+            key = code_key(co)
+            names = self._entries.get(key)
+            if names is None and key not in todo:
+                cached = self._previous.get(key)
+                if cached is not None:
+                    names = self._entries[key] = frozenset(cached)
+                    self.hits += 1
+
+            if names is not None:
+                result[name] = names
+            else:
+                todo.setdefault(key, []).append(name)
+                todo_code[key] = co
+
+        if not todo:
+            return result
+
+        self.misses += len(todo)
+        keys = list(todo)
+        if (
+            self.max_workers is not None
+            and self.max_workers > 1
+            and len(keys) >= MIN_PARALLEL_SCAN
+        ):
+            from py2app.util import process_pool
+
+            with process_pool(self.max_workers) as executor:
+                scanned = executor.map(
+                    _scan_marshalled,
+                    [marshal.dumps(todo_code[key]) for key in keys],
+                    chunksize=16,
+                )
+                scanned = [frozenset(names) for names in scanned]
+        else:
+            scanned = [frozenset(scan_global_reads(todo_code[key])) for key in keys]
+
+        for key, names in zip(keys, scanned):
+            self._entries[key] = names
+            for name in todo[key]:
+                result[name] = names
+
+        return result
+
+    def report(self) -> str:
+        return f"global names cache: {self.hits} hits, {self.misses} misses"
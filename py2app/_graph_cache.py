@@ -0,0 +1,469 @@
+"""
+Persistent cache for the module dependency graph
+
+The graph is saved after running the recipes, together with
+a fingerprint for every file that contributed to it and the
+results of the recipes. When the cache is loaded only the nodes
+whose files changed and the modules that import them are
+scanned again, the rest of the graph is reused as is.
+
+Recipes also look at installed distributions in ways that are not
+covered by the files in the graph (data files, plugins, versions),
+the recorded recipe results are only reused when the graph didn't
+change and the distributions on the search path are the same.
+"""
+import ast
+import copyreg
+import hashlib
+import marshal
+import os
+import pickle
+import sys
+import tempfile
+import types
+import typing
+
+import modulegraph as modulegraph_pkg
+from modulegraph import modulegraph, zipio
+from modulegraph.find_modules import find_needed_modules, get_implies, plat_prepare
+
+import py2app
+from py2app._pkg_meta import _dist_info_stamp
+
+# Increase this when the layout of the cache file changes
+FORMAT_VERSION = 3
+
+# (st_mtime_ns, st_size, sha256 hexdigest)
+Fingerprint = typing.Tuple[int, int, str]
+
+
+def _reduce_code(co):
+    return marshal.loads, (marshal.dumps(co),)
+
+
+class _Pickler(pickle.Pickler):
+    # Code objects cannot be pickled by default, but can
+    # be serialized using marshal.
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[types.CodeType] = _reduce_code
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as stream:
+        while True:
+            data = stream.read(1024 * 1024)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+def _existing_file(filename: str) -> typing.Optional[str]:
+    """
+    Return the file in the filesystem that contains *filename*,
+    that is *filename* itself or the zipfile containing it.
+    """
+    path = filename
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+    if not os.path.isfile(path):
+        return None
+    return path
+
+
+def _dir_mtime(path: str) -> typing.Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _module_names(dirname: str) -> typing.Iterator[str]:
+    """
+    Yield the names of modules and packages that might be
+    located in *dirname*.
+    """
+    try:
+        entries = list(os.scandir(dirname))
+    except OSError:
+        return
+
+    for entry in entries:
+        if entry.is_dir():
+            name = entry.name
+        else:
+            name = entry.name.split(".", 1)[0]
+        if name.isidentifier():
+            yield name
+
+
+def _distributions_state(path: typing.Sequence[str]) -> list:
+    """
+    Return the stamps of the distributions installed in
+    the directories on *path*.
+    """
+    state = []
+    for dirname in path:
+        try:
+            names = sorted(os.listdir(dirname))
+        except OSError:
+            continue
+        for nm in names:
+            if nm.endswith((".dist-info", ".egg-info", ".egg-link")):
+                dist_info_path = os.path.join(dirname, nm)
+                state.append((dist_info_path, _dist_info_stamp(dist_info_path)))
+    return state
+
+
+def _initial_lazynodes(includes, excludes) -> dict:
+    """
+    Return the lazy nodes of a new graph, mirrors the setup
+    done by ``modulegraph.find_modules.find_modules``.
+    """
+    includes = set(includes)
+    excludes = set(excludes)
+    plat_prepare(includes, set(), excludes)
+
+    lazynodes = dict(get_implies())
+    for name in excludes - includes:
+        lazynodes[name] = None
+    return lazynodes
+
+
+def _forget_nodes(mf: modulegraph.ModuleGraph, idents: typing.Set[str]) -> None:
+    """
+    Remove nodes from the graph.
+
+    ``ModuleGraph.removeNode`` only hides nodes, and adding a
+    node with the same identifier later on restores the hidden
+    node including its edges. That's not wanted here.
+    """
+    graph = mf.graph
+    for ident in idents:
+        if ident not in graph.nodes:
+            continue
+        graph.hide_node(ident)
+        _data, edges = graph.hidden_nodes.pop(ident)
+        for edge in edges:
+            del graph.hidden_edges[edge]
+
+    # Edges of nodes that were hidden earlier still refer
+    # to the removed nodes.
+    stale = {
+        edge
+        for edge, (head, tail, _data) in graph.hidden_edges.items()
+        if head in idents or tail in idents
+    }
+    if stale:
+        for edge in stale:
+            del graph.hidden_edges[edge]
+        for ident, (data, edges) in list(graph.hidden_nodes.items()):
+            graph.hidden_nodes[ident] = (
+                data,
+                [edge for edge in edges if edge not in stale],
+            )
+
+
+def _rescan_node(mf: modulegraph.ModuleGraph, node, lazynodes: dict) -> None:
+    """
+    Scan the imports of *node* again, using the source code
+    when that is available.
+    """
+    code = None
+    filename = node.filename
+    if filename and filename.endswith((".py", ".pyw")):
+        try:
+            with zipio.open(filename, "rb") as stream:
+                source = stream.read() + b"\n"
+            code = compile(source, filename, "exec", ast.PyCF_ONLY_AST, True)
+        except (OSError, SyntaxError, ValueError):
+            code = None
+
+    if code is None:
+        code = node.code
+
+    if code is not None:
+        mf._scan_code(code, node)
+
+    deps = lazynodes.get(node.identifier)
+    if isinstance(deps, (list, tuple)):
+        for dep in deps:
+            mf.implyNodeReference(node, dep)
+
+
+class GraphCache:
+    def __init__(self, path: str, key: typing.Any):
+        self.path = path
+
+        key = (
+            sys.version,
+            sys.executable,
+            py2app.__version__,
+            getattr(modulegraph_pkg, "__version__", None),
+            key,
+        )
+        self.key = hashlib.sha256(repr(key).encode()).hexdigest()
+
+        self._files: typing.Dict[str, Fingerprint] = {}
+
+        self.nodes_total = 0
+        self.nodes_reused = 0
+        self.nodes_rescanned = 0
+        self.recipes_reused = False
+
+    def _same_file(self, path: str, fingerprint: Fingerprint) -> bool:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+
+        if (st.st_mtime_ns, st.st_size) == fingerprint[:2]:
+            return True
+
+        if st.st_size != fingerprint[1]:
+            return False
+
+        try:
+            digest = _hash_file(path)
+        except OSError:
+            return False
+
+        if digest != fingerprint[2]:
+            return False
+
+        # The file was touched but not changed, remember the
+        # new timestamp to avoid hashing it again next time.
+        self._files[path] = (st.st_mtime_ns, st.st_size, digest)
+        return True
+
+    def _fingerprint(self, path: str) -> typing.Optional[Fingerprint]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        previous = self._files.get(path)
+        if previous is not None and previous[:2] == (st.st_mtime_ns, st.st_size):
+            return previous
+
+        try:
+            return (st.st_mtime_ns, st.st_size, _hash_file(path))
+        except OSError:
+            return None
+
+    def load(
+        self, scripts, includes, packages, excludes
+    ) -> typing.Tuple[typing.Optional[modulegraph.ModuleGraph], typing.Optional[list]]:
+        """
+        Load the cached graph and bring it up to date.
+
+        Returns the graph and the recorded recipe results. The
+        graph is None when there is no usable cache, the recipe
+        results are None when the recipes must be run again
+        because the graph or the installed distributions changed.
+        """
+        try:
+            with open(self.path, "rb") as stream:
+                # The header is stored separately to avoid loading
+                # the graph when the cache is for a different
+                # configuration.
+                if pickle.load(stream) != (FORMAT_VERSION, self.key):
+                    return None, None
+                data = pickle.load(stream)
+        except Exception:
+            return None, None
+
+        mf = data["graph"]
+        self._files = data["files"]
+        if mf.path == sys.path:
+            mf.path = sys.path
+
+        loaded = sum(1 for _ in mf.nodes())
+        changed = self._update_graph(
+            mf,
+            data["node_files"],
+            data["dirs"],
+            scripts,
+            includes,
+            packages,
+            _initial_lazynodes(includes, excludes),
+        )
+        self.nodes_total = sum(1 for _ in mf.nodes())
+        self.nodes_reused = loaded - changed
+
+        if changed or data["distributions"] != _distributions_state(mf.path):
+            return mf, None
+        self.recipes_reused = data["recipes"] is not None
+        return mf, data["recipes"]
+
+    def _update_graph(
+        self, mf, node_files, dirs, scripts, includes, packages, lazynodes
+    ) -> int:
+        """
+        Remove invalidated nodes from the graph and scan their
+        importers again, returns the number of nodes removed.
+        """
+        changed_files = {
+            path
+            for path, fingerprint in list(self._files.items())
+            if not self._same_file(path, fingerprint)
+        }
+
+        invalid = {ident for ident, path in node_files.items() if path in changed_files}
+
+        for dirname, (mtime, prefixes) in dirs.items():
+            if _dir_mtime(dirname) == mtime:
+                continue
+
+            # Modules were added to or removed from this directory,
+            # those can shadow modules found elsewhere or resolve
+            # imports that were missing.
+            prefix = os.path.join(dirname, "")
+            for name in _module_names(dirname):
+                for pkg in prefixes:
+                    ident = pkg + name
+                    if ident not in mf.graph.nodes:
+                        continue
+                    node = mf.graph.node_data(ident)
+                    filename = getattr(node, "filename", None)
+                    if isinstance(node, modulegraph.MissingModule) or not (
+                        filename and filename.startswith(prefix)
+                    ):
+                        invalid.add(ident)
+
+        if any(path in changed_files for path in mf.path):
+            for node in mf.nodes():
+                if isinstance(node, modulegraph.MissingModule):
+                    invalid.add(node.identifier)
+
+        if not invalid:
+            return 0
+
+        # Submodules refer to their parent package, replace
+        # them together with the package.
+        submodule_prefixes = tuple(ident + "." for ident in invalid)
+        for node in mf.nodes():
+            if node.identifier.startswith(submodule_prefixes):
+                invalid.add(node.identifier)
+
+        reachable = {node.identifier for node in mf.flatten() if node is not None}
+
+        importers = set()
+        for ident in invalid:
+            if ident not in mf.graph.nodes:
+                continue
+            for node in mf.getReferers(mf.graph.node_data(ident)):
+                if (
+                    isinstance(node, modulegraph.Node)
+                    and node.identifier not in invalid
+                ):
+                    importers.add(node)
+
+        _forget_nodes(mf, invalid)
+
+        nspackages = None
+        for ident in invalid:
+            if ident in lazynodes:
+                mf.lazynodes[ident] = lazynodes[ident]
+            else:
+                if nspackages is None:
+                    nspackages = mf._calc_setuptools_nspackages()
+                if ident in nspackages:
+                    mf.nspackages[ident] = nspackages[ident]
+
+        for node in sorted(importers, key=lambda n: n.identifier):
+            _rescan_node(mf, node, lazynodes)
+        self.nodes_rescanned = len(importers)
+
+        for path in scripts:
+            if path not in mf.graph.nodes:
+                mf.run_script(path)
+        find_needed_modules(mf, includes=includes, packages=packages)
+
+        # Nodes that are no longer reachable were only used
+        # by the old version of invalidated modules.
+        orphans = reachable - {
+            node.identifier for node in mf.flatten() if node is not None
+        }
+        _forget_nodes(mf, orphans)
+
+        return len(invalid) + len(orphans - invalid)
+
+    def save(self, mf: modulegraph.ModuleGraph, recipe_results: list) -> None:
+        """
+        Save *mf* and the recipe results to the cache
+        """
+        node_files = {}
+        files = {}
+        dirs = {}
+
+        for dirname in mf.path:
+            if os.path.isdir(dirname):
+                dirs.setdefault(dirname, (_dir_mtime(dirname), []))[1].append("")
+
+        for node in mf.nodes():
+            filename = getattr(node, "filename", None)
+            if filename and filename != "-":
+                path = _existing_file(filename)
+                if path is not None:
+                    if path not in files:
+                        fingerprint = self._fingerprint(path)
+                        if fingerprint is None:
+                            continue
+                        files[path] = fingerprint
+                    node_files[node.identifier] = path
+
+            for dirname in getattr(node, "packagepath", None) or ():
+                if os.path.isdir(dirname):
+                    dirs.setdefault(dirname, (_dir_mtime(dirname), []))[1].append(
+                        node.identifier + "."
+                    )
+
+        for dirname in mf.path:
+            if os.path.isfile(dirname) and dirname not in files:
+                fingerprint = self._fingerprint(dirname)
+                if fingerprint is not None:
+                    files[dirname] = fingerprint
+
+        data = {
+            "graph": mf,
+            "files": files,
+            "node_files": node_files,
+            "dirs": dirs,
+            "recipes": recipe_results,
+            "distributions": _distributions_state(mf.path),
+        }
+
+        dirname = os.path.dirname(self.path)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as stream:
+                pickle.dump((FORMAT_VERSION, self.key), stream)
+                start = stream.tell()
+                try:
+                    _Pickler(stream, pickle.HIGHEST_PROTOCOL).dump(data)
+                except (pickle.PicklingError, TypeError, AttributeError):
+                    # Recipe results can contain arbitrary objects,
+                    # the recipes will be run again when those
+                    # cannot be saved.
+                    stream.seek(start)
+                    stream.truncate()
+                    data["recipes"] = None
+                    _Pickler(stream, pickle.HIGHEST_PROTOCOL).dump(data)
+            os.replace(tmpname, self.path)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+
+    def report(self) -> str:
+        return (
+            f"module graph cache: reused {self.nodes_reused} of "
+            f"{self.nodes_total} nodes, rescanned {self.nodes_rescanned} importers, "
+            f"recipes {'replayed' if self.recipes_reused else 'run'}"
+        )
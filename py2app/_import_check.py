@@ -0,0 +1,366 @@
+"""
+Checking names that modulegraph reports as missing
+
+Modulegraph reports a name as missing when it cannot find a module
+for it, which is also the case for names that are attributes of a
+module (``from package import function``) and for modules that are
+added to ``sys.modules`` at runtime. The report of missing modules
+used to import every missing name in the py2app process to tell those
+cases apart, which runs arbitrary package code in the build.
+
+``ImportChecker`` first resolves names without importing anything:
+using ``find_spec`` for the parent package and by looking for
+the name in the source code of the parent module. Names that cannot
+be resolved that way are imported in a subprocess with a timeout,
+the results of those imports are stored in a cache file that is
+only used as long as the Python environment doesn't change.
+"""
+import ast
+import hashlib
+import importlib.machinery
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import types
+import typing
+
+CACHE_VERSION = 1
+
+# Seconds before giving up on importing a name
+DEFAULT_TIMEOUT = 60
+
+# Results of checking a name
+MISSING = "missing"
+MODULE = "module"
+ATTRIBUTE = "attribute"
+
+_RESULT_MARKER = "py2app-import-check:"
+
+_WORKER_SCRIPT = f"""\
+import json, os, sys, types
+data = json.load(sys.stdin)
+sys.path[:] = data["path"]
+name = data["name"]
+try:
+    if "." in name:
+        m1, m2 = name.rsplit(".", 1)
+        o = getattr(__import__(m1, fromlist=[m2]), m2)
+    else:
+        o = __import__(name)
+except BaseException:
+    result = {MISSING!r}
+else:
+    result = {MODULE!r} if isinstance(o, types.ModuleType) else {ATTRIBUTE!r}
+sys.stdout.write("\\n{_RESULT_MARKER}" + result + "\\n")
+sys.stdout.flush()
+os._exit(0)
+"""
+
+# Module source that can add attributes in ways that
+# cannot be detected statically.
+_DYNAMIC_MARKERS = ("__getattr__", "sys.modules", "globals()", "setattr(", "import *")
+
+
+class _Unknown(Exception):
+    pass
+
+
+def environment_fingerprint(path: typing.Sequence[str]) -> str:
+    """
+    Return a value that changes when the interpreter or the
+    directories on *path* change, such as when installing or
+    removing distributions.
+    """
+    h = hashlib.sha256()
+    h.update(sys.executable.encode("utf-8", "surrogateescape"))
+    h.update(sys.version.encode())
+    for dirname in path:
+        h.update(b"\0")
+        h.update(dirname.encode("utf-8", "surrogateescape"))
+        try:
+            st = os.stat(dirname or os.curdir)
+        except OSError:
+            continue
+        h.update(b"%d" % (st.st_mtime_ns,))
+    return h.hexdigest()
+
+
+def _find_spec(name: str) -> typing.Optional[importlib.machinery.ModuleSpec]:
+    # Like importlib.util.find_spec, without importing parent packages
+    parts = name.split(".")
+    try:
+        spec = importlib.util.find_spec(parts[0])
+    except (ImportError, ValueError):
+        raise _Unknown(name) from None
+
+    for idx in range(1, len(parts)):
+        if spec is None:
+            return None
+        if spec.submodule_search_locations is None:
+            # Attribute of a module
+            raise _Unknown(name)
+        spec = importlib.machinery.PathFinder.find_spec(
+            ".".join(parts[: idx + 1]), list(spec.submodule_search_locations)
+        )
+    return spec
+
+
+def _module_bindings(source: str) -> typing.Dict[str, str]:
+    """
+    Return the names bound at module level in *source*, the value
+    is MODULE for names bound by ``import``, ATTRIBUTE for names
+    bound by definitions and assignments, and None for names bound
+    by ``from ... import`` (which can be either).
+    """
+    bindings = {}
+
+    def add_target(target):
+        if isinstance(target, ast.Name):
+            bindings.setdefault(target.id, ATTRIBUTE)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            for elt in target.elts:
+                add_target(elt)
+        elif isinstance(target, ast.Starred):
+            add_target(target.value)
+
+    todo = list(ast.parse(source).body)
+    while todo:
+        node = todo.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bindings.setdefault(node.name, ATTRIBUTE)
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                add_target(target)
+        elif isinstance(node, (ast.AnnAssign, ast.AugAssign)):
+            add_target(node.target)
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname is not None:
+                    bindings[alias.asname] = MODULE
+                else:
+                    bindings[alias.name.split(".")[0]] = MODULE
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                bindings[alias.asname or alias.name] = None
+        else:
+            # Statements with nested blocks, such as if, try,
+            # with and for statements at module level.
+            for field in ("body", "orelse", "finalbody", "handlers"):
+                todo.extend(getattr(node, field, ()))
+
+    return bindings
+
+
+def resolve_static(name: str) -> str:
+    """
+    Check *name* without importing any code, returns MISSING,
+    MODULE or ATTRIBUTE. Raises ``_Unknown`` when the name
+    cannot be checked without importing it.
+    """
+    parent, _, attr = name.rpartition(".")
+    if not parent:
+        if name in sys.modules:
+            return MODULE
+        return MISSING if _find_spec(name) is None else MODULE
+
+    if parent in sys.modules:
+        # Already imported by the build, checking this
+        # won't run any new code.
+        try:
+            value = getattr(sys.modules[parent], attr)
+        except Exception:
+            return MISSING
+        return MODULE if isinstance(value, types.ModuleType) else ATTRIBUTE
+
+    spec = _find_spec(parent)
+    if spec is None:
+        return MISSING
+
+    if spec.submodule_search_locations is not None:
+        if (
+            importlib.machinery.PathFinder.find_spec(
+                name, list(spec.submodule_search_locations)
+            )
+            is not None
+        ):
+            return MODULE
+
+        if spec.origin is None or not spec.has_location:
+            # Namespace package, only has submodules
+            return MISSING
+
+    if not (spec.has_location and spec.origin and spec.origin.endswith(".py")):
+        # Extension module, or a module without source code
+        raise _Unknown(name)
+
+    try:
+        with open(spec.origin, "rb") as stream:
+            source = stream.read().decode("utf-8", "surrogateescape")
+        bindings = _module_bindings(source)
+    except (OSError, SyntaxError, ValueError):
+        raise _Unknown(name) from None
+
+    if attr in bindings:
+        result = bindings[attr]
+        if result is None:
+            raise _Unknown(name)
+        return result
+
+    if any(marker in source for marker in _DYNAMIC_MARKERS):
+        raise _Unknown(name)
+    return MISSING
+
+
+def resolve_isolated(
+    name: str, path: typing.Sequence[str], timeout: float = DEFAULT_TIMEOUT
+) -> typing.Optional[str]:
+    """
+    Check *name* by importing it in a subprocess, returns None
+    when the subprocess didn't report a result in time.
+    """
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-c", _WORKER_SCRIPT],
+            input=json.dumps({"name": name, "path": list(path)}),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return None
+
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(_RESULT_MARKER):
+            return line[len(_RESULT_MARKER) :]
+    return None
+
+
+class ImportChecker:
+    """
+    Check names reported as missing by modulegraph, imports in
+    subprocesses are run on *max_workers* threads and their
+    results are stored in *cache_file*.
+    """
+
+    def __init__(
+        self,
+        cache_file: typing.Optional[str] = None,
+        max_workers: typing.Optional[int] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        path: typing.Optional[typing.Sequence[str]] = None,
+    ):
+        self.cache_file = cache_file
+        self.max_workers = max_workers or 1
+        self.timeout = timeout
+        self.path = list(sys.path if path is None else path)
+        self.fingerprint = environment_fingerprint(self.path)
+
+        self.static = 0
+        self.isolated = 0
+        self.cached = 0
+        self.failed: typing.List[str] = []
+
+        self._entries = self._load()
+
+    def _load(self) -> typing.Dict[str, str]:
+        if self.cache_file is None:
+            return {}
+
+        try:
+            with open(self.cache_file) as stream:
+                data = json.load(stream)
+        except (OSError, ValueError):
+            return {}
+
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != CACHE_VERSION
+            or data.get("fingerprint") != self.fingerprint
+        ):
+            return {}
+        return data["entries"]
+
+    def save(self) -> None:
+        """
+        Store the results of imports in *cache_file*
+        """
+        if self.cache_file is None:
+            return
+
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmpname = self.cache_file + ".tmp"
+        with open(tmpname, "w") as stream:
+            json.dump(
+                {
+                    "version": CACHE_VERSION,
+                    "fingerprint": self.fingerprint,
+                    "entries": self._entries,
+                },
+                stream,
+            )
+        os.replace(tmpname, self.cache_file)
+
+    def check(self, names: typing.Iterable[str]) -> typing.Dict[str, str]:
+        """
+        Return a mapping from the names in *names* to MISSING,
+        MODULE or ATTRIBUTE.
+        """
+        result = {}
+        todo = []
+        for name in names:
+            if name in result:
+                continue
+
+            try:
+                result[name] = resolve_static(name)
+            except _Unknown:
+                pass
+            else:
+                self.static += 1
+                continue
+
+            if name in self._entries:
+                result[name] = self._entries[name]
+                self.cached += 1
+            else:
+                todo.append(name)
+
+        if not todo:
+            return result
+
+        if self.max_workers > 1 and len(todo) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(self.max_workers) as executor:
+                isolated = list(
+                    executor.map(
+                        lambda name: resolve_isolated(name, self.path, self.timeout),
+                        todo,
+                    )
+                )
+        else:
+            isolated = [
+                resolve_isolated(name, self.path, self.timeout) for name in todo
+            ]
+
+        for name, value in zip(todo, isolated):
+            self.isolated += 1
+            if value is None:
+                # Not cached, the import is tried again in
+                # the next build.
+                self.failed.append(name)
+                value = MISSING
+            else:
+                self._entries[name] = value
+            result[name] = value
+
+        return result
+
+    def report(self) -> str:
+        return (
+            f"import check: {self.static} resolved statically, "
+            f"{self.isolated} imported in a subprocess, {self.cached} cached"
+        )
@@ -0,0 +1,455 @@
+"""
+Support code for writing the zipfile with Python modules
+
+``ParallelZipWriter`` compresses files on a pool of threads (zlib
+releases the GIL while compressing) while the compressed entries are
+appended to the archive in the order they were added. The result is
+identical to adding the same files using ``ZipFile.write``.
+
+``CompressionPolicy`` selects the compression method for every entry
+in the archive.
+
+``LibArchive`` combines the two and is used to add modules, package
+data and metadata to the archive while the bundle is built, without
+staging those files in a temporary directory first.
+"""
+import collections
+import fnmatch
+import os
+import posixpath
+import sys
+import time
+import typing
+import zipfile
+import zlib
+
+from modulegraph import zipio
+from modulegraph.modulegraph import DependencyInfo, Package, Script
+
+# Larger files are compressed by ``ZipFile.write`` on the
+# writer thread, this bounds the memory used for buffering
+# compressed entries.
+MAX_BUFFERED_SIZE = 16 * 1024 * 1024
+
+COMPRESSION_METHODS = {
+    "store": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+}
+
+COMPRESSION_PRESETS = ("deflate", "store", "startup-optimized")
+
+# Files with these suffixes are already compressed
+COMPRESSED_SUFFIXES = (
+    ".7z",
+    ".bz2",
+    ".egg",
+    ".gif",
+    ".gz",
+    ".jpeg",
+    ".jpg",
+    ".mp3",
+    ".mp4",
+    ".npz",
+    ".png",
+    ".whl",
+    ".xz",
+    ".zip",
+    ".zst",
+)
+
+# Deflating smaller files hardly saves space
+SMALL_FILE_SIZE = 512
+
+# Appending entries that were compressed on a worker thread uses
+# private attributes of ZipFile, and is only done for versions of
+# Python where those have been checked. Other versions compress
+# entries on the writer thread using the public API.
+PRECOMPRESSED_VERSIONS = ((3, 6), (3, 14))
+_ZIPFILE_INTERNALS = ("fp", "start_dir", "_writecheck", "_didModify", "_allowZip64")
+
+
+def parse_compression_rule(rule: str) -> typing.Tuple[str, int]:
+    """
+    Parse a rule of the form ``PATTERN=METHOD``, raises
+    ValueError for invalid rules.
+    """
+    pattern, sep, method = rule.rpartition("=")
+    if not sep or not pattern:
+        raise ValueError(f"invalid compression rule: {rule!r}")
+    try:
+        return pattern.strip(), COMPRESSION_METHODS[method.strip()]
+    except KeyError:
+        raise ValueError(f"invalid compression method in rule: {rule!r}") from None
+
+
+class CompressionPolicy:
+    """
+    Select the compression method for entries in the archive.
+
+    The *rules* are ``PATTERN=METHOD`` strings, where the pattern
+    is matched against the name of the entry in the archive and the
+    method is either ``store`` or ``deflate``. The first matching
+    rule is used, entries that don't match any rule use the *preset*:
+
+    - "deflate": Compress all entries
+    - "store": Don't compress any entries
+    - "startup-optimized": Store the modules in *startup_entries*,
+      small files and files that are already compressed; compress
+      all other entries.
+    """
+
+    def __init__(
+        self,
+        preset: str = "deflate",
+        rules: typing.Sequence[str] = (),
+        startup_entries: typing.Iterable[str] = (),
+    ):
+        if preset not in COMPRESSION_PRESETS:
+            raise ValueError(f"invalid compression preset: {preset!r}")
+        self.preset = preset
+        self.rules = [parse_compression_rule(rule) for rule in rules]
+        self.startup_entries = set(startup_entries)
+
+    def compression_for(self, arcname: str, size: int) -> int:
+        arcname = arcname.replace(os.sep, "/")
+        for pattern, method in self.rules:
+            if fnmatch.fnmatchcase(arcname, pattern):
+                return method
+
+        if self.preset == "store":
+            return zipfile.ZIP_STORED
+
+        elif self.preset == "startup-optimized":
+            if (
+                arcname in self.startup_entries
+                or size < SMALL_FILE_SIZE
+                or arcname.lower().endswith(COMPRESSED_SUFFIXES)
+            ):
+                return zipfile.ZIP_STORED
+
+        return zipfile.ZIP_DEFLATED
+
+
+def startup_entries(mf, scripts: typing.Iterable[str]) -> typing.Set[str]:
+    """
+    Return the archive names for the modules that are imported
+    unconditionally while the *scripts* start.
+
+    That's the set of modules reachable from the scripts through
+    imports that are not in a function, a conditional statement or
+    a try-except block.
+    """
+    todo = [mf.findNode(script) for script in scripts]
+    seen = set()
+    result = set()
+    while todo:
+        node = todo.pop()
+        if node is None or node.identifier in seen:
+            continue
+        seen.add(node.identifier)
+
+        if isinstance(node, Script):
+            # Scripts are not stored in the archive
+            pass
+        elif isinstance(node, Package):
+            result.add(node.identifier.replace(".", "/") + "/__init__.pyc")
+        else:
+            result.add(node.identifier.replace(".", "/") + ".pyc")
+
+        for other in mf.getReferences(node):
+            if other is None:
+                continue
+            info = mf.edgeData(node, other)
+            if isinstance(info, DependencyInfo) and (
+                info.conditional or info.function or info.tryexcept
+            ):
+                continue
+            todo.append(other)
+
+    return result
+
+
+def _compress(filename, level):
+    with open(filename, "rb") as stream:
+        return _compress_data(stream.read(), level)
+
+
+def _compress_data(data, level):
+    # Same settings as used by zipfile for ZIP_DEFLATED
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    return zlib.crc32(data), len(data), compressed
+
+
+def supports_precompressed(zf: zipfile.ZipFile) -> bool:
+    """
+    Return True if ParallelZipWriter can append entries compressed
+    on a worker thread to *zf*, which must be a seekable file.
+    """
+    return (
+        PRECOMPRESSED_VERSIONS[0] <= sys.version_info[:2] < PRECOMPRESSED_VERSIONS[1]
+        and all(hasattr(zf, name) for name in _ZIPFILE_INTERNALS)
+        and getattr(zf, "_seekable", False)
+    )
+
+
+class ParallelZipWriter:
+    def __init__(self, zf: zipfile.ZipFile, max_workers=None):
+        self.zf = zf
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+        level = getattr(zf, "compresslevel", None)
+        self._level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        self.precompressed = supports_precompressed(zf)
+
+        self._executor = None
+        self._pending = collections.deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            for _write, job in self._pending:
+                if job is not None:
+                    job[1].cancel()
+            self._pending.clear()
+            if self._executor is not None:
+                self._executor.shutdown()
+
+    def write(self, filename, arcname=None, compress_type=None):
+        """
+        Add *filename* to the archive, like ``ZipFile.write``
+        """
+        if compress_type is None:
+            compress_type = self.zf.compression
+
+        job = None
+        if (
+            compress_type == zipfile.ZIP_DEFLATED
+            and self.max_workers > 1
+            and self.precompressed
+            and os.path.isfile(filename)
+        ):
+            zinfo = zipfile.ZipInfo.from_file(filename, arcname)
+            if zinfo.file_size <= MAX_BUFFERED_SIZE:
+                job = (zinfo, self._submit(_compress, filename, self._level))
+
+        self._append(lambda: self.zf.write(filename, arcname, compress_type), job)
+
+    def writestr(self, zinfo, data, compress_type=None):
+        """
+        Add an entry with contents *data* to the archive, like
+        ``ZipFile.writestr`` with a ``ZipInfo`` argument.
+        """
+        if compress_type is None:
+            compress_type = self.zf.compression
+
+        job = None
+        if (
+            compress_type == zipfile.ZIP_DEFLATED
+            and self.max_workers > 1
+            and self.precompressed
+        ):
+            zinfo.file_size = len(data)
+            job = (zinfo, self._submit(_compress_data, data, self._level))
+
+        self._append(lambda: self.zf.writestr(zinfo, data, compress_type), job)
+
+    def _submit(self, function, *args):
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            self._executor = ThreadPoolExecutor(self.max_workers)
+        return self._executor.submit(function, *args)
+
+    def _append(self, write, job):
+        self._pending.append((write, job))
+
+        # Limit the number of compressed entries kept in memory
+        while len(self._pending) > 2 * self.max_workers:
+            self._write_next()
+
+    def close(self):
+        """
+        Write all pending entries to the archive, the
+        archive itself is not closed.
+        """
+        while self._pending:
+            self._write_next()
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _write_next(self):
+        write, job = self._pending.popleft()
+        if job is None:
+            write()
+        else:
+            zinfo, future = job
+            self._write_compressed(zinfo, *future.result())
+
+    def _write_compressed(self, zinfo, crc, file_size, data):
+        # This mirrors ZipFile._open_to_write and _ZipWriteFile.close,
+        # and results in the same output.
+        zf = self.zf
+
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.flag_bits = 0x00
+        if not zinfo.external_attr:
+            zinfo.external_attr = 0o600 << 16
+
+        zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        if zip64 and not zf._allowZip64:
+            raise zipfile.LargeZipFile("Filesize would require ZIP64 extensions")
+
+        zinfo.CRC = crc
+        zinfo.file_size = file_size
+        zinfo.compress_size = len(data)
+
+        zf.fp.seek(zf.start_dir)
+        zinfo.header_offset = zf.fp.tell()
+
+        zf._writecheck(zinfo)
+        zf._didModify = True
+
+        zf.fp.write(zinfo.FileHeader(zip64))
+        zf.fp.write(data)
+        zf.start_dir = zf.fp.tell()
+
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+
+
+def _date_time(mtime):
+    # The zip format cannot represent timestamps before 1980
+    return max(time.localtime(mtime)[:6], (1980, 1, 1, 0, 0, 0))
+
+
+class LibArchive:
+    """
+    The zipfile with Python modules, entries are compressed as
+    selected by *policy* using a pool of *max_workers* threads.
+
+    Every name is added once, later entries with the name of an
+    entry that was already added are skipped and recorded in
+    ``skipped``.
+
+    A directory entry is added for every directory that contains
+    files. This is a workaround for <http://bugs.python.org/issue14905>:
+    zipimport won't consider 'pkg/foo.py' to be in namespace package
+    'pkg' unless there is an entry for the directory (or there is a
+    pkg/__init__.py file as well).
+    """
+
+    def __init__(self, path: str, policy: CompressionPolicy, max_workers=None):
+        if policy.preset == "store":
+            compression = zipfile.ZIP_STORED
+        else:
+            compression = zipfile.ZIP_DEFLATED
+
+        self.policy = policy
+        self.zf = zipfile.ZipFile(path, "w", compression=compression)
+        self.writer = ParallelZipWriter(self.zf, max_workers)
+        self._dirs = set()
+        self._names = set()
+        self.skipped: typing.List[str] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.writer.__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.zf.close()
+
+    def close(self):
+        self.writer.close()
+        self.zf.close()
+
+    def _add_directory(self, arcname: str, mtime: float) -> None:
+        dirname = posixpath.dirname(arcname)
+        if not dirname or dirname in self._dirs:
+            return
+        self._dirs.add(dirname)
+
+        zinfo = zipfile.ZipInfo(dirname + "/", _date_time(mtime))
+        zinfo.external_attr = (0o40775 << 16) | 0x10
+        self.writer.writestr(zinfo, b"", zipfile.ZIP_STORED)
+
+    def _is_new(self, arcname: str) -> bool:
+        if arcname in self._names:
+            self.skipped.append(arcname)
+            return False
+        self._names.add(arcname)
+        return True
+
+    def add_bytes(self, arcname: str, data: bytes, mtime: float) -> None:
+        """
+        Add an entry named *arcname* with contents *data*
+        """
+        arcname = arcname.replace(os.sep, "/")
+        if not self._is_new(arcname):
+            return
+        self._add_directory(arcname, mtime)
+
+        zinfo = zipfile.ZipInfo(arcname, _date_time(mtime))
+        zinfo.external_attr = 0o100644 << 16
+        self.writer.writestr(
+            zinfo, data, self.policy.compression_for(arcname, len(data))
+        )
+
+    def add_file(self, filename: str, arcname: str) -> None:
+        """
+        Add *filename* as *arcname*, *filename* can
+        be located in a zipfile.
+        """
+        arcname = arcname.replace(os.sep, "/")
+        if not os.path.isfile(filename):
+            if arcname in self._names:
+                self.skipped.append(arcname)
+                return
+            with zipio.open(filename, "rb") as stream:
+                data = stream.read()
+            self.add_bytes(arcname, data, zipio.getmtime(filename))
+            return
+
+        if not self._is_new(arcname):
+            return
+        st = os.stat(filename)
+        self._add_directory(arcname, st.st_mtime)
+        self.writer.write(
+            filename, arcname, self.policy.compression_for(arcname, st.st_size)
+        )
+
+    def add_tree(
+        self,
+        dirname: str,
+        arcname: str,
+        condition: typing.Optional[typing.Callable[[str], bool]] = None,
+    ) -> None:
+        """
+        Add the files in directory *dirname* (which can be located
+        in a zipfile) below *arcname*, symbolic links are followed.
+        Files and directories are skipped when *condition* returns
+        false for their path.
+        """
+        for fn in sorted(zipio.listdir(dirname)):
+            path = os.path.join(dirname, fn)
+            if condition is not None and not condition(path):
+                continue
+
+            if os.path.islink(path) and not os.path.exists(path):
+                # Dead symlink
+                continue
+
+            if zipio.isdir(path) and not os.path.isfile(path):
+                # ^^^ a resource file that happens to be a zipfile
+                # is added as is.
+                self.add_tree(path, posixpath.join(arcname, fn), condition)
+            else:
+                self.add_file(path, posixpath.join(arcname, fn))
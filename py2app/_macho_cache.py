@@ -0,0 +1,329 @@
+"""
+Persistent cache for the metadata of Mach-O files
+
+The macholib phase of a build, and stripping and signing the bundle,
+look at the load commands of every dylib and extension, often more
+than once per build. This module stores the information those phases
+need (the architectures, install name, rpaths, linked libraries and
+the number of local symbols) in a cache file.
+
+Entries are keyed by a hash of the Mach-O headers and load commands,
+which contain all of the information in an entry. Computing the hash
+only reads the start of every architecture in the file, and is only
+done again when the size or modification time of a path has changed
+since it was last seen. Files are therefore only parsed when their
+load commands are new, even when they are copied to another path.
+"""
+import functools
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import typing
+
+from macholib.mach_o import (
+    FAT_MAGIC,
+    FAT_MAGIC_64,
+    LC_DYSYMTAB,
+    LC_ID_DYLIB,
+    LC_RPATH,
+    MH_CIGAM,
+    MH_CIGAM_64,
+    MH_MAGIC,
+    MH_MAGIC_64,
+)
+from macholib.MachO import MachO
+from macholib.ptypes import sizeof
+
+CACHE_VERSION = 2
+
+
+class HeaderInfo(typing.NamedTuple):
+    """
+    The information about one architecture in a Mach-O file
+    """
+
+    cputype: int
+    cpusubtype: int
+    filetype: str
+    install_name: typing.Optional[str]
+    rpaths: typing.List[str]
+    relocatables: typing.List[typing.Tuple[str, str]]
+    nlocalsym: typing.Optional[int]
+
+    def walkRelocatables(self):
+        """
+        Same interface as macholib.MachO.MachOHeader.walkRelocatables,
+        the index is not the index of the load command.
+        """
+        for idx, (kind, name) in enumerate(self.relocatables):
+            yield idx, kind, name
+
+
+def _lc_str(lc, cmd, offset, data):
+    ofs = offset - sizeof(lc.__class__) - sizeof(cmd.__class__)
+    return data[ofs : data.find(b"\x00", ofs)].decode(sys.getfilesystemencoding())
+
+
+def read_headers(path: str) -> typing.Optional[typing.List[HeaderInfo]]:
+    """
+    Parse the Mach-O file *path*, returns None when
+    the file is not a Mach-O file.
+    """
+    try:
+        macho = MachO(path)
+    except (OSError, ValueError):
+        return None
+
+    result = []
+    for header in macho.headers:
+        install_name = None
+        nlocalsym = None
+        rpaths = []
+        for lc, cmd, data in header.commands:
+            if lc.cmd == LC_DYSYMTAB:
+                nlocalsym = cmd.nlocalsym
+            elif lc.cmd == LC_RPATH:
+                rpaths.append(_lc_str(lc, cmd, cmd.path, data))
+            elif lc.cmd == LC_ID_DYLIB:
+                install_name = _lc_str(lc, cmd, cmd.name, data)
+
+        result.append(
+            HeaderInfo(
+                int(header.header.cputype),
+                int(header.header.cpusubtype),
+                header.filetype,
+                install_name,
+                rpaths,
+                [(kind, name) for _idx, kind, name in header.walkRelocatables()],
+                nlocalsym,
+            )
+        )
+    return result
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for chunk in iter(functools.partial(stream.read, 1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _update_slice_digest(digest, stream, offset: int, size: int) -> None:
+    # Add the mach header and load commands of the
+    # architecture at *offset* to *digest*.
+    stream.seek(offset)
+    header = stream.read(32)
+    digest.update(header)
+    if len(header) < 28:
+        return
+
+    (magic,) = struct.unpack(">I", header[:4])
+    if magic in (MH_MAGIC, MH_MAGIC_64):
+        endian = ">"
+    elif magic in (MH_CIGAM, MH_CIGAM_64):
+        endian = "<"
+    else:
+        return
+
+    (sizeofcmds,) = struct.unpack_from(endian + "I", header, 20)
+    stream.seek(offset + (32 if magic in (MH_MAGIC_64, MH_CIGAM_64) else 28))
+    digest.update(stream.read(min(sizeofcmds, size)))
+
+
+def _header_digest(path: str) -> str:
+    """
+    Return a hash of the parts of *path* that :func:`read_headers`
+    looks at: the fat header and the mach header and load commands
+    of every architecture. For other files the hash covers the first
+    few bytes of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        size = os.fstat(stream.fileno()).st_size
+        data = stream.read(8)
+        digest.update(data)
+        if len(data) < 8:
+            return digest.hexdigest()
+
+        magic, nfat_arch = struct.unpack(">II", data)
+        if magic in (FAT_MAGIC, FAT_MAGIC_64):
+            entsize = 20 if magic == FAT_MAGIC else 32
+            table = stream.read(min(nfat_arch * entsize, size))
+            digest.update(table)
+            for idx in range(0, len(table) - entsize + 1, entsize):
+                if magic == FAT_MAGIC:
+                    (offset,) = struct.unpack_from(">I", table, idx + 8)
+                else:
+                    (offset,) = struct.unpack_from(">Q", table, idx + 8)
+                _update_slice_digest(digest, stream, offset, size)
+        else:
+            _update_slice_digest(digest, stream, 0, size)
+
+    return digest.hexdigest()
+
+
+class MachOCache:
+    """
+    The headers of Mach-O files, stored in *cache_file* between
+    builds. The cache can be used from multiple threads.
+    """
+
+    def __init__(self, cache_file: typing.Optional[str] = None):
+        self.cache_file = cache_file
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        previous = self._load()
+        self._previous_paths: typing.Dict[str, list] = previous["paths"]
+        self._previous_files: typing.Dict[str, typing.Optional[list]] = previous[
+            "files"
+        ]
+        self._paths: typing.Dict[str, list] = {}
+        self._files: typing.Dict[str, typing.Optional[typing.List[HeaderInfo]]] = {}
+
+    def _load(self) -> dict:
+        empty: dict = {"paths": {}, "files": {}}
+        if self.cache_file is None:
+            return empty
+
+        try:
+            with open(self.cache_file) as stream:
+                data = json.load(stream)
+        except (OSError, ValueError):
+            return empty
+
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return empty
+        return data
+
+    def save(self) -> None:
+        """
+        Store the entries used in this build in *cache_file*
+        """
+        if self.cache_file is None:
+            return
+
+        with self._lock:
+            paths = dict(self._paths)
+            files = {
+                key: None if headers is None else [list(h) for h in headers]
+                for key, headers in self._files.items()
+            }
+
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmpname = self.cache_file + ".tmp"
+        with open(tmpname, "w") as stream:
+            json.dump(
+                {"version": CACHE_VERSION, "paths": paths, "files": files}, stream
+            )
+        os.replace(tmpname, self.cache_file)
+
+    def _digest(self, path: str) -> str:
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        with self._lock:
+            entry = self._paths.get(path) or self._previous_paths.get(path)
+        if entry is not None and entry[:2] == stamp:
+            digest = entry[2]
+        else:
+            digest = _header_digest(path)
+
+        with self._lock:
+            self._paths[path] = stamp + [digest]
+        return digest
+
+    def headers(self, path: str) -> typing.Optional[typing.List[HeaderInfo]]:
+        """
+        Return the headers of the Mach-O file *path*, or
+        None when it is not a Mach-O file.
+        """
+        path = os.path.realpath(path)
+        try:
+            digest = self._digest(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            if digest in self._files:
+                self.hits += 1
+                return self._files[digest]
+
+            if digest in self._previous_files:
+                self.hits += 1
+                cached = self._previous_files[digest]
+                headers = self._files[digest] = (
+                    None
+                    if cached is None
+                    else [
+                        HeaderInfo(
+                            *values[:5], [tuple(r) for r in values[5]], values[6]
+                        )
+                        for values in cached
+                    ]
+                )
+                return headers
+
+        headers = read_headers(path)
+        with self._lock:
+            self.misses += 1
+            self._files[digest] = headers
+        return headers
+
+    def report(self) -> str:
+        return f"Mach-O cache: {self.hits} hits, {self.misses} misses"
+
+
+class CachedMachO:
+    """
+    Stand-in for macholib.MachO.MachO in a MachOGraph that
+    uses the headers in *cache*. The file is only parsed when
+    its load commands need to be rewritten.
+    """
+
+    def __init__(self, filename: str, cache: MachOCache):
+        # supports the ObjectGraph protocol
+        self.graphident = filename
+        self.filename = filename
+        self.loader_path = os.path.dirname(filename)
+
+        headers = cache.headers(filename)
+        if headers is None:
+            raise ValueError(f"{filename!r} is not a Mach-O file")
+        self.headers = headers
+        self._macho: typing.Optional[MachO] = None
+
+    def __repr__(self):
+        return f"<CachedMachO filename={self.filename!r}>"
+
+    def rewriteLoadCommands(self, changefunc) -> bool:
+        """
+        Same as macholib.MachO.MachO.rewriteLoadCommands, the
+        load commands change when *changefunc* returns a value
+        for the install name or for one of the linked libraries.
+        """
+        if self._macho is None:
+            for header in self.headers:
+                if header.install_name is not None:
+                    if changefunc(self.filename) is not None:
+                        break
+                if any(
+                    changefunc(name) is not None
+                    for _idx, _kind, name in header.walkRelocatables()
+                ):
+                    break
+            else:
+                return False
+
+            self._macho = MachO(self.filename)
+            self._macho.loader_path = self.loader_path
+
+        return self._macho.rewriteLoadCommands(changefunc)
+
+    def write(self, fileobj) -> None:
+        assert self._macho is not None
+        self._macho.write(fileobj)
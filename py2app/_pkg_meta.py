@@ -1,3 +1,4 @@
+import json
 import os
 import typing
 
@@ -10,6 +11,179 @@ InfoDict = typing.Dict[
 ]
 
 
+# Increase this when the layout of the index file changes
+INDEX_VERSION = 1
+
+
+def _read_installed_files(dist_info_path: str) -> typing.List[str]:
+    """
+    Return the normalized absolute paths of the files listed
+    in the installed-files.txt or RECORD file in *dist_info_path*.
+    Symbolic links in the paths are not resolved.
+    """
+    result = []
+
+    fn = os.path.join(dist_info_path, "installed-files.txt")
+    if os.path.exists(fn):
+        with open(fn) as stream:
+            for line in stream:
+                result.append(
+                    os.path.normpath(os.path.join(dist_info_path, line.rstrip()))
+                )
+
+    fn = os.path.join(dist_info_path, "RECORD")
+    if os.path.exists(fn):
+        with open(fn) as stream:
+            for ln in stream:
+                # See update_metadata_cache_distinfo
+                relpath = ln.rsplit(",", 2)[0]
+
+                if relpath.startswith('"') and relpath.endswith('"'):
+                    relpath = relpath[1:-1].replace('""', '"')
+
+                result.append(
+                    os.path.normpath(
+                        os.path.join(os.path.dirname(dist_info_path), relpath)
+                    )
+                )
+
+    return result
+
+
+def _dist_info_stamp(dist_info_path: str) -> typing.Optional[list]:
+    """
+    Return a value that changes when the list of installed
+    files for *dist_info_path* changes.
+    """
+    stamp = []
+    for fn in (None, "installed-files.txt", "RECORD"):
+        path = dist_info_path if fn is None else os.path.join(dist_info_path, fn)
+        try:
+            st = os.stat(path)
+        except OSError:
+            if fn is None:
+                return None
+            stamp.append(None)
+        else:
+            stamp.append([st.st_mtime_ns, st.st_size])
+    return stamp
+
+
+class MetadataIndex:
+    """
+    Mapping from installed files to the dist-info/egg-info
+    directory of the distribution that installed them, for the
+    distributions found on the importlib search path *path*.
+
+    The lists of installed files are stored in *index_file* and
+    are only read again for dist-info directories that changed
+    since the previous build. Symbolic links are only resolved
+    for the files that are looked up using :meth:`owner`.
+    """
+
+    def __init__(
+        self, path: typing.Sequence[str], index_file: typing.Optional[str] = None
+    ):
+        self.index_file = index_file
+        self.distributions = 0
+        self.rescanned = 0
+
+        previous = self._load()
+        self._dists: typing.Dict[str, dict] = {}
+        self._links: InfoDict = {}
+        self._owners: typing.Optional[typing.Dict[str, str]] = None
+
+        for dirname in path:
+            if not os.path.isdir(dirname):
+                continue
+
+            # Paths in the index are relative to the real location
+            # of the directory, resolving this once per directory
+            # instead of for every installed file.
+            realdir = os.path.realpath(dirname)
+            for nm in os.listdir(dirname):
+                if nm.endswith(".egg-link"):
+                    # Editable installs don't have a list of installed
+                    # files, see update_metadata_cache_distlink.
+                    update_metadata_cache_distlink(
+                        self._links, os.path.join(dirname, nm)
+                    )
+
+                elif nm.endswith(".egg-info") or nm.endswith(".dist-info"):
+                    dist_info_path = os.path.join(realdir, nm)
+                    stamp = _dist_info_stamp(dist_info_path)
+                    entry = previous.get(dist_info_path)
+                    if entry is None or entry["stamp"] != stamp:
+                        entry = {
+                            "stamp": stamp,
+                            "files": _read_installed_files(dist_info_path),
+                        }
+                        self.rescanned += 1
+                    self._dists[dist_info_path] = entry
+
+        self.distributions = len(self._dists)
+
+    def _load(self) -> typing.Dict[str, dict]:
+        if self.index_file is None:
+            return {}
+
+        try:
+            with open(self.index_file) as stream:
+                data = json.load(stream)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return {}
+        return data["distributions"]
+
+    def save(self) -> None:
+        """
+        Store the index in *index_file*
+        """
+        if self.index_file is None:
+            return
+
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        tmpname = self.index_file + ".tmp"
+        with open(tmpname, "w") as stream:
+            json.dump({"version": INDEX_VERSION, "distributions": self._dists}, stream)
+        os.replace(tmpname, self.index_file)
+
+    def owner(
+        self, filename: str
+    ) -> typing.Optional[typing.Union[str, os.PathLike[str]]]:
+        """
+        Return the dist-info directory of the distribution that
+        installed *filename*, or None. Byte-compiled files are
+        attributed to the distribution that installed the source.
+        """
+        if self._owners is None:
+            self._owners = {}
+            for dist_info_path, entry in self._dists.items():
+                for fn in entry["files"]:
+                    self._owners[fn] = dist_info_path
+            self._owners.update(self._links)
+
+        # Files can be symbolic links to files installed by
+        # another distribution, try the resolved path first.
+        candidates = [os.path.realpath(filename), os.path.abspath(filename)]
+        if filename.endswith((".pyc", ".pyo")):
+            candidates.extend([fn[:-1] for fn in candidates])
+
+        for fn in candidates:
+            dist_info_path = self._owners.get(fn)
+            if dist_info_path is not None:
+                return dist_info_path
+        return None
+
+    def report(self) -> str:
+        return (
+            f"metadata index: {self.distributions} distributions, "
+            f"{self.rescanned} rescanned"
+        )
+
+
 def update_metadata_cache_distinfo(
     infos: InfoDict, dist_info_path: typing.Union[str, os.PathLike[str]]
 ) -> None:
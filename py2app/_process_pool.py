@@ -0,0 +1,183 @@
+"""
+A pool of worker processes that doesn't depend on multiprocessing
+
+Builds run from a setup.py file that usually has no
+``if __name__ == "__main__"`` guard. With the "spawn" and "forkserver"
+start methods multiprocessing runs the ``__main__`` module again in
+every worker, which starts another build, and forking the build process
+is not safe because it runs threads (for example the refresh thread
+of the progress display).
+
+The workers in this pool are new interpreters that run this module.
+Tasks are sent to a worker as a pickled function and arguments on its
+standard input, and the pickled result is read from its standard output.
+Functions must therefore be defined at the top level of a module. A
+thread in the build process feeds every worker.
+"""
+import concurrent.futures
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+import typing
+
+
+class BrokenWorker(RuntimeError):
+    """
+    A worker process exited while running a task
+    """
+
+
+def _apply_chunk(function, chunk):
+    return [function(*args) for args in chunk]
+
+
+def _worker_env() -> typing.Dict[str, str]:
+    # Make sure the worker can import py2app, even when it is not
+    # installed in the environment used to run the build.
+    import py2app
+
+    env = dict(os.environ)
+    path = os.path.dirname(os.path.dirname(os.path.abspath(py2app.__file__)))
+    if env.get("PYTHONPATH"):
+        path = path + os.pathsep + env["PYTHONPATH"]
+    env["PYTHONPATH"] = path
+    return env
+
+
+class ProcessPool:
+    """
+    Executor that runs functions on *max_workers* worker processes,
+    supports the parts of the ``concurrent.futures.Executor`` API
+    that py2app uses.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._queue: queue.Queue = queue.Queue()
+        self._processes = []
+        self._threads = []
+
+        env = _worker_env()
+        for _ in range(max_workers):
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "py2app._process_pool"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                env=env,
+            )
+            thread = threading.Thread(target=self._feed, args=(proc,), daemon=True)
+            thread.start()
+            self._processes.append(proc)
+            self._threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def submit(self, function, *args) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._queue.put((future, function, args))
+        return future
+
+    def map(self, function, *iterables, chunksize=1):
+        chunk_args = list(zip(*iterables))
+        futures = [
+            self.submit(_apply_chunk, function, chunk_args[idx : idx + chunksize])
+            for idx in range(0, len(chunk_args), chunksize)
+        ]
+
+        def results():
+            for future in futures:
+                yield from future.result()
+
+        return results()
+
+    def shutdown(self, wait=True) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+            for proc in self._processes:
+                proc.wait()
+
+    def _feed(self, proc):
+        broken = None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            future, function, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            if broken is not None:
+                future.set_exception(broken)
+                continue
+
+            try:
+                task = pickle.dumps((function, args), pickle.HIGHEST_PROTOCOL)
+            except Exception as exc:
+                future.set_exception(exc)
+                continue
+
+            try:
+                proc.stdin.write(task)
+                proc.stdin.flush()
+                ok, value = pickle.load(proc.stdout)
+            except (OSError, EOFError, pickle.UnpicklingError) as exc:
+                broken = BrokenWorker(
+                    f"worker process {proc.pid} exited with status {proc.poll()}"
+                )
+                broken.__cause__ = exc
+                future.set_exception(broken)
+                continue
+
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+
+
+def _serve():
+    # Results are written to the original standard output, output
+    # of the tasks themselves goes to the standard error stream.
+    tasks = sys.stdin.buffer
+    results = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    while True:
+        try:
+            function, args = pickle.load(tasks)
+        except EOFError:
+            break
+
+        try:
+            reply = (True, function(*args))
+        except Exception as exc:
+            reply = (False, exc)
+
+        try:
+            data = pickle.dumps(reply, pickle.HIGHEST_PROTOCOL)
+        except Exception as exc:
+            data = pickle.dumps(
+                (False, RuntimeError(f"cannot return result: {exc!r}")),
+                pickle.HIGHEST_PROTOCOL,
+            )
+        results.write(data)
+        results.flush()
+
+
+if __name__ == "__main__":
+    _serve()
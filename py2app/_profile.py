@@ -0,0 +1,93 @@
+"""
+Timing of build phases (``--profile-build``)
+
+``BuildProfile`` records spans for the phases of a build, and for
+the files processed in the slower phases, together with totals such
+as the number of bytes copied. The result is written in the Chrome
+"Trace Event Format", which can be viewed with ``chrome://tracing``
+or https://ui.perfetto.dev.
+"""
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+import typing
+
+
+class BuildProfile:
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._events: typing.List[dict] = []
+        self.totals: typing.Counter[str] = collections.Counter()
+
+    def _timestamp(self, value: float) -> float:
+        # Trace timestamps are in microseconds
+        return round((value - self._start) * 1e6, 3)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "phase", **args):
+        """
+        Record the time spent in the with-block as a span named *name*.
+        The value of the with-statement is a dict with the *args*
+        of the span, which can be updated in the block.
+        """
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": self._timestamp(start),
+                "dur": round((end - start) * 1e6, 3),
+                "pid": self._pid,
+                "tid": threading.get_ident(),
+            }
+            if args:
+                event["args"] = args
+            with self._lock:
+                self._events.append(event)
+
+    def add(self, name: str, value: int = 1) -> None:
+        """
+        Add *value* to the total named *name*
+        """
+        with self._lock:
+            self.totals[name] += value
+
+    def save(self, path: str) -> None:
+        """
+        Write the trace to *path*
+        """
+        with self._lock:
+            events = sorted(self._events, key=lambda event: event["ts"])
+            totals = dict(self.totals)
+
+        events.append(
+            {
+                "name": "totals",
+                "ph": "C",
+                "ts": self._timestamp(time.perf_counter()),
+                "pid": self._pid,
+                "args": totals,
+            }
+        )
+
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with open(path, "w") as stream:
+            json.dump(
+                {
+                    "traceEvents": events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"totals": totals},
+                },
+                stream,
+            )
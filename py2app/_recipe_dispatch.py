@@ -0,0 +1,84 @@
+"""
+Dispatching recipes while building the module graph
+
+Recipes can declare the names of the modules that trigger them. A
+recipe with triggers is only checked when one of those modules is in
+the graph, and is only checked again when a trigger module was added
+to (or replaced in) the graph since its previous check. Recipes
+without triggers look at the entire graph, and are checked again
+after every recipe that was applied.
+
+Recipes are always checked in the order they are registered and the
+first recipe that applies is applied before checking the others. This
+results in the same sequence of recipes as checking all recipes again
+from the start after applying a recipe.
+"""
+import heapq
+import typing
+
+Check = typing.Callable[[typing.Any, typing.Any], typing.Optional[dict]]
+
+
+class RecipeDispatcher:
+    def __init__(
+        self,
+        checks: typing.Dict[str, Check],
+        triggers: typing.Dict[str, typing.Optional[typing.Sequence[str]]],
+    ):
+        self.checks = checks
+        self.triggers = triggers
+
+        # Number of times a check function was called
+        self.checks_run = 0
+
+    def _trigger_nodes(self, mf, name: str) -> typing.Optional[tuple]:
+        triggers = self.triggers.get(name)
+        if triggers is None:
+            return None
+        return tuple(mf.findNode(trigger) for trigger in triggers)
+
+    def run(self, cmd, mf) -> typing.Iterator[typing.Tuple[str, dict]]:
+        """
+        Yield the name and result for every recipe that applies to
+        the graph *mf*. The result must be applied to the graph
+        before resuming the iterator.
+        """
+        names = list(self.checks)
+        remaining = set(names)
+        seen: typing.Dict[str, typing.Optional[tuple]] = {}
+
+        queue = list(range(len(names)))
+        queued = set(queue)
+
+        while queue:
+            idx = heapq.heappop(queue)
+            queued.discard(idx)
+            name = names[idx]
+
+            nodes = seen[name] = self._trigger_nodes(mf, name)
+            if nodes is not None and not any(node is not None for node in nodes):
+                continue
+
+            self.checks_run += 1
+            rval = self.checks[name](cmd, mf)
+            if rval is None:
+                continue
+
+            remaining.discard(name)
+            yield name, rval
+
+            # Check the recipes again that might be affected
+            # by the changes to the graph.
+            for other_idx, other in enumerate(names):
+                if other not in remaining or other_idx in queued:
+                    continue
+
+                nodes = self._trigger_nodes(mf, other)
+                previous = seen.get(other)
+                if (
+                    nodes is None
+                    or previous is None
+                    or any(a is not b for a, b in zip(nodes, previous))
+                ):
+                    heapq.heappush(queue, other_idx)
+                    queued.add(other_idx)
@@ -0,0 +1,364 @@
+"""
+Attribution of the size of a bundle (``--size-report``)
+
+``SizeAttribution`` records where the contents of a bundle come from
+while it is built: the source files of the modules in the module
+graph, the sources of libraries and frameworks copied into the bundle,
+and the resources and loader files added by recipes.
+
+After the build every file in the bundle is attributed to an owner,
+which is a distribution, a top-level package that is not part of a
+distribution, a recipe, Python itself or the bundle structure. Entries
+in the zipfile with Python modules are attributed separately at their
+compressed size, the rest of the zipfile (headers and the central
+directory) is attributed to the bundle.
+"""
+import collections
+import json
+import os
+import posixpath
+import stat
+import sys
+import typing
+import zipfile
+
+from py2app._pkg_meta import MetadataIndex
+from py2app.filters import PathClassifier
+from py2app.progress import _format_size
+
+
+class Owner(typing.NamedTuple):
+    # One of "distribution", "package", "recipe", "python" or "bundle"
+    kind: str
+    name: str
+
+    def __str__(self):
+        return f"{self.name} ({self.kind})"
+
+
+PYTHON_RUNTIME = Owner("python", "runtime")
+PYTHON_STDLIB = Owner("python", "stdlib")
+BUNDLE_EXECUTABLES = Owner("bundle", "executables")
+BUNDLE_FRAMEWORKS = Owner("bundle", "frameworks")
+BUNDLE_RESOURCES = Owner("bundle", "resources")
+BUNDLE_FILES = Owner("bundle", "bundle files")
+ZIP_OVERHEAD = Owner("bundle", "zipfile overhead")
+
+
+def distribution_name(dist_info_path: typing.Union[str, os.PathLike]) -> str:
+    """
+    Return the name of the distribution for a
+    dist-info or egg-info directory
+    """
+    base = os.path.basename(os.fspath(dist_info_path))
+    return os.path.splitext(base)[0].split("-")[0]
+
+
+def _module_candidates(parts: typing.Sequence[str]) -> typing.Iterator[str]:
+    # Module names for the path components of a file, longest
+    # name first. The suffixes of files are not part of the name
+    # (including the ABI tag of extensions).
+    parts = list(parts[:-1]) + [parts[-1].split(".")[0]]
+    for idx in range(len(parts), 0, -1):
+        yield ".".join(parts[:idx])
+
+
+class ReportEntry(typing.NamedTuple):
+    # Path relative to the bundle, for entries in a zipfile
+    # the path of the zipfile followed by the name of the entry
+    path: str
+    owner: Owner
+    kind: str
+    size: int
+
+
+class SizeReport:
+    """
+    The sizes of the files in a bundle, grouped by owner
+    """
+
+    def __init__(self, bundle: str):
+        self.bundle = bundle
+        self.entries: typing.List[ReportEntry] = []
+
+    def add(self, path: str, owner: Owner, kind: str, size: int) -> None:
+        self.entries.append(ReportEntry(path, owner, kind, size))
+
+    @property
+    def total(self) -> int:
+        return sum(entry.size for entry in self.entries)
+
+    def owners(self) -> typing.List[dict]:
+        """
+        Return the totals for every owner, largest first
+        """
+        totals: typing.Dict[Owner, dict] = {}
+        for entry in self.entries:
+            info = totals.setdefault(
+                entry.owner, {"size": 0, "files": 0, "kinds": collections.Counter()}
+            )
+            info["size"] += entry.size
+            info["files"] += 1
+            info["kinds"][entry.kind] += entry.size
+
+        return [
+            {
+                "owner": owner.name,
+                "kind": owner.kind,
+                "size": info["size"],
+                "files": info["files"],
+                "kinds": dict(info["kinds"].most_common()),
+            }
+            for owner, info in sorted(
+                totals.items(), key=lambda item: (-item[1]["size"], item[0])
+            )
+        ]
+
+    def format_table(self) -> typing.List[str]:
+        owners = self.owners()
+        total = self.total
+        labels = [str(Owner(info["kind"], info["owner"])) for info in owners]
+        width = max(map(len, labels + ["owner"]))
+        lines = [f"{'owner':{width}} {'size':>10} {'share':>6} {'files':>7}"]
+        for label, info in zip(labels, owners):
+            share = info["size"] / total if total else 0.0
+            lines.append(
+                f"{label:{width}} {_format_size(info['size']):>10} "
+                f"{share:6.1%} {info['files']:7}"
+            )
+        lines.append(
+            f"{'total':{width}} {_format_size(total):>10} {1:6.0%} "
+            f"{len(self.entries):7}"
+        )
+        return lines
+
+    def save(self, path: str) -> None:
+        data = {
+            "bundle": self.bundle,
+            "size": self.total,
+            "owners": self.owners(),
+            "files": [
+                {
+                    "path": entry.path,
+                    "owner": entry.owner.name,
+                    "owner_kind": entry.owner.kind,
+                    "kind": entry.kind,
+                    "size": entry.size,
+                }
+                for entry in sorted(self.entries, key=lambda entry: -entry.size)
+            ],
+        }
+        with open(path, "w") as stream:
+            json.dump(data, stream, indent=2)
+            stream.write("\n")
+
+
+class SizeAttribution:
+    """
+    Information about the origin of the contents of
+    a bundle that is collected during a build.
+    """
+
+    def __init__(self):
+        # Module name -> source file
+        self._modules: typing.Dict[str, str] = {}
+
+        # Destination in the bundle -> source
+        self._origins: typing.Dict[str, str] = {}
+
+        # Source file or directory -> recipe name
+        self._recipe_sources: typing.Dict[str, str] = {}
+
+        # Name in the zipfile -> recipe name
+        self._recipe_entries: typing.Dict[str, str] = {}
+
+    def add_module(self, identifier: str, filename: str) -> None:
+        self._modules[identifier] = filename
+
+    def add_origin(self, dest: str, source: str) -> None:
+        self._origins[os.path.abspath(dest)] = os.path.abspath(source)
+
+    def add_recipe_source(self, name: str, source: str) -> None:
+        """
+        Record that recipe *name* added the file or directory *source*
+        """
+        self._recipe_sources[os.path.abspath(source)] = name
+
+    def add_recipe_entry(self, name: str, arcname: str) -> None:
+        """
+        Record that recipe *name* added *arcname* to the zipfile
+        """
+        self._recipe_entries[arcname] = name
+
+    def _source_owner(
+        self,
+        source: str,
+        metadata_index: MetadataIndex,
+        classifier: PathClassifier,
+        package: typing.Optional[str] = None,
+    ) -> typing.Optional[Owner]:
+        dist_info_path = metadata_index.owner(source)
+        if dist_info_path is not None:
+            return Owner("distribution", distribution_name(dist_info_path))
+
+        path = source
+        while True:
+            name = self._recipe_sources.get(path)
+            if name is not None:
+                return Owner("recipe", name)
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+
+        if classifier.is_stdlib(source):
+            return PYTHON_STDLIB
+
+        if package is not None:
+            return Owner("package", package)
+        return None
+
+    def report(
+        self,
+        bundle: str,
+        staging_bundle: str,
+        metadata_index: MetadataIndex,
+        classifier: PathClassifier,
+    ) -> SizeReport:
+        """
+        Attribute the files in *bundle*. *staging_bundle* is the
+        location where the bundle was assembled, which differs from
+        *bundle* for incremental builds.
+        """
+        module_owners: typing.Dict[str, Owner] = {}
+
+        def module_owner(parts):
+            for name in _module_candidates(parts):
+                owner = module_owners.get(name)
+                if owner is None and name in self._modules:
+                    owner = module_owners[name] = self._source_owner(
+                        self._modules[name],
+                        metadata_index,
+                        classifier,
+                        package=name.split(".")[0],
+                    )
+                if owner is not None:
+                    return owner
+            return None
+
+        origins = {
+            os.path.relpath(dest, staging_bundle): source
+            for dest, source in self._origins.items()
+        }
+
+        def origin_owner(relpath):
+            # Files in a directory that was copied as a whole are
+            # looked up by their location in the source directory.
+            path = relpath
+            while path:
+                source = origins.get(path)
+                if source is not None:
+                    if path != relpath:
+                        source = os.path.join(source, os.path.relpath(relpath, path))
+                    return self._source_owner(source, metadata_index, classifier)
+                path = os.path.dirname(path)
+            return None
+
+        pydir = os.path.join(
+            "Contents", "Resources", "lib", "python%d.%d" % sys.version_info[:2]
+        )
+        result = SizeReport(bundle)
+
+        for dirpath, dirnames, filenames in os.walk(bundle):
+            dirnames.sort()
+            for fn in sorted(filenames):
+                path = os.path.join(dirpath, fn)
+                st = os.lstat(path)
+                if not stat.S_ISREG(st.st_mode):
+                    # Symbolic links are attributed through
+                    # the file they refer to.
+                    continue
+
+                relpath = os.path.relpath(path, bundle)
+                parts = relpath.split(os.sep)
+
+                if fn.endswith(".zip") and zipfile.is_zipfile(path):
+                    self._report_zipfile(result, path, relpath, module_owner)
+                    continue
+
+                owner = origin_owner(relpath)
+                if parts[:2] == ["Contents", "MacOS"]:
+                    kind = "executable"
+                    owner = owner or BUNDLE_EXECUTABLES
+
+                elif parts[:2] == ["Contents", "Frameworks"]:
+                    kind = "framework"
+                    if parts[2].startswith(("Python.framework", "libpython")):
+                        owner = PYTHON_RUNTIME
+                    else:
+                        owner = owner or BUNDLE_FRAMEWORKS
+
+                elif relpath.startswith(pydir + os.sep):
+                    rest = parts[len(pydir.split(os.sep)) :]
+                    if rest[0] == "lib-dynload":
+                        kind = "extension"
+                        rest = rest[1:]
+                    else:
+                        kind = "package"
+                    if rest[0].startswith(("config", "site.")):
+                        owner = PYTHON_RUNTIME
+                    else:
+                        owner = owner or module_owner(rest)
+                        if owner is None:
+                            owner = Owner("package", rest[0].split(".")[0])
+
+                elif parts[2:3] in (["lib"], ["include"]) and parts[1] == "Resources":
+                    kind = "python"
+                    owner = owner or PYTHON_RUNTIME
+
+                elif parts[:2] == ["Contents", "Resources"]:
+                    kind = "resource"
+                    owner = owner or BUNDLE_RESOURCES
+
+                else:
+                    kind = "bundle"
+                    owner = owner or BUNDLE_FILES
+
+                result.add(relpath, owner, kind, st.st_size)
+
+        return result
+
+    def _report_zipfile(self, result, path, relpath, module_owner):
+        total = os.path.getsize(path)
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                parts = info.filename.split("/")
+                if parts[0].endswith((".dist-info", ".egg-info")):
+                    kind = "metadata"
+                    owner = Owner("distribution", distribution_name(parts[0]))
+                else:
+                    kind = (
+                        "module" if info.filename.endswith((".pyc", ".pyo")) else "data"
+                    )
+                    owner = module_owner(parts)
+                    if owner is None:
+                        owner = self._zip_recipe_owner(info.filename)
+                    if owner is None:
+                        owner = Owner("package", parts[0].split(".")[0])
+
+                result.add(
+                    f"{relpath}/{info.filename}", owner, kind, info.compress_size
+                )
+                total -= info.compress_size
+
+        result.add(relpath, ZIP_OVERHEAD, "zipfile", total)
+
+    def _zip_recipe_owner(self, name: str) -> typing.Optional[Owner]:
+        while name:
+            recipe = self._recipe_entries.get(name)
+            if recipe is not None:
+                return Owner("recipe", recipe)
+            name = posixpath.dirname(name)
+        return None
@@ -5,14 +5,13 @@ Originally (loosely) based on code from py2exe's build_exe.py by Thomas Heller.
 """
 
 import collections
-import imp
+import functools
 import os
 import plistlib
+import posixpath
 import shlex
 import shutil
 import sys
-import types
-import zipfile
 import zlib
 from distutils.errors import DistutilsOptionError, DistutilsPlatformError
 from distutils.sysconfig import get_config_h_filename, get_config_var
@@ -23,20 +22,22 @@ from itertools import chain
 import macholib.dyld
 import macholib.MachO
 import macholib.MachOStandalone
-from modulegraph import modulegraph, zipio
-from modulegraph.find_modules import find_modules, find_needed_modules, parse_mf_results
-from modulegraph.modulegraph import Package, Script, SourceModule
-from modulegraph.util import imp_find_module
+from modulegraph import zipio
 from setuptools import Command
 
 from py2app import recipes
-from py2app._pkg_meta import IGNORED_DISTINFO, scan_for_metadata
+from py2app._bundle_sync import ReusePlan, sync_dist_dir
+from py2app._bytecode_cache import DEFAULT_MAX_SIZE, BytecodeCache
+from py2app._dylib_dedup import dedup_dylibs
+from py2app._macho_cache import CachedMachO, MachOCache
+from py2app._pkg_meta import IGNORED_DISTINFO, MetadataIndex
+from py2app._recipe_dispatch import RecipeDispatcher
 from py2app.apptemplate.setup import main as script_executable
 from py2app.create_appbundle import create_appbundle
 from py2app.create_pluginbundle import create_pluginbundle
-from py2app.filters import has_filename_filter, not_stdlib_filter
 from py2app.util import (
     byte_compile,
+    byte_compile_to_archive,
     codesign_adhoc,
     copy_file,
     copy_resource,
@@ -54,12 +55,16 @@ from py2app.util import (
     momc,
     skipscm,
     strip_files,
+    thin_files,
 )
 
 from .progress import Progress
 
 PYTHONFRAMEWORK = get_config_var("PYTHONFRAMEWORK")
 
+# Valid values for the thin-arch option
+THIN_ARCHS = ("arm64", "x86_64")
+
 
 PLUGIN_SUFFIXES = {
     ".qlgenerator": "QuickLook",
@@ -114,14 +119,17 @@ def finalize_distribution_options(dist):
         dist.metadata.name = name
 
 
-def loader_paths(sourcefn, destfn):
+def loader_paths(sourcefn, destfn, macho_cache=None):
     # Yield (sourcefn, destfn) pairs for all
     # '@loader_path' load commands in 'sourcefn'
     sourcedir = os.path.dirname(sourcefn)
     destdir = os.path.dirname(destfn)
 
-    m = macholib.MachO.MachO(sourcefn)
-    for header in m.headers:
+    if macho_cache is None:
+        headers = macholib.MachO.MachO(sourcefn).headers
+    else:
+        headers = macho_cache.headers(sourcefn) or ()
+    for header in headers:
         for _idx, _name, other in header.walkRelocatables():
             if not other.startswith("@loader_path/"):
                 continue
@@ -153,8 +161,18 @@ class PythonStandalone(macholib.MachOStandalone.MachOStandalone):
             )
             self.ext_map[fn] = os.path.dirname(e.filename)
 
+    def getClass(self, name, cls):
+        cls = super().getClass(name, cls)
+        if cls is macholib.MachO.MachO:
+            # Read the load commands from the Mach-O cache, files
+            # are only parsed when their load commands are rewritten.
+            return functools.partial(
+                CachedMachO, cache=self.appbuilder.get_macho_cache()
+            )
+        return cls
+
     def update_node(self, m):
-        if isinstance(m, macholib.MachO.MachO):
+        if isinstance(m, (macholib.MachO.MachO, CachedMachO)):
             if m.filename in self.ext_map:
                 m.loader_path = self.ext_map[m.filename]
         return m
@@ -179,22 +197,35 @@ class PythonStandalone(macholib.MachOStandalone.MachOStandalone):
             dest = os.path.join(self.dest, os.path.basename(src))
 
         self.ext_map[dest] = os.path.dirname(src)
-        return self.appbuilder.copy_dylib(src, dest)
+        if self.appbuilder.size_attribution is not None:
+            self.appbuilder.size_attribution.add_origin(dest, src)
+        with self.appbuilder.progress.span(f"copy {src}", "file"):
+            return self.appbuilder.copy_dylib(src, dest)
 
     def copy_framework(self, info):
-        destfn = self.appbuilder.copy_framework(info, self.dest)
+        with self.appbuilder.progress.span(f"copy {info['name']}", "file"):
+            destfn = self.appbuilder.copy_framework(info, self.dest)
         dest = os.path.join(self.dest, info["shortname"] + ".framework")
+        if self.appbuilder.size_attribution is not None:
+            self.appbuilder.size_attribution.add_origin(
+                dest, os.path.join(info["location"], info["shortname"] + ".framework")
+            )
         self.pending.append((destfn, iter_platform_files(dest)))
         return destfn
 
 
 def iter_recipes(module=recipes):
-    for name in dir(module):
-        if name.startswith("_"):
-            continue
-        check = getattr(getattr(module, name), "check", None)
-        if check is not None:
-            yield (name, check)
+    for name in module.RECIPES:
+        yield (name, module.LazyCheck(name))
+
+
+def iter_recipe_triggers(module=recipes):
+    """
+    Yield the names of the modules that trigger recipes, the
+    triggers are None for recipes that look at the entire graph.
+    """
+    for name, (_module, triggers) in module.RECIPES.items():
+        yield (name, triggers)
 
 
 # A very loosely defined "target".  We assume either a "script" or "modules"
@@ -352,6 +383,11 @@ class py2app(Command):
         ("graph", "g", "output module dependency graph"),
         ("xref", "x", "output module cross-reference as html"),
         ("no-strip", None, "do not strip debug and local symbols from output"),
+        (
+            "strip-tool=",
+            None,
+            "path of the tool used to strip binaries [default: /usr/bin/strip]",
+        ),
         (
             "no-chdir",
             "C",
@@ -416,6 +452,17 @@ class py2app(Command):
             "set of architectures to use (x86_64, arm64, universal2; "
             "default is the set for the current python binary)",
         ),
+        (
+            "thin-arch=",
+            None,
+            "remove the code for other architectures than this one "
+            "(arm64 or x86_64) from universal binaries in the bundle",
+        ),
+        (
+            "dedup-dylibs",
+            None,
+            "keep a single copy of identical dylibs in the bundle",
+        ),
         (
             "qt-plugins=",
             None,
@@ -447,6 +494,65 @@ class py2app(Command):
             None,
             "Forward the stdout/stderr streams to Console.app using ASL",
         ),
+        (
+            "cache-dir=",
+            None,
+            "directory for data that is cached between builds "
+            "[default: BDIST_BASE/py2app-cache]",
+        ),
+        ("bytecode-cache", None, "reuse byte-compiled modules from earlier builds"),
+        (
+            "jobs=",
+            "j",
+            "number of parallel jobs for scanning, byte-compiling "
+            "and compressing modules, and for stripping and signing binaries",
+        ),
+        (
+            "bytecode-cache-size=",
+            None,
+            "maximum size of the bytecode cache in megabytes [default: 256]",
+        ),
+        (
+            "no-graph-cache",
+            None,
+            "do not reuse the module dependency graph of earlier builds",
+        ),
+        (
+            "incremental",
+            None,
+            "only update files in the dist directory that have changed",
+        ),
+        (
+            "compression-policy=",
+            None,
+            "compression of the zipfile with Python modules: deflate, store "
+            "or startup-optimized [default: deflate]",
+        ),
+        (
+            "compression-rules=",
+            None,
+            "comma separated list of PATTERN=METHOD rules for compressing "
+            "entries in the zipfile with Python modules (store or deflate)",
+        ),
+        (
+            "profile-build=",
+            None,
+            "write the time spent in the phases of the build to this file "
+            "(Chrome trace format)",
+        ),
+        (
+            "size-report=",
+            None,
+            "write the size of the bundle per distribution or package to "
+            "this file (JSON), and print a summary",
+        ),
+        (
+            "progress-level=",
+            None,
+            "amount of progress output: 0 (warnings), 1 (build phases) or "
+            "2 (every file) [default: 1, 0 with --quiet, 2 with --verbose]",
+        ),
+        ("log-file=", None, "write all progress messages to this file"),
     ]
 
     boolean_options = [
@@ -468,6 +574,10 @@ class py2app(Command):
         "report-missing-from-imports",
         "no-report-missing-conditional-import",
         "redirect-stdout-to-asl",
+        "bytecode-cache",
+        "no-graph-cache",
+        "incremental",
+        "dedup-dylibs",
     ]
 
     always_expected_missing_imports = {
@@ -485,8 +595,11 @@ class py2app(Command):
         self.no_zip = 0
         self.optimize = None
         self.arch = None
+        self.thin_arch = None
+        self.dedup_dylibs = False
         self.strip = True
         self.no_strip = False
+        self.strip_tool = None
         self.iconfile = None
         self.extension = None
         self.alias = 0
@@ -525,9 +638,48 @@ class py2app(Command):
         self._python_app = None
         self.use_old_sdk = False
         self.expected_missing_imports = None
+        self.cache_dir = None
+        self.bytecode_cache = False
+        self.bytecode_cache_size = None
+        self._bytecode_cache = None
+        self._global_names_cache = None
+        self._macho_cache = None
+        self._path_classifier = None
+        self.no_graph_cache = False
+        self.incremental = False
+        self.final_dist_dir = None
+        self.reuse_plan = None
+        self.compression_policy = None
+        self.compression_rules = None
+        self.startup_entries = ()
+        self.jobs = None
+        self.profile_build = None
+        self.size_report = None
+        self.size_attribution = None
+        self.metadata_index = None
+        self.progress_level = None
+        self.log_file = None
 
     def finalize_options(self):
-        self.progress = Progress()
+        if self.progress_level is None:
+            self.progress_level = min(self.verbose, 2)
+        else:
+            self.progress_level = int(self.progress_level)
+            if self.progress_level not in (0, 1, 2):
+                raise DistutilsOptionError("progress-level must be 0, 1 or 2")
+
+        self.progress = Progress(self.progress_level, self.log_file)
+        if self.profile_build is not None:
+            from py2app._profile import BuildProfile
+
+            self.profile_build = os.path.abspath(self.profile_build)
+            self.progress.profile = BuildProfile()
+
+        if self.size_report is not None:
+            from py2app._size_report import SizeAttribution
+
+            self.size_report = os.path.abspath(self.size_report)
+            self.size_attribution = SizeAttribution()
 
         if sys_base_prefix != sys.prefix:
             self._python_app = os.path.join(sys_base_prefix, "Resources", "Python.app")
@@ -646,8 +798,50 @@ class py2app(Command):
             "bdist", ("dist_dir", "dist_dir"), ("bdist_base", "bdist_base")
         )
 
+        if self.cache_dir is None:
+            self.cache_dir = os.path.join(self.bdist_base, "py2app-cache")
+
+        if self.jobs is not None:
+            self.jobs = int(self.jobs)
+            if self.jobs < 1:
+                raise DistutilsOptionError("jobs must be at least 1")
+
+        if self.thin_arch is not None:
+            if self.thin_arch not in THIN_ARCHS:
+                raise DistutilsOptionError(
+                    f"invalid thin-arch: {self.thin_arch!r}, "
+                    f"use one of {', '.join(THIN_ARCHS)}"
+                )
+            if self.arch not in (None, "universal2", self.thin_arch):
+                raise DistutilsOptionError(
+                    f"thin-arch {self.thin_arch!r} is not compatible "
+                    f"with arch {self.arch!r}"
+                )
+
+        from py2app._libarchive import COMPRESSION_PRESETS, parse_compression_rule
+
+        if self.compression_policy is None:
+            self.compression_policy = "deflate" if self.compressed else "store"
+        elif self.compression_policy not in COMPRESSION_PRESETS:
+            raise DistutilsOptionError(
+                f"invalid compression policy: {self.compression_policy!r}, "
+                f"use one of {', '.join(COMPRESSION_PRESETS)}"
+            )
+
+        self.compression_rules = fancy_split(self.compression_rules)
+        for rule in self.compression_rules:
+            try:
+                parse_compression_rule(rule)
+            except ValueError as exc:
+                raise DistutilsOptionError(str(exc)) from None
+
+        if self.bytecode_cache_size is None:
+            self.bytecode_cache_size = DEFAULT_MAX_SIZE
+        else:
+            self.bytecode_cache_size = int(self.bytecode_cache_size) * 1024 * 1024
+
         if self.semi_standalone:
-            self.filters.append(not_stdlib_filter)
+            self.filters.append(self.not_stdlib_filter)
 
         if self.iconfile is None and "CFBundleIconFile" not in self.plist:
             # Default is the generic applet icon in the framework
@@ -824,10 +1018,13 @@ class py2app(Command):
         self.initialize_prescripts()
 
         try:
-            self._run()
+            with self.progress.span("py2app"):
+                self._run()
         finally:
             self.progress.stop()
             sys.path = sys_old_path
+            if self.progress.profile is not None:
+                self.progress.profile.save(self.profile_build)
 
     def iter_datamodels(self, resdir):
         for (path, files) in (
@@ -966,12 +1163,23 @@ class py2app(Command):
 
         arch = self.arch if self.arch is not None else get_platform().split("-")[-1]
         if arch in ("universal2", "arm64"):
-            codesign_adhoc(self.target.appdir, self.progress)
+            codesign_adhoc(
+                self.target.appdir,
+                self.progress,
+                jobs=self.jobs,
+                macho_cache=self.get_macho_cache(),
+            )
+            self.save_macho_cache()
 
     def collect_recipedict(self):
         return dict(iter_recipes())
 
+    def collect_recipe_triggers(self):
+        return dict(iter_recipe_triggers())
+
     def get_modulefinder(self):
+        from modulegraph.find_modules import find_modules
+
         if self.debug_modulegraph:
             debug = 4
         else:
@@ -985,58 +1193,135 @@ class py2app(Command):
         )
 
     def collect_filters(self):
+        from py2app.filters import has_filename_filter
+
         return [has_filename_filter] + list(self.filters)
 
-    def process_recipes(self, mf, filters, flatpackages, loader_files):
-        rdict = self.collect_recipedict()
-        while True:
-            for name, check in rdict.items():
-                rval = check(self, mf)
-                if rval is None:
-                    continue
-                # we can pull this off so long as we stop the iter
-                del rdict[name]
-                self.progress.info(f"*** using recipe: {name} ***: {rval}")
+    def process_recipes(
+        self, mf, filters, flatpackages, loader_files, recipe_results=None, names=None
+    ):
+        """
+        Run the recipes and apply their results, only the recipes
+        in *names* are run when that is not None. The results of
+        recipes not in ``recipes.ALWAYS_RUN`` are added to
+        *recipe_results*.
+        """
+        checks = self.collect_recipedict()
+        if names is not None:
+            checks = {name: check for name, check in checks.items() if name in names}
+        if self.progress.profile is not None:
+            checks = {
+                name: self._profiled_check(name, check)
+                for name, check in checks.items()
+            }
+
+        dispatcher = RecipeDispatcher(checks, self.collect_recipe_triggers())
+        for name, rval in dispatcher.run(self, mf):
+            self.progress.info(f"*** using recipe: {name} ***: {rval}")
+
+            if "loader_files" in rval:
+                # Recipes can use iterators for the list of files,
+                # those can only be consumed once.
+                rval = dict(rval)
+                rval["loader_files"] = [
+                    (path, list(files)) for path, files in rval["loader_files"]
+                ]
 
-                if "expected_missing_imports" in rval:
-                    self.expected_missing_imports |= rval.get(
-                        "expected_missing_imports"
-                    )
+            if recipe_results is not None and name not in recipes.ALWAYS_RUN:
+                recipe_results.append((name, rval))
+
+            with self.progress.span(f"apply recipe {name}", "recipe"):
+                self.apply_recipe(mf, rval, filters, flatpackages, loader_files)
+
+            if self.size_attribution is not None:
+                self.record_recipe_contents(name, rval)
+
+        self.progress.trace(f"recipes: {dispatcher.checks_run} checks")
+        self.progress.count("recipe checks", dispatcher.checks_run)
 
-                if rval.get("packages"):
-                    self.maybe_packages.update(rval["packages"])
-                    find_needed_modules(mf, packages=rval["packages"])
-
-                for pkg in rval.get("flatpackages", ()):
-                    if isinstance(pkg, str):
-                        pkg = (os.path.basename(pkg), pkg)
-                    flatpackages[pkg[0]] = pkg[1]
-                filters.extend(rval.get("filters", ()))
-                loader_files.extend(rval.get("loader_files", ()))
-                newbootstraps = list(
-                    map(self.get_bootstrap, rval.get("prescripts", ()))
+        if self._global_names_cache is not None:
+            self._global_names_cache.save()
+            self.progress.info(self._global_names_cache.report())
+
+    def _profiled_check(self, name, check):
+        def profiled_check(cmd, mf):
+            with self.progress.span(f"recipe {name}", "recipe") as info:
+                rval = check(cmd, mf)
+                info["applied"] = rval is not None
+            return rval
+
+        return profiled_check
+
+    def replay_recipes(self, recipe_results, filters, flatpackages, loader_files):
+        """
+        Apply recipe results recorded in an earlier build, the
+        module graph already contains the modules they added.
+        """
+        for name, rval in recipe_results:
+            self.progress.info(f"*** using recipe: {name} (cached) ***: {rval}")
+            self.apply_recipe(
+                None, rval, filters, flatpackages, loader_files, update_graph=False
+            )
+            if self.size_attribution is not None:
+                self.record_recipe_contents(name, rval)
+
+    def record_recipe_contents(self, name, rval):
+        """
+        Record the files added by recipe *name* for the size report
+        """
+        for _path, files in map(normalize_data_file, rval.get("resources", ())):
+            for fn in files:
+                if isinstance(fn, str):
+                    self.size_attribution.add_recipe_source(name, fn)
+
+        for fn in rval.get("frameworks", ()):
+            self.size_attribution.add_recipe_source(name, fn)
+
+        for path, files in rval.get("loader_files", ()):
+            for fn in files:
+                self.size_attribution.add_recipe_entry(
+                    name, posixpath.join(path, os.path.basename(fn))
                 )
 
-                if rval.get("includes"):
-                    find_needed_modules(mf, includes=rval["includes"])
+    def apply_recipe(
+        self, mf, rval, filters, flatpackages, loader_files, update_graph=True
+    ):
+        from modulegraph.find_modules import find_needed_modules
+
+        if "expected_missing_imports" in rval:
+            self.expected_missing_imports |= rval.get("expected_missing_imports")
 
-                if rval.get("resources"):
-                    self.resources.extend(rval["resources"])
+        if rval.get("packages"):
+            self.maybe_packages.update(rval["packages"])
+            if update_graph:
+                find_needed_modules(mf, packages=rval["packages"])
 
-                if rval.get("frameworks"):
-                    self.frameworks.extend(rval["frameworks"])
+        for pkg in rval.get("flatpackages", ()):
+            if isinstance(pkg, str):
+                pkg = (os.path.basename(pkg), pkg)
+            flatpackages[pkg[0]] = pkg[1]
+        filters.extend(rval.get("filters", ()))
+        loader_files.extend(rval.get("loader_files", ()))
+        newbootstraps = list(map(self.get_bootstrap, rval.get("prescripts", ())))
 
-                if rval.get("use_old_sdk"):
-                    self.use_old_sdk = True
+        if rval.get("includes") and update_graph:
+            find_needed_modules(mf, includes=rval["includes"])
 
-                for fn in newbootstraps:
-                    if isinstance(fn, str):
-                        mf.run_script(fn)
+        if rval.get("resources"):
+            self.resources.extend(rval["resources"])
 
-                self.target.prescripts.extend(newbootstraps)
-                break
-            else:
-                break
+        if rval.get("frameworks"):
+            self.frameworks.extend(rval["frameworks"])
+
+        if rval.get("use_old_sdk"):
+            self.use_old_sdk = True
+
+        if update_graph:
+            for fn in newbootstraps:
+                if isinstance(fn, str):
+                    mf.run_script(fn)
+
+        self.target.prescripts.extend(newbootstraps)
 
     def _run(self):
         try:
@@ -1044,6 +1329,14 @@ class py2app(Command):
                 self.run_alias()
             else:
                 self.run_normal()
+
+            self.prune_bytecode_cache()
+
+            if self.incremental:
+                self.update_dist_dir()
+
+            if self.size_attribution is not None and not self.alias:
+                self.write_size_report()
         except:  # noqa: E722,B001
             raise
             # import pdb
@@ -1057,12 +1350,57 @@ class py2app(Command):
 
     def filter_dependencies(self, mf, filters):
         self.progress.info("*** filtering dependencies ***")
-        nodes_seen, nodes_removed, nodes_orphaned = mf.filterStack(filters)
+        with self.progress.span("filter_dependencies") as info:
+            nodes_seen, nodes_removed, nodes_orphaned = mf.filterStack(filters)
+            info["removed"] = nodes_removed
         self.progress.info("%d total" % (nodes_seen,))
         self.progress.info("%d filtered" % (nodes_removed,))
         self.progress.info("%d orphaned" % (nodes_orphaned,))
         self.progress.info("%d remaining" % (nodes_seen - nodes_removed,))
 
+    def update_dist_dir(self):
+        """
+        Move the bundles from the staging directory into
+        the dist directory (``--incremental``)
+        """
+        self.progress.info(f"*** updating {self.final_dist_dir} ***")
+        stats = sync_dist_dir(
+            self.dist_dir,
+            self.final_dist_dir,
+            os.path.join(self.cache_dir, "manifests"),
+            self.reuse_plan,
+        )
+        self.progress.info(stats.report())
+        self.progress.info(
+            f"{self.reuse_plan.reused} files reused from the previous build"
+        )
+
+        # Paths in app_files should refer to the final location.
+        self.app_files = [
+            os.path.join(self.final_dist_dir, os.path.relpath(fn, self.dist_dir))
+            for fn in self.app_files
+        ]
+        self.dist_dir = self.final_dist_dir
+
+    def write_size_report(self):
+        """
+        Attribute the size of the bundle to the distributions and
+        packages it contains (``--size-report``)
+        """
+        with self.progress.span("size report"):
+            report = self.size_attribution.report(
+                self.app_files[-1],
+                self.target.appdir,
+                self.metadata_index,
+                self.get_path_classifier(),
+            )
+            report.save(self.size_report)
+
+        self.progress.info(f"*** size of {report.bundle} ***")
+        for line in report.format_table():
+            self.progress.info(line)
+        self.progress.info(f"size report written to {self.size_report}")
+
     def get_appname(self):
         return self.plist["CFBundleName"]
 
@@ -1089,6 +1427,9 @@ class py2app(Command):
             mf.graphreport(fp, flatpackages=flatpackages)
 
     def finalize_modulefinder(self, mf):
+        from modulegraph.find_modules import parse_mf_results
+        from modulegraph.modulegraph import Package, Script
+
         for item in mf.flatten():
             if (
                 item.identifier in self.maybe_packages
@@ -1135,6 +1476,141 @@ class py2app(Command):
             )
         )
 
+    def get_path_classifier(self):
+        """
+        Return the classifier for the locations of files
+        (standard library or included package), this is
+        created once per build.
+        """
+        if self._path_classifier is None:
+            from py2app.filters import PathClassifier
+
+            self._path_classifier = PathClassifier(
+                sys.prefix, self.collect_packagedirs()
+            )
+        return self._path_classifier
+
+    def not_stdlib_filter(self, module):
+        """
+        Filter for the module graph that removes modules
+        located in the standard library.
+        """
+        if module.filename is None:
+            return True
+        return not self.get_path_classifier().is_stdlib(module.filename)
+
+    def get_bytecode_cache(self):
+        """
+        Return the persistent bytecode cache, or None when
+        the cache is not enabled.
+        """
+        if not self.bytecode_cache:
+            return None
+
+        if self._bytecode_cache is None:
+            self._bytecode_cache = BytecodeCache(
+                os.path.join(self.cache_dir, "bytecode"), self.bytecode_cache_size
+            )
+        return self._bytecode_cache
+
+    def prune_bytecode_cache(self):
+        """
+        Keep the bytecode cache below its maximum size, this
+        is done once at the end of a build.
+        """
+        if self._bytecode_cache is not None and not self.dry_run:
+            with self.progress.span("prune bytecode cache"):
+                removed = self._bytecode_cache.prune()
+            self.progress.trace(f"bytecode cache: removed {removed} entries")
+            self.progress.info(self._bytecode_cache.report())
+
+    def get_global_names_cache(self):
+        """
+        Return the cache for the global names read by modules,
+        used by the detect_dunder_file recipe.
+        """
+        if self._global_names_cache is None:
+            from py2app._global_names import GlobalNamesCache
+
+            self._global_names_cache = GlobalNamesCache(
+                os.path.join(self.cache_dir, "global-names.json"), self.jobs
+            )
+        return self._global_names_cache
+
+    def get_macho_cache(self):
+        """
+        Return the cache for the headers of Mach-O files, shared
+        by the macholib phase and by stripping and signing.
+        """
+        if self._macho_cache is None:
+            self._macho_cache = MachOCache(
+                os.path.join(self.cache_dir, "macho-cache.json")
+            )
+        return self._macho_cache
+
+    def save_macho_cache(self):
+        if self._macho_cache is not None:
+            self._macho_cache.save()
+            self.progress.info(self._macho_cache.report())
+
+    def check_missing_imports(self, names):
+        """
+        Check the names that modulegraph couldn't find without
+        importing them in the py2app process, returns a mapping
+        from name to one of the results in py2app._import_check.
+        """
+        from py2app._import_check import ImportChecker
+
+        checker = ImportChecker(
+            os.path.join(self.cache_dir, "import-check.json"), self.jobs
+        )
+        status = checker.check(sorted(names))
+        checker.save()
+
+        self.progress.info(checker.report())
+        for name in checker.failed:
+            self.progress.info(f"checking {name!r} failed or timed out")
+        return status
+
+    def missing_import_warnings(self, missing, status):
+        from py2app._import_check import MISSING, MODULE
+
+        warnings = []
+        for m in sorted(missing):
+            if not self.may_log_missing(m):
+                continue
+
+            referers = ", ".join(sorted(missing[m]))
+            if status[m] == MISSING:
+                warnings.append(f" * {m} ({referers})")
+            elif status[m] == MODULE:
+                warnings.append(f" * {m} ({referers}) [module alias]")
+        return warnings
+
+    def get_graph_cache(self):
+        """
+        Return the cache for the module dependency graph, or None
+        when the cache is disabled.
+        """
+        if self.no_graph_cache or self.debug_modulegraph:
+            return None
+
+        # Everything that affects the graph other than the
+        # contents of the files in the graph.
+        key = (
+            list(sys.path),
+            sorted(self.collect_scripts()),
+            sorted(self.includes),
+            sorted(self.packages),
+            sorted(self.excludes),
+            sorted(self.matplotlib_backends or ()),
+            sorted(self.qt_plugins or ()),
+            self.semi_standalone,
+        )
+        from py2app._graph_cache import GraphCache
+
+        return GraphCache(os.path.join(self.cache_dir, "modulegraph.pickle"), key)
+
     def may_log_missing(self, module_name):
         module_parts = module_name.split(".")
         for num_parts in range(1, len(module_parts) + 1):
@@ -1145,11 +1621,46 @@ class py2app(Command):
         return True
 
     def run_normal(self):
-        mf = self.get_modulefinder()
+        from modulegraph import modulegraph
+
+        from py2app._libarchive import startup_entries
+
+        graph_cache = self.get_graph_cache()
+        mf = recipe_results = None
+        if graph_cache is not None:
+            with self.progress.span("load module graph cache"):
+                mf, recipe_results = graph_cache.load(
+                    scripts=self.collect_scripts(),
+                    includes=self.includes,
+                    packages=self.packages,
+                    excludes=self.excludes,
+                )
+            if mf is None:
+                self.progress.info("module graph cache: no usable cache")
+            else:
+                self.progress.info(graph_cache.report())
+
+        if mf is None:
+            with self.progress.span("modulegraph"):
+                mf = self.get_modulefinder()
         filters = self.collect_filters()
         flatpackages = {}
         loader_files = []
-        self.process_recipes(mf, filters, flatpackages, loader_files)
+        if recipe_results is not None:
+            self.replay_recipes(recipe_results, filters, flatpackages, loader_files)
+            with self.progress.span("recipes"):
+                self.process_recipes(
+                    mf, filters, flatpackages, loader_files, names=recipes.ALWAYS_RUN
+                )
+        else:
+            recipe_results = []
+            with self.progress.span("recipes"):
+                self.process_recipes(
+                    mf, filters, flatpackages, loader_files, recipe_results
+                )
+            if graph_cache is not None:
+                with self.progress.span("save module graph cache"):
+                    graph_cache.save(mf, recipe_results)
 
         if self.debug_modulegraph:
             import pdb
@@ -1163,10 +1674,15 @@ class py2app(Command):
         if self.xref:
             self.build_xref(mf, flatpackages)
 
-        py_files, extensions = self.finalize_modulefinder(mf)
+        with self.progress.span("finalize_modulefinder"):
+            py_files, extensions = self.finalize_modulefinder(mf)
+
+        if self.compression_policy == "startup-optimized":
+            self.startup_entries = startup_entries(mf, self.collect_scripts())
 
         pkgdirs = self.collect_packagedirs()
-        self.create_binaries(py_files, pkgdirs, extensions, loader_files)
+        with self.progress.span("create_binaries"):
+            self.create_binaries(py_files, pkgdirs, extensions, loader_files)
 
         missing = []
         syntax_error = []
@@ -1224,43 +1740,15 @@ class py2app(Command):
                     else:
                         missing_unconditional[module.identifier].add(m.identifier)
 
-            if missing_unconditional:
-                warnings = []
-                for m in sorted(missing_unconditional):
-                    try:
-                        if "." in m:
-                            m1, m2 = m.rsplit(".", 1)
-                            try:
-                                o = __import__(m1, fromlist=[m2])
-                                o = getattr(o, m2)
-                            except Exception:
-                                if self.may_log_missing(m):
-                                    warnings.append(
-                                        " * %s (%s)"
-                                        % (
-                                            m,
-                                            ", ".join(sorted(missing_unconditional[m])),
-                                        )
-                                    )
-                                continue
-
-                        else:
-                            o = __import__(m)
-
-                        if isinstance(o, types.ModuleType):
-                            if self.may_log_missing(m):
-                                warnings.append(
-                                    " * %s (%s) [module alias]"
-                                    % (m, ", ".join(sorted(missing_unconditional[m])))
-                                )
-
-                    except ImportError:
-                        if self.may_log_missing(m):
-                            warnings.append(
-                                " * %s (%s)"
-                                % (m, ", ".join(sorted(missing_unconditional[m])))
-                            )
+            names = set(missing_unconditional)
+            if not self.no_report_missing_conditional_import:
+                names.update(missing_conditional)
+            status = self.check_missing_imports(
+                {m for m in names if self.may_log_missing(m)}
+            )
 
+            if missing_unconditional:
+                warnings = self.missing_import_warnings(missing_unconditional, status)
                 if len(warnings) > 0:
                     self.progress.warning("Modules not found (unconditional imports):")
                     for msg in warnings:
@@ -1268,50 +1756,7 @@ class py2app(Command):
                     self.progress.warning("")
 
             if missing_conditional and not self.no_report_missing_conditional_import:
-                warnings = []
-                for m in sorted(missing_conditional):
-                    try:
-                        if "." in m:
-                            m1, m2 = m.rsplit(".", 1)
-                            o = __import__(m1, fromlist=[m2])
-                            try:
-                                o = getattr(o, m2)
-                            except Exception:
-                                if self.may_log_missing(m):
-                                    warnings.append(
-                                        " * %s (%s)"
-                                        % (
-                                            m,
-                                            ", ".join(sorted(missing_unconditional[m])),
-                                        )
-                                    )
-                                continue
-
-                        else:
-                            try:
-                                o = __import__(m)
-                            except:  # noqa: E722, B001
-                                # Import may fail with other exceptions as well...
-                                if self.may_log_missing(m):
-                                    warnings.append(
-                                        " * %s (%s)"
-                                        % (m, ", ".join(sorted(missing_conditional[m])))
-                                    )
-                                continue
-
-                        if isinstance(o, types.ModuleType):
-                            if self.may_log_missing(m):
-                                warnings.append(
-                                    " * %s (%s) [module alias]"
-                                    % (m, ", ".join(sorted(missing_unconditional[m])))
-                                )
-                    except ImportError:
-                        if self.may_log_missing(m):
-                            warnings.append(
-                                " * %s (%s)"
-                                % (m, ", ".join(sorted(missing_conditional[m])))
-                            )
-
+                warnings = self.missing_import_warnings(missing_conditional, status)
                 if len(warnings) > 0:
                     self.progress.warning("Modules not found (conditional imports):")
                     for msg in warnings:
@@ -1388,15 +1833,24 @@ class py2app(Command):
         if os.path.exists(self.bdist_dir):
             shutil.rmtree(self.bdist_dir)
 
-        self.collect_dir = os.path.abspath(os.path.join(self.bdist_dir, "collect"))
-        self.mkpath(self.collect_dir)
-
         self.temp_dir = os.path.abspath(os.path.join(self.bdist_dir, "temp"))
         self.mkpath(self.temp_dir)
 
         self.dist_dir = os.path.abspath(self.dist_dir)
         self.mkpath(self.dist_dir)
 
+        if self.incremental:
+            # Bundles are assembled in a staging directory, after
+            # which only changed files are updated in the dist directory.
+            self.final_dist_dir = self.dist_dir
+            self.dist_dir = os.path.join(self.bdist_dir, "staging")
+            self.mkpath(self.dist_dir)
+            self.reuse_plan = ReusePlan(
+                self.dist_dir,
+                self.final_dist_dir,
+                os.path.join(self.cache_dir, "manifests"),
+            )
+
         self.lib_dir = os.path.join(
             self.bdist_dir,
             os.path.dirname(get_zipfile(self.distribution, self.semi_standalone)),
@@ -1411,58 +1865,62 @@ class py2app(Command):
 
     def create_binaries(self, py_files, pkgdirs, extensions, loader_files):
         self.progress.info("*** create binaries ***")
-        dist = self.distribution
         pkgexts = []
         copyexts = []
         extmap = {}
         included_metadata = set()
 
-        metadata_infos = scan_for_metadata(sys.path)
+        with self.progress.span("metadata scan") as info:
+            metadata_index = MetadataIndex(
+                sys.path, os.path.join(self.cache_dir, "metadata-index.json")
+            )
+            info["distributions"] = metadata_index.distributions
+            info["rescanned"] = metadata_index.rescanned
+        self.metadata_index = metadata_index
 
-        def packagefilter(mod, pkgdirs=pkgdirs):
-            fn = os.path.realpath(getattr(mod, "filename", None))
-            if fn is None:
+        classifier = self.get_path_classifier()
+
+        def packagefilter(mod):
+            fn = getattr(mod, "filename", None)
+            if fn is None or classifier.in_package(fn):
                 return None
-            for pkgdir in pkgdirs:
-                if fn.startswith(pkgdir):
-                    return None
-            return fn
+            return classifier.realpath(fn)
 
         for mod in py_files + extensions:
-            fn = os.path.realpath(getattr(mod, "filename", None))
+            fn = getattr(mod, "filename", None)
             if fn is None:
-                return None
+                continue
 
-            dist_info_path = metadata_infos.get(fn, None)
-            if dist_info_path is None and (fn.endswith(".pyc") or fn.endswith(".pyo")):
-                dist_info_path = metadata_infos.get(fn[:-1], None)
+            dist_info_path = metadata_index.owner(fn)
             if dist_info_path is not None:
                 included_metadata.add(dist_info_path)
 
+            if self.size_attribution is not None:
+                self.size_attribution.add_module(mod.identifier, fn)
+
         def files_in_dir(toplevel):
             for dirname, _, fns in os.walk(toplevel):
                 for fn in fns:
-                    yield os.path.realpath(os.path.join(dirname, fn))
+                    yield os.path.join(dirname, fn)
 
         for pd in pkgdirs:
             # Ensure that packages included through the packages option
             # get their metadata included as well, even if the python
             # package contains files from multiple package distributions
             for fn in files_in_dir(pd):
-                dist_info_path = metadata_infos.get(fn, None)
-                if dist_info_path is None and (
-                    fn.endswith(".pyc") or fn.endswith(".pyo")
-                ):
-                    dist_info_path = metadata_infos.get(fn[:-1], None)
+                dist_info_path = metadata_index.owner(fn)
                 if dist_info_path is not None:
                     included_metadata.add(dist_info_path)
 
+        metadata_index.save()
+        self.progress.info(metadata_index.report())
+
         if pkgdirs:
             py_files = list(filter(packagefilter, py_files))
         for ext in extensions:
             fn = packagefilter(ext)
             if fn is None:
-                fn = os.path.realpath(getattr(ext, "filename", None))
+                fn = classifier.realpath(ext.filename)
                 pkgexts.append(ext)
             else:
                 if "." in ext.identifier:
@@ -1470,61 +1928,12 @@ class py2app(Command):
                 copyexts.append(ext)
             extmap[fn] = ext
 
-        # byte compile the python modules into the target directory
-        self.progress.info("*** byte compile python files ***")
-        byte_compile(
-            py_files,
-            target_dir=self.collect_dir,
-            optimize=self.optimize,
-            force=self.force,
-            progress=self.progress,
-            dry_run=self.dry_run,
-        )
-
-        for item in py_files:
-            if not isinstance(item, Package):
-                continue
-            self.copy_package_data(item, self.collect_dir)
-
-        # copy package metadata
-        for pkg_info_path in included_metadata:
-            base = os.path.join(self.collect_dir, os.path.basename(pkg_info_path))
-            os.mkdir(base)
-
-            for fn in os.listdir(pkg_info_path):
-                if fn in IGNORED_DISTINFO:
-                    continue
-                src = os.path.join(pkg_info_path, fn)
-                dst = os.path.join(base, fn)
-
-                if os.path.isdir(src):
-                    self.copy_tree(src, dst, preserve_symlinks=False)
-                else:
-                    self.copy_file(src, dst)
         self.lib_files = []
         self.app_files = []
 
-        # create the shared zipfile containing all Python modules
-        archive_name = os.path.join(
-            self.lib_dir, get_zipfile(dist, self.semi_standalone)
-        )
-
-        for path, files in loader_files:
-            dest = os.path.join(self.collect_dir, path)
-            self.mkpath(dest)
-            for fn in files:
-                destfn = os.path.join(dest, os.path.basename(fn))
-                if os.path.isdir(fn):
-                    self.copy_tree(fn, destfn, preserve_symlinks=False)
-                else:
-                    self.copy_file(fn, destfn)
-
-        arcname = self.make_lib_archive(
-            archive_name,
-            base_dir=self.collect_dir,
-            verbose=self.verbose,
-            dry_run=self.dry_run,
-        )
+        # The zipfile with Python modules is written by build_executable,
+        # directly in the application bundle.
+        lib_contents = (py_files, sorted(included_metadata), loader_files)
 
         # build the executables
         extra_scripts = list(self.extra_scripts)
@@ -1532,7 +1941,12 @@ class py2app(Command):
             extra_scripts.extend(self.target.extra_scripts)
 
         dst = self.build_executable(
-            self.target, arcname, pkgexts, copyexts, self.target.script, extra_scripts
+            self.target,
+            lib_contents,
+            pkgexts,
+            copyexts,
+            self.target.script,
+            extra_scripts,
         )
         exp = os.path.join(dst, "Contents", "MacOS")
         execdst = os.path.join(exp, "python")
@@ -1603,27 +2017,50 @@ class py2app(Command):
                         info["location"], info["shortname"] + ".framework"
                     )
                 mm.excludes.append(exclude)
-            for fmwk in self.frameworks:
-                mm.mm.run_file(fmwk)
-            platfiles = mm.run()
+            with self.progress.span("macholib standalone") as info:
+                for fmwk in self.frameworks:
+                    mm.mm.run_file(fmwk)
+                platfiles = mm.run()
+                info["files"] = len(platfiles)
+
+            if self.thin_arch is not None:
+                with self.progress.span("thin"):
+                    self.thin_files(platfiles)
+
+            if self.dedup_dylibs and not self.dry_run:
+                with self.progress.span("dedup dylibs"):
+                    platfiles = self.dedup_files(platfiles)
 
             if self.strip:
-                platfiles = self.strip_dsym(platfiles)
-                self.strip_files(platfiles)
+                with self.progress.span("strip"):
+                    platfiles = self.strip_dsym(platfiles)
+                    self.strip_files(platfiles)
 
             arch = self.arch if self.arch is not None else get_platform().split("-")[-1]
 
             if arch in ("universal2", "arm64"):
-                codesign_adhoc(self.target.appdir, self.progress)
+                with self.progress.span("codesign"):
+                    codesign_adhoc(
+                        self.target.appdir,
+                        self.progress,
+                        jobs=self.jobs,
+                        macho_cache=self.get_macho_cache(),
+                    )
+
+            self.save_macho_cache()
         self.app_files.append(dst)
 
-    def copy_package_data(self, package, target_dir):
+    def iter_package_data(self, package):
         """
-        Copy any package data in a python package into the target_dir.
+        Yield the package data in a python package as tuples of
+        the path and the name relative to the package directory.
+        The path can be a directory.
 
         This is a bit of a hack, it would be better to identify python eggs
         and copy those in whole.
         """
+        import imp
+
         exts = [i[0] for i in imp.get_suffixes()]
         exts.append(".py")
         exts.append(".pyc")
@@ -1635,7 +2072,6 @@ class py2app(Command):
                     return False
             return True
 
-        target_dir = os.path.join(target_dir, *(package.identifier.split(".")))
         for dname in package.packagepath:
             filenames = list(filter(datafilter, zipio.listdir(dname)))
             for fname in filenames:
@@ -1660,12 +2096,7 @@ class py2app(Command):
                             break
 
                     else:
-                        if os.path.isfile(pth):
-                            # Avoid extracting a resource file that happens
-                            # to be zipfile.
-                            copy_file(pth, os.path.join(target_dir, fname))
-                        else:
-                            copy_tree(pth, os.path.join(target_dir, fname))
+                        yield pth, fname
                     continue
 
                 elif zipio.isdir(pth) and (
@@ -1679,7 +2110,7 @@ class py2app(Command):
                     pass
 
                 else:
-                    copy_file(pth, os.path.join(target_dir, fname))
+                    yield pth, fname
 
     def strip_dsym(self, platfiles):
         """Remove .dSYM directories in the bundled application"""
@@ -1698,19 +2129,46 @@ class py2app(Command):
                     dnames.remove(nm)
         return [file for file in platfiles if ".dSYM" not in file]
 
+    def thin_files(self, files):
+        universal, thinned = thin_files(
+            sorted(files),
+            self.thin_arch,
+            dry_run=self.dry_run,
+            progress=self.progress,
+        )
+        self.progress.info(
+            f"thinning to {self.thin_arch} saved {universal - thinned} bytes "
+            f"({thinned} / {universal})",
+        )
+        self.progress.count("bytes saved by thinning", universal - thinned)
+
+    def dedup_files(self, files):
+        result = dedup_dylibs(
+            self.target.appdir,
+            files,
+            progress=self.progress,
+            macho_cache=self.get_macho_cache(),
+        )
+        self.progress.info(
+            f"replaced {result.duplicates} duplicate dylibs by links, "
+            f"saved {result.saved} bytes",
+        )
+        self.progress.count("bytes saved by dedup", result.saved)
+        return result.files
+
     def strip_files(self, files):
-        unstripped = 0
-        stripfiles = []
-        for fn in files:
-            unstripped += os.stat(fn).st_size
-            stripfiles.append(fn)
-        strip_files(stripfiles, dry_run=self.dry_run, progress=self.progress)
-        stripped = 0
-        for fn in stripfiles:
-            stripped += os.stat(fn).st_size
+        unstripped, stripped = strip_files(
+            files,
+            dry_run=self.dry_run,
+            progress=self.progress,
+            strip_tool=self.strip_tool,
+            jobs=self.jobs,
+            macho_cache=self.get_macho_cache(),
+        )
         self.progress.info(
             f"stripping saved {unstripped - stripped} bytes ({stripped} / {unstripped})",
         )
+        self.progress.count("bytes saved by strip", unstripped - stripped)
 
     def copy_dylib(self, src, dst):
         # will be copied from the framework?
@@ -2007,6 +2465,8 @@ class py2app(Command):
     def get_bootstrap(self, bootstrap):
         if isinstance(bootstrap, str):
             if not os.path.exists(bootstrap):
+                from modulegraph.util import imp_find_module
+
                 bootstrap = imp_find_module(bootstrap)[1]
         return bootstrap
 
@@ -2168,7 +2628,7 @@ class py2app(Command):
         while todo:
             upcoming = []
             for item in todo:
-                for s, d in loader_paths(*item):
+                for s, d in loader_paths(*item, self.get_macho_cache()):
                     if os.path.exists(d):
                         continue
                     upcoming.append((s, d))
@@ -2176,11 +2636,15 @@ class py2app(Command):
                         if not os.path.exists(os.path.dirname(d)):
                             os.makedirs(os.path.dirname(d))
                     copy_file(s, d, dry_run=self.dry_run)
+                    if self.size_attribution is not None:
+                        self.size_attribution.add_origin(d, s)
             todo = upcoming
 
     def build_executable(
-        self, target, arcname, pkgexts, copyexts, script, extra_scripts
+        self, target, lib_contents, pkgexts, copyexts, script, extra_scripts
     ):
+        from modulegraph.modulegraph import SourceModule
+
         # Build an executable for the target
         appdir, resdir, plist = self.create_bundle(target, script)
         self.appdir = appdir
@@ -2210,6 +2674,7 @@ class py2app(Command):
             force=self.force,
             progress=self.progress,
             dry_run=self.dry_run,
+            cache=self.get_bytecode_cache(),
         )
         if not self.dry_run:
             os.unlink(site_path)
@@ -2300,7 +2765,13 @@ class py2app(Command):
             self.mkpath(inc_dir)
             self.copy_file(get_config_h_filename(), os.path.join(inc_dir, "pyconfig.h"))
 
-        self.copy_file(arcname, arcdir)
+        self.make_lib_archive(
+            os.path.join(
+                arcdir,
+                os.path.basename(get_zipfile(self.distribution, self.semi_standalone)),
+            ),
+            *lib_contents,
+        )
 
         self.copy_file(zlib.__file__, os.path.dirname(arcdir))
 
@@ -2318,8 +2789,7 @@ class py2app(Command):
                 # For semi-standalone builds don't copy packages
                 # from the stdlib into the app bundle, even when
                 # they are mentioned in self.packages.
-                p = Package(pkg_name, pkg)
-                if not not_stdlib_filter(p):
+                if self.get_path_classifier().is_stdlib(pkg):
                     continue
 
             dst = os.path.join(pydir, pkg_name)
@@ -2328,6 +2798,10 @@ class py2app(Command):
                 self.copy_tree(pkg, dst)
             else:
                 self.copy_file(pkg, dst + ".py")
+                dst += ".py"
+
+            if self.size_attribution is not None:
+                self.size_attribution.add_origin(dst, pkg)
 
             # The python files should be bytecompiled
             # here (see issue 101)
@@ -2342,6 +2816,8 @@ class py2app(Command):
             )
             self.mkpath(os.path.dirname(fn))
             copy_file(copyext.filename, fn, dry_run=self.dry_run)
+            if self.size_attribution is not None:
+                self.size_attribution.add_origin(fn, copyext.filename)
 
             # MachoStandalone does not support '@loader_path' (and cannot in its
             # current form). Check for "@loader_path" in the load commands of
@@ -2353,7 +2829,9 @@ class py2app(Command):
             if src == dest:
                 continue
             makedirs(os.path.dirname(dest))
-            copy_resource(src, dest, dry_run=self.dry_run)
+            copy_resource(src, dest, dry_run=self.dry_run, reuse=self.reuse_plan)
+            if self.size_attribution is not None and isinstance(src, str):
+                self.size_attribution.add_origin(dest, src)
 
         plugindir = os.path.join(appdir, "Contents", "Library")
         for src, dest in self.iter_extra_plugins():
@@ -2362,12 +2840,14 @@ class py2app(Command):
                 continue
 
             makedirs(os.path.dirname(dest))
-            copy_resource(src, dest, dry_run=self.dry_run)
+            copy_resource(src, dest, dry_run=self.dry_run, reuse=self.reuse_plan)
 
         target.appdir = appdir
         return appdir
 
     def create_loader(self, item):
+        from modulegraph.modulegraph import SourceModule
+
         # Hm, how to avoid needless recreation of this file?
         slashname = item.identifier.replace(".", os.sep)
         pathname = os.path.join(self.temp_dir, "%s.py" % slashname)
@@ -2393,41 +2873,82 @@ class py2app(Command):
                 return
         return SourceModule(item.identifier, pathname)
 
-    def make_lib_archive(self, zip_filename, base_dir, verbose=0, dry_run=0):
-        # Like distutils "make_archive", except we can specify the
-        # compression to use - default is ZIP_STORED to keep the
-        # runtime performance up.
-        # Also, we don't append '.zip' to the filename.
-        from distutils.dir_util import mkpath
+    def make_lib_archive(self, zip_filename, py_files, included_metadata, loader_files):
+        """
+        Create the zipfile with Python modules: the byte-compiled
+        modules in *py_files*, package data, the package metadata
+        directories in *included_metadata* and *loader_files*.
+        """
+        from modulegraph.modulegraph import Package
+
+        from py2app._libarchive import CompressionPolicy, LibArchive
 
-        mkpath(os.path.dirname(zip_filename), dry_run=dry_run)
+        self.mkpath(os.path.dirname(zip_filename))
+        self.progress.info("*** byte compile python files ***")
 
-        if self.compressed:
-            compression = zipfile.ZIP_DEFLATED
-        else:
-            compression = zipfile.ZIP_STORED
-        if not dry_run:
-            z = zipfile.ZipFile(zip_filename, "w", compression=compression)
-            save_cwd = os.getcwd()
-            os.chdir(base_dir)
-            for dirpath, _dirnames, filenames in os.walk("."):
-                if filenames:
-                    # Ensure that there are directory entries for
-                    # all directories in the zipfile. This is a
-                    # workaround for <http://bugs.python.org/issue14905>:
-                    # zipimport won't consider 'pkg/foo.py' to be in
-                    # namespace package 'pkg' unless there is an
-                    # entry for the directory (or there is a
-                    # pkg/__init__.py file as well)
-                    z.write(dirpath, dirpath)
-
-                for fn in filenames:
-                    path = os.path.normpath(os.path.join(dirpath, fn))
-                    if os.path.isfile(path):
-                        z.write(path, path)
-
-            os.chdir(save_cwd)
-            z.close()
+        if self.dry_run:
+            byte_compile_to_archive(
+                py_files,
+                None,
+                optimize=self.optimize,
+                progress=self.progress,
+                dry_run=1,
+            )
+            return zip_filename
+
+        policy = CompressionPolicy(
+            self.compression_policy, self.compression_rules, self.startup_entries
+        )
+        with self.progress.span("zip creation") as info:
+            with LibArchive(zip_filename, policy, self.jobs) as archive:
+                with self.progress.span("byte_compile", modules=len(py_files)):
+                    byte_compile_to_archive(
+                        py_files,
+                        archive,
+                        optimize=self.optimize,
+                        progress=self.progress,
+                        cache=self.get_bytecode_cache(),
+                        jobs=self.jobs,
+                    )
+
+                for item in py_files:
+                    if not isinstance(item, Package):
+                        continue
+                    prefix = item.identifier.replace(".", "/")
+                    for path, relpath in self.iter_package_data(item):
+                        arcname = prefix + "/" + relpath
+                        if zipio.isdir(path) and not os.path.isfile(path):
+                            archive.add_tree(path, arcname, skipscm)
+                        else:
+                            archive.add_file(path, arcname)
+
+                # copy package metadata
+                for pkg_info_path in included_metadata:
+                    base = os.path.basename(pkg_info_path)
+                    for fn in sorted(os.listdir(pkg_info_path)):
+                        if fn in IGNORED_DISTINFO:
+                            continue
+                        src = os.path.join(pkg_info_path, fn)
+                        if os.path.isdir(src):
+                            archive.add_tree(src, base + "/" + fn, skipscm)
+                        else:
+                            archive.add_file(src, base + "/" + fn)
+
+                for path, files in loader_files:
+                    for fn in files:
+                        arcname = posixpath.join(path, os.path.basename(fn))
+                        if os.path.isdir(fn):
+                            archive.add_tree(fn, arcname, skipscm)
+                        else:
+                            archive.add_file(fn, arcname)
+
+            for arcname in archive.skipped:
+                self.progress.warning(
+                    f"{os.path.basename(zip_filename)}: skipping duplicate {arcname}"
+                )
+
+            info["bytes"] = os.path.getsize(zip_filename)
+            self.progress.count("zipfile bytes", info["bytes"])
 
         return zip_filename
 
@@ -2458,13 +2979,14 @@ class py2app(Command):
             dry_run=self.dry_run,
             condition=condition,
             progress=self.progress,
+            reuse=self.reuse_plan,
         )
 
     def copy_file(self, infile, outfile):
         """
         This version doesn't bork on existing symlinks
         """
-        return copy_file(infile, outfile, progress=self.progress)
+        return copy_file(infile, outfile, progress=self.progress, reuse=self.reuse_plan)
 
     def mkpath(self, name, mode=0o777):
         if hasattr(self, "progress"):
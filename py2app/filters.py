@@ -1,5 +1,7 @@
+import functools
 import os
 import sys
+import typing
 
 from macholib.util import in_system_path
 from modulegraph import modulegraph
@@ -15,59 +17,133 @@ def has_filename_filter(module):
     return getattr(module, "filename", None) is not None
 
 
-def not_stdlib_filter(module, prefix=None):
+class PathClassifier:
     """
-    Return False if the module is located in the standard library
+    Classify paths as being part of the standard library or as
+    being inside one of the *package_dirs*.
+
+    The prefixes are stored in a trie of path components, which
+    makes a lookup linear in the length of the path instead of in
+    the number of prefixes. Real paths are resolved once per
+    directory.
     """
-    if prefix is None:
-        prefix = sys.prefix
-    if module.filename is None:
-        return True
 
-    prefix = os.path.join(os.path.realpath(prefix), "")
+    def __init__(
+        self,
+        prefix: typing.Optional[str] = None,
+        package_dirs: typing.Iterable[str] = (),
+    ):
+        self._realdirs: typing.Dict[str, str] = {}
+        self._stdlib: dict = {}
+        self._packages: dict = {}
+
+        if prefix is None:
+            prefix = sys.prefix
+        prefix = os.path.realpath(prefix)
+        prefixes = [prefix]
+
+        if os.path.exists(os.path.join(prefix, ".Python")):
+            # Virtualenv
+            fn = os.path.join(
+                prefix,
+                "lib",
+                "python%d.%d" % (sys.version_info[:2]),
+                "orig-prefix.txt",
+            )
+            if os.path.exists(fn):
+                with open(fn) as fp:
+                    prefixes.append(fp.read().strip())
+
+        if hasattr(sys, "base_prefix"):
+            # Venv
+            prefixes.append(os.path.realpath(sys.base_prefix))
+
+        # The first prefix that contains a path is used
+        # to classify it.
+        for priority, dirname in reversed(list(enumerate(prefixes))):
+            self._insert(self._stdlib, dirname, priority)
+
+        for dirname in package_dirs:
+            self._insert(self._packages, os.path.realpath(dirname), True)
+
+    @staticmethod
+    def _insert(trie: dict, path: str, value: typing.Any) -> None:
+        node = trie
+        for part in _split(path):
+            node = node.setdefault(part, {})
+        node[None] = value
+
+    def realpath(self, path: str) -> str:
+        """
+        Like ``os.path.realpath``, with memoized results
+        for directories.
+        """
+        dirname, basename = os.path.split(os.path.abspath(path))
+        realdir = self._realdirs.get(dirname)
+        if realdir is None:
+            realdir = self._realdirs[dirname] = os.path.realpath(dirname)
+
+        result = os.path.join(realdir, basename)
+        if os.path.islink(result):
+            result = os.path.realpath(result)
+        return result
+
+    def is_stdlib(self, path: str) -> bool:
+        """
+        Return True if *path* is located in the standard library,
+        that is in one of the Python prefixes but not in a site
+        directory.
+        """
+        parts = _split(self.realpath(path))
+
+        match = None
+        node = self._stdlib
+        for idx, part in enumerate(parts):
+            node = node.get(part)
+            if node is None:
+                break
+            priority = node.get(None)
+            if priority is not None and (match is None or priority < match[0]):
+                match = (priority, idx + 1)
 
-    rp = os.path.realpath(module.filename)
-    if rp.startswith(prefix):
-        rest = rp[len(prefix) :]  # noqa: E203
-        if "/site-python/" in rest:
-            return True
-        elif "/site-packages/" in rest:
-            return True
-        else:
+        if match is None:
             return False
 
-    if os.path.exists(os.path.join(prefix, ".Python")):
-        # Virtualenv
-        fn = os.path.join(
-            prefix, "lib", "python%d.%d" % (sys.version_info[:2]), "orig-prefix.txt"
-        )
-
-        if os.path.exists(fn):
-            with open(fn) as fp:
-                prefix = fp.read().strip()
-
-            if rp.startswith(prefix):
-                rest = rp[len(prefix) :]  # noqa: E203
-                if "/site-python/" in rest:
-                    return True
-                elif "/site-packages/" in rest:
-                    return True
-                else:
-                    return False
-
-    if hasattr(sys, "base_prefix"):
-        # Venv
-        prefix = os.path.join(os.path.realpath(sys.base_prefix), "")
-        if rp.startswith(prefix):
-            rest = rp[len(prefix) :]  # noqa: E203
-            if "/site-python/" in rest:
-                return True
-            elif "/site-packages/" in rest:
-                return True
-            else:
+        rest = parts[match[1] : -1]  # noqa: E203
+        return "site-packages" not in rest and "site-python" not in rest
+
+    def in_package(self, path: str) -> bool:
+        """
+        Return True if *path* is located in one of the package
+        directories.
+        """
+        node = self._packages
+        for part in _split(self.realpath(path)):
+            node = node.get(part)
+            if node is None:
                 return False
+            if None in node:
+                return True
+        return False
+
+
+def _split(path: str) -> typing.List[str]:
+    return [part for part in path.split(os.sep) if part]
+
+
+@functools.lru_cache(maxsize=None)
+def _stdlib_classifier(prefix: typing.Optional[str]) -> PathClassifier:
+    return PathClassifier(prefix)
+
+
+def not_stdlib_filter(module, prefix=None):
+    """
+    Return False if the module is located in the standard library
+    """
+    if module.filename is None:
+        return True
 
-    return True
+    return not _stdlib_classifier(prefix).is_stdlib(module.filename)
 
 
 def not_system_filter(module):
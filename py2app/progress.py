@@ -4,35 +4,165 @@ Basic progress reporting and logging
 The interface is a work in progress, and might
 be dropped later in favour of direct usage of
 rich.progress
+
+Messages are printed depending on the level:
+
+- 0: Only warnings
+- 1: Messages about the phases of the build, per-file events
+  (such as copying files) are summarized in a task that shows the
+  number of files, bytes and throughput.
+- 2: Also print a line for every per-file event
+
+All messages are written to the log file, when there is one.
 """
-import rich.progress
+import threading
+import time
+
+# Minimal number of seconds between updates of the
+# description of a task that summarizes per-file events.
+UPDATE_INTERVAL = 0.2
+
+
+class _NullSpan:
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+def _format_size(nbytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if nbytes < 1024 or unit == "GB":
+            break
+        nbytes /= 1024
+    if unit == "B":
+        return f"{int(nbytes)} B"
+    return f"{nbytes:.1f} {unit}"
+
+
+class _EventSummary:
+    def __init__(self, description, task_id):
+        self.description = description
+        self.task_id = task_id
+        self.files = 0
+        self.nbytes = 0
+        self.start = time.monotonic()
+        self.updated = 0.0
 
 
 class Progress:
-    def __init__(self, level=2):
-        # XXX: Reduce the default level after finding
-        #      a nicer way to report progress on
-        #      copying files.
+    def __init__(self, level=1, log_file=None):
+        import rich.progress
+
         self._progress = rich.progress.Progress()
         self._progress.start()
         self._level = level
 
+        self._lock = threading.Lock()
+        self._summaries = {}
+        self._log_start = time.monotonic()
+        self._log = None
+        if log_file is not None:
+            self._log = open(log_file, "w", encoding="utf-8")
+
+        # A py2app._profile.BuildProfile when profiling the build
+        self.profile = None
+
+    def span(self, name, category="phase", **args):
+        """
+        Context manager that records the time spent in a phase
+        of the build when profiling, see BuildProfile.span.
+        """
+        if self.profile is None:
+            return _NullSpan()
+        return self.profile.span(name, category, **args)
+
+    def count(self, name, value=1):
+        """
+        Add *value* to a total reported when profiling
+        """
+        if self.profile is not None:
+            self.profile.add(name, value)
+
     def stop(self):
+        with self._lock:
+            for summary in self._summaries.values():
+                self._update_summary(summary)
+                self._progress.stop_task(summary.task_id)
+            self._summaries.clear()
+
         self._progress.stop()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
 
     def add_task(self, name, count):
         return self._progress.add_task(name, total=count)
 
-    def step_task(self, task_id):
-        self._progress.advance(task_id)
+    def step_task(self, task_id, advance=1):
+        self._progress.advance(task_id, advance)
+
+    def stop_task(self, task_id):
+        self._progress.stop_task(task_id)
+
+    def _write_log(self, message):
+        if self._log is not None:
+            with self._lock:
+                self._log.write(
+                    f"[{time.monotonic() - self._log_start:9.3f}] {message}\n"
+                )
 
     def info(self, message):
+        self._write_log(message)
         if self._level >= 1:
             self._progress.print(message)
 
     def trace(self, message):
+        self._write_log(message)
         if self._level >= 2:
             self._progress.print(message)
 
     def warning(self, message):
+        self._write_log(message)
         self._progress.print(f"[red]{message}[/red]")
+
+    def file_event(self, description, message, nbytes=0):
+        """
+        Report an event for a single file (such as copying it),
+        *description* names the kind of event and *nbytes* is
+        the number of bytes processed.
+
+        Below level 2 the event is not printed, but counted in a
+        task named *description* that shows the number of files,
+        the number of bytes and the throughput.
+        """
+        if self._level >= 2:
+            self.trace(message)
+            return
+
+        self._write_log(message)
+        with self._lock:
+            summary = self._summaries.get(description)
+            if summary is None:
+                summary = self._summaries[description] = _EventSummary(
+                    description, self._progress.add_task(description, total=None)
+                )
+            summary.files += 1
+            summary.nbytes += nbytes
+
+            if time.monotonic() - summary.updated >= UPDATE_INTERVAL:
+                self._update_summary(summary)
+
+    def _update_summary(self, summary):
+        now = time.monotonic()
+        summary.updated = now
+        elapsed = now - summary.start
+        rate = summary.nbytes / elapsed if elapsed > 0 else 0
+        self._progress.update(
+            summary.task_id,
+            description=(
+                f"{summary.description}: {summary.files} files, "
+                f"{_format_size(summary.nbytes)} ({_format_size(rate)}/s)"
+            ),
+        )
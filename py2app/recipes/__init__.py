@@ -1,38 +1,109 @@
-from . import PIL  # noqa: F401
-from . import automissing  # noqa: F401
-from . import autopackages  # noqa: F401
-from . import black  # noqa: F401
-from . import ctypes  # noqa: F401
-from . import detect_dunder_file  # noqa: F401
-from . import gcloud  # noqa: F401
-from . import lxml  # noqa: F401
-from . import matplotlib  # noqa: F401
-from . import multiprocessing  # noqa: F401
-from . import opencv  # noqa: F401
-from . import pandas  # noqa: F401
-from . import platformdirs  # noqa: F401
-from . import pydantic  # noqa: F401
-from . import pydoc  # noqa: F401
-from . import pyenchant  # noqa: F401
-from . import pygame  # noqa: F401
-from . import pylsp  # noqa: F401
-from . import pyopengl  # noqa: F401
-from . import pyside  # noqa: F401
-from . import pyside2  # noqa: F401
-from . import pyside6  # noqa: F401
-from . import qt5  # noqa: F401
-from . import qt6  # noqa: F401
-from . import rtree  # noqa: F401
-from . import setuptools  # noqa: F401
-from . import shiboken2  # noqa: F401
-from . import shiboken6  # noqa: F401
-from . import sip  # noqa: F401
-from . import six  # noqa: F401
-from . import sphinx  # noqa: F401
-from . import sqlalchemy  # noqa: F401
-from . import sslmod  # noqa: F401
-from . import sysconfig_module  # noqa: F401
-from . import tkinter  # noqa: F401
-from . import virtualenv  # noqa: F401
-from . import wx  # noqa: F401
-from . import zmq  # noqa: F401
+"""
+Recipes for packages that need special handling
+
+``RECIPES`` maps the name of every recipe to the module that
+implements it and the names of the modules that trigger it. Recipe
+modules are only imported when one of their triggers is found in the
+module graph. The triggers are None for recipes that look at the
+entire graph, those are always imported.
+
+The results of recipes are stored in the module graph cache and are
+reused in the next build when the graph and the installed distributions
+didn't change. Recipes in ``ALWAYS_RUN`` are run again in every build,
+their results depend on other state (environment variables, the Tcl/Tk
+and OpenSSL installation, files in system locations) or they change
+global state of the build process.
+"""
+import importlib
+
+RECIPES = {
+    "PIL": ("py2app.recipes.PIL", ("Image", "PIL.Image")),
+    "automissing": (
+        "py2app.recipes.automissing",
+        ("importlib", "mimetypes", "os", "re", "subprocess", "uuid"),
+    ),
+    "autopackages": (
+        "py2app.recipes.autopackages",
+        (
+            "botocore",
+            "docutils",
+            "pylint",
+            "h5py",
+            "Crypto",
+            "sentencepiece",
+            "imageio_ffmpeg",
+            "numpy",
+            "scipy",
+            "tensorflow",
+        ),
+    ),
+    "black": ("py2app.recipes.black", ("black",)),
+    "ctypes": ("py2app.recipes.ctypes", ("ctypes",)),
+    "detect_dunder_file": ("py2app.recipes.detect_dunder_file", None),
+    "gcloud": ("py2app.recipes.gcloud", ("gcloud",)),
+    "lxml": (
+        "py2app.recipes.lxml",
+        ("lxml", "lxml.etree", "lxml.objectify", "lxml.isoschematron"),
+    ),
+    "matplotlib": ("py2app.recipes.matplotlib", ("matplotlib",)),
+    "multiprocessing": ("py2app.recipes.multiprocessing", ("multiprocessing",)),
+    "opencv": ("py2app.recipes.opencv", ("cv2",)),
+    "pandas": ("py2app.recipes.pandas", ("pandas",)),
+    "platformdirs": ("py2app.recipes.platformdirs", ("platformdirs",)),
+    "pydantic": ("py2app.recipes.pydantic", ("pydantic",)),
+    "pydoc": ("py2app.recipes.pydoc", ("pydoc",)),
+    "pyenchant": ("py2app.recipes.pyenchant", ("enchant",)),
+    "pygame": ("py2app.recipes.pygame", ("pygame",)),
+    "pylsp": ("py2app.recipes.pylsp", ("pylsp",)),
+    "pyopengl": ("py2app.recipes.pyopengl", ("OpenGL",)),
+    "pyside": ("py2app.recipes.pyside", ("PySide",)),
+    "pyside2": ("py2app.recipes.pyside2", ("PySide2",)),
+    "pyside6": ("py2app.recipes.pyside6", ("PySide6",)),
+    "qt5": ("py2app.recipes.qt5", ("PyQt5",)),
+    "qt6": ("py2app.recipes.qt6", ("PyQt6",)),
+    "rtree": ("py2app.recipes.rtree", ("rtree",)),
+    "setuptools": ("py2app.recipes.setuptools", ("pkg_resources",)),
+    "shiboken2": ("py2app.recipes.shiboken2", ("shiboken2",)),
+    "shiboken6": ("py2app.recipes.shiboken6", ("shiboken6",)),
+    "sip": ("py2app.recipes.sip", None),
+    "six": ("py2app.recipes.six", None),
+    "sphinx": ("py2app.recipes.sphinx", ("sphinx",)),
+    "sqlalchemy": ("py2app.recipes.sqlalchemy", ("sqlalchemy",)),
+    "sslmod": ("py2app.recipes.sslmod", ("ssl",)),
+    "sysconfig_module": ("py2app.recipes.sysconfig_module", ("sysconfig",)),
+    "tkinter": ("py2app.recipes.tkinter", ("_tkinter",)),
+    "virtualenv": ("py2app.recipes.virtualenv", ("distutils",)),
+    "wx": ("py2app.recipes.wx", ("wx.lib.pubsub",)),
+    "zmq": ("py2app.recipes.zmq", ("zmq",)),
+}
+
+ALWAYS_RUN = frozenset(
+    {"pyenchant", "pyside", "pyside2", "pyside6", "sip", "sslmod", "tkinter"}
+)
+
+
+def load_recipe(name):
+    """
+    Import the recipe *name* and return its check function
+    """
+    module, _triggers = RECIPES[name]
+    return importlib.import_module(module).check
+
+
+class LazyCheck:
+    """
+    Check function for a recipe that imports the recipe
+    module when it is called for the first time.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._check = None
+
+    def __call__(self, cmd, mf):
+        if self._check is None:
+            self._check = load_recipe(self.name)
+        return self._check(cmd, mf)
+
+    def __repr__(self):
+        return f"<LazyCheck {self.name}>"
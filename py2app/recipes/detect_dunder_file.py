@@ -1,10 +1,7 @@
-import dis
 import os
 
 from modulegraph import modulegraph
 
-from py2app.filters import not_stdlib_filter
-
 
 def get_toplevel_package_name(node):
     if isinstance(node, modulegraph.Package):
@@ -17,27 +14,10 @@ def get_toplevel_package_name(node):
     return None
 
 
-def scan_bytecode_loads(names, co):
-    constants = co.co_consts
-    for inst in dis.get_instructions(co):
-        if inst.opname in ("LOAD_NAME", "LOAD_GLOBAL"):
-            name = co.co_names[inst.arg]
-            names.add(name)
-
-    cotype = type(co)
-    for c in constants:
-        if isinstance(c, cotype):
-            scan_bytecode_loads(names, c)
-
-
-# Only activate this recipe for Python 3.4 or later because
-# scan_bytecode_loads doesn't work on older versions.
-
-
 def check(cmd, mf):
-    packages = set()
+    nodes = []
     for node in mf.flatten():
-        if not not_stdlib_filter(node):
+        if not cmd.not_stdlib_filter(node):
             continue
 
         if node.code is None:
@@ -46,16 +26,30 @@ def check(cmd, mf):
         if node.identifier.startswith(os.path.dirname(os.path.dirname(__file__)) + "/"):
             continue
 
-        if not hasattr(node, "_py2app_global_reads"):
-            names = set()
-            scan_bytecode_loads(names, node.code)
-            node._py2app_global_reads = names
-
+        nodes.append(node)
+
+    todo = {
+        node.identifier: node.code
+        for node in nodes
+        if not hasattr(node, "_py2app_global_reads")
+    }
+    if todo:
+        global_reads = cmd.get_global_names_cache().global_reads(todo)
+        for node in nodes:
+            if node.identifier in global_reads:
+                node._py2app_global_reads = global_reads[node.identifier]
+
+    packages = {}
+    for node in nodes:
         if "__file__" in node._py2app_global_reads:
             pkg = get_toplevel_package_name(node)
             if pkg is not None:
-                packages.add(pkg)
+                packages.setdefault(pkg, []).append(node.identifier)
 
     if packages:
-        return {"packages": packages}
+        for pkg, modules in sorted(packages.items()):
+            cmd.progress.info(
+                f"detect_dunder_file: {pkg!r} uses __file__ in {', '.join(modules)}"
+            )
+        return {"packages": set(packages)}
     return None
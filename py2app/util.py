@@ -1,17 +1,25 @@
 import ast
+import contextlib
 import errno
+import fcntl
 import importlib.metadata
+import importlib.util
+import io
+import marshal
 import os
+import py_compile
+import shutil
 import stat
+import struct
 import subprocess
 import sys
 import time
 import typing
+import zipfile
 
 import macholib.util
 from macholib.util import is_platform_file
 from modulegraph import zipio
-from modulegraph.find_modules import PY_SUFFIXES
 
 gConverterTab = {}
 
@@ -35,9 +43,10 @@ def find_converter(source):
         return None
 
 
-def copy_resource(source, destination, dry_run=0, symlink=0):
+def copy_resource(source, destination, dry_run=0, symlink=0, reuse=None):
     """
-    Copy a resource file into the application bundle
+    Copy a resource file into the application bundle, *reuse*
+    is the ReusePlan for incremental builds.
     """
     if hasattr(source, "getvalue"):
         if not dry_run:
@@ -69,6 +78,7 @@ def copy_resource(source, destination, dry_run=0, symlink=0):
                 os.path.join(destination, fn),
                 dry_run=dry_run,
                 symlink=symlink,
+                reuse=reuse,
             )
 
     else:
@@ -77,7 +87,9 @@ def copy_resource(source, destination, dry_run=0, symlink=0):
                 make_symlink(os.path.abspath(source), destination)
 
         else:
-            copy_file(source, destination, dry_run=dry_run, preserve_mode=True)
+            copy_file(
+                source, destination, dry_run=dry_run, preserve_mode=True, reuse=reuse
+            )
 
 
 def copy_file(
@@ -88,7 +100,13 @@ def copy_file(
     update=False,
     dry_run=0,
     progress=None,
+    reuse=None,
 ):
+    """
+    Copy *source* to *destination*. With a *reuse* plan (a
+    :class:`py2app._bundle_sync.ReusePlan`) the file from the previous
+    build is copied instead when the source didn't change.
+    """
     while True:
         try:
             _copy_file(
@@ -99,6 +117,7 @@ def copy_file(
                 update,
                 dry_run,
                 progress,
+                reuse,
             )
             return
         except OSError as exc:
@@ -107,13 +126,148 @@ def copy_file(
 
             if progress is not None:
                 progress.warning(
-                    "copying file %s failed due to spurious EAGAIN, "
-                    "retrying in 2 seconds",
-                    source,
+                    f"copying file {source} failed due to spurious EAGAIN, "
+                    "retrying in 2 seconds"
                 )
             time.sleep(2)
 
 
+# Chunk size for copying file contents, this bounds the
+# memory used for copying large files.
+COPY_BUFSIZE = 1024 * 1024
+
+# ioctl for cloning a file on Linux filesystems with support
+# for reflinks (btrfs, xfs), from <linux/fs.h>
+_FICLONE = 0x40049409
+
+# Errors that indicate that a copy primitive is not supported
+# for a particular pair of files.
+_FALLBACK_ERRNOS = {
+    errno.EBADF,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTSUP,
+    errno.EOPNOTSUPP,
+    errno.EXDEV,
+    errno.ETXTBSY,
+}
+
+
+@contextlib.contextmanager
+def _open_source(source):
+    """
+    Open *source* for reading, which can be a file in a zipfile.
+
+    Unlike ``zipio.open`` this doesn't read zipfile members
+    into memory.
+    """
+    if os.path.exists(source):
+        with open(source, "rb") as stream:
+            yield stream
+        return
+
+    archive = os.path.dirname(source)
+    while archive and not os.path.exists(archive):
+        parent = os.path.dirname(archive)
+        if parent == archive:
+            break
+        archive = parent
+
+    if os.path.isfile(archive) and zipfile.is_zipfile(archive):
+        member = os.path.relpath(source, archive).replace(os.sep, "/")
+        with zipfile.ZipFile(archive) as zf:
+            try:
+                info = zf.getinfo(member)
+            except KeyError:
+                raise OSError(
+                    errno.ENOENT, "No such file or directory", source
+                ) from None
+            with zf.open(info) as stream:
+                yield stream
+        return
+
+    with zipio.open(source, "rb") as stream:
+        yield stream
+
+
+def _fast_copy(fd_in, fd_out):
+    """
+    Copy the contents of *fd_in* to *fd_out* without reading the data
+    into memory, using reflinks (Linux FICLONE), ``os.copy_file_range``
+    or ``os.sendfile``.
+
+    Returns the number of bytes copied, this is less than the size
+    of the file when the rest cannot be copied this way (and is 0 when
+    none of those can be used for these files). The file offsets are
+    not changed.
+    """
+    size = os.fstat(fd_in).st_size
+    if sys.platform == "linux":
+        try:
+            fcntl.ioctl(fd_out, _FICLONE, fd_in)
+            return size
+        except OSError:
+            pass
+
+    offset = 0
+    if hasattr(os, "copy_file_range"):
+        while offset < size:
+            try:
+                count = os.copy_file_range(fd_in, fd_out, size - offset, offset, offset)
+            except OSError as exc:
+                if exc.errno in _FALLBACK_ERRNOS:
+                    break
+                raise
+            if count == 0:
+                # Some filesystems report a size for files
+                # that cannot be copied this way.
+                break
+            offset += count
+
+    if sys.platform == "linux":
+        # sendfile only supports regular files as the
+        # output on Linux.
+        while offset < size:
+            try:
+                count = os.sendfile(fd_out, fd_in, offset, size - offset)
+            except OSError as exc:
+                if exc.errno in _FALLBACK_ERRNOS:
+                    break
+                raise
+            if count == 0:
+                break
+            offset += count
+
+    return offset
+
+
+def _copy_contents(fp_in, destination):
+    """
+    Copy the contents of the file object *fp_in* to a new file
+    *destination*.
+
+    Regular files are copied by the kernel where possible: using
+    ``shutil.copyfile`` on macOS (which uses fcopyfile) and
+    :func:`_fast_copy` elsewhere. The part of the file that isn't
+    copied that way is copied using ``shutil.copyfileobj``.
+    """
+    if not isinstance(fp_in, io.BufferedReader):
+        with open(destination, "wb") as fp_out:
+            shutil.copyfileobj(fp_in, fp_out, COPY_BUFSIZE)
+        return
+
+    if sys.platform == "darwin":
+        shutil.copyfile(fp_in.name, destination)
+        return
+
+    with open(destination, "wb") as fp_out:
+        copied = _fast_copy(fp_in.fileno(), fp_out.fileno())
+        if copied:
+            fp_in.seek(copied)
+            fp_out.seek(copied)
+        shutil.copyfileobj(fp_in, fp_out, COPY_BUFSIZE)
+
+
 def _copy_file(
     source,
     destination,
@@ -122,19 +276,26 @@ def _copy_file(
     update=False,
     dry_run=0,
     progress=None,
+    reuse=None,
 ):
-    if progress is not None:
-        progress.trace(f"copying file {source} -> {destination}")
-    with zipio.open(source, "rb") as fp_in:
+    if reuse is not None and not dry_run:
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(source))
+        if reuse.reuse(source, destination):
+            if progress is not None:
+                progress.trace(f"reusing {destination}")
+                progress.count("files reused")
+            return
+
+    nbytes = 0
+    with _open_source(source) as fp_in:
         if not dry_run:
             if os.path.isdir(destination):
                 destination = os.path.join(destination, os.path.basename(source))
             if os.path.exists(destination):
                 os.unlink(destination)
 
-            with open(destination, "wb") as fp_out:
-                data = fp_in.read()
-                fp_out.write(data)
+            _copy_contents(fp_in, destination)
 
             if preserve_mode:
                 mode = None
@@ -151,6 +312,17 @@ def _copy_file(
                 mtime = zipio.getmtime(source)
                 os.utime(destination, (mtime, mtime))
 
+            nbytes = os.path.getsize(destination)
+            if reuse is not None:
+                reuse.record(source, destination)
+
+    if progress is not None:
+        progress.file_event(
+            "Copying files", f"copying file {source} -> {destination}", nbytes
+        )
+        progress.count("files copied")
+        progress.count("bytes copied", nbytes)
+
 
 def make_symlink(source, target):
     if os.path.islink(target):
@@ -274,6 +446,186 @@ def make_loader(fn):
     return LOADER % fn
 
 
+def process_pool(jobs):
+    """
+    Return an executor with *jobs* worker processes
+
+    The workers are new interpreters that don't run the ``__main__``
+    module (the setup.py file running the build), see
+    :mod:`py2app._process_pool`.
+    """
+    from py2app._process_pool import ProcessPool
+
+    return ProcessPool(jobs)
+
+
+def _byte_compile_names(mod, target_dir, debug):
+    # Terminology from the py_compile module:
+    #   cfile - byte-compiled file
+    #   dfile - purported source filename (same as 'file' by default)
+    if mod.filename == mod.identifier:
+        cfile = os.path.basename(mod.filename)
+        dfile = cfile + (debug and "c" or "o")
+    else:
+        cfile = mod.identifier.replace(".", os.sep)
+
+        if mod.packagepath:
+            dfile = cfile + os.sep + "__init__.pyc"
+        else:
+            dfile = cfile + ".pyc"
+    if target_dir:
+        cfile = os.path.join(target_dir, dfile)
+    return cfile, dfile
+
+
+def _pyc_header(source, mtime):
+    """
+    Return the header of the ".pyc" file for *source* (bytes),
+    after the magic number.
+    """
+    if os.environ.get("SOURCE_DATE_EPOCH"):
+        # py_compile uses checked hash-based pycs to
+        # get reproducible output in this case.
+        return struct.pack("<I", 0b11) + importlib.util.source_hash(source)
+    else:
+        return struct.pack("<III", 0, int(mtime) & 0xFFFFFFFF, len(source) & 0xFFFFFFFF)
+
+
+def _compile_source(filename, dfile, optimize=-1, cache=None):
+    """
+    Byte-compile the source module in *filename* and return the
+    contents of the ".pyc" file, or None when the module cannot
+    be compiled.
+
+    This matches ``py_compile.compile``, but without requiring
+    that the source code is a file in the filesystem.
+
+    Returns a tuple of the contents and the cache status like
+    :func:`_byte_compile_module`.
+    """
+    with zipio.open(filename, "rb") as fp_in:
+        source = fp_in.read()
+    mtime = zipio.getmtime(filename)
+
+    if cache is not None:
+        # The cache contains the marshalled code without the header,
+        # the header depends on the modification time of the source
+        # and on SOURCE_DATE_EPOCH.
+        key = cache.key(
+            source, dfile, sys.flags.optimize if optimize == -1 else optimize
+        )
+        data = cache.get(key)
+        if data is not None:
+            return importlib.util.MAGIC_NUMBER + _pyc_header(source, mtime) + data, True
+
+    try:
+        code = compile(source, dfile, "exec", dont_inherit=True, optimize=optimize)
+    except Exception as exc:
+        # Report the error like py_compile does, modules
+        # with syntax errors are reported at the end of the
+        # build as well.
+        py_exc = py_compile.PyCompileError(exc.__class__, exc, dfile)
+        sys.stderr.write(py_exc.msg + "\n")
+        return None, None if cache is None else False
+
+    data = marshal.dumps(code)
+    if cache is not None:
+        cache.put(key, data)
+
+    data = importlib.util.MAGIC_NUMBER + _pyc_header(source, mtime) + data
+    return data, None if cache is None else False
+
+
+def _byte_compile_module(filename, cfile, dfile, optimize=-1, cache=None):
+    """
+    Byte-compile the module in *filename* to *cfile*, using the
+    optimization level of the current interpreter when *optimize*
+    is -1.
+
+    Returns True when the bytecode was found in *cache*, False when
+    it wasn't and None when the cache is not used for this module.
+    """
+    from modulegraph.find_modules import PY_SUFFIXES
+
+    suffix = os.path.splitext(filename)[1]
+
+    if suffix in (".py", ".pyw"):
+        data, hit = _compile_source(filename, dfile, optimize, cache)
+        if data is not None:
+            with open(cfile, "wb") as fp_out:
+                fp_out.write(data)
+        return hit
+
+    elif suffix in PY_SUFFIXES:
+        # Minor problem: This will happily copy a file
+        # <mod>.pyo to <mod>.pyc or <mod>.pyc to
+        # <mod>.pyo, but it does seem to work.
+        copy_file(filename, cfile, preserve_times=True)
+
+    else:
+        raise RuntimeError("Don't know how to handle %r" % filename)
+
+    return None
+
+
+def _byte_compile_parallel(
+    py_files, optimize, force, target_dir, progress, dry_run, debug, cache, jobs
+):
+    from concurrent.futures import as_completed
+
+    if progress is not None:
+        task_id = progress.add_task("Byte compiling", len(py_files))
+
+    with process_pool(jobs) as executor:
+        pending = {}
+        for mod in py_files:
+            cfile, dfile = _byte_compile_names(mod, target_dir, debug)
+
+            if not (force or newer(mod.filename, cfile)):
+                if progress is not None:
+                    progress.info(
+                        f"skipping byte-compilation of {mod.filename} to {dfile}"
+                    )
+                    progress.step_task(task_id)
+                continue
+
+            if dry_run:
+                if progress is not None:
+                    progress.trace(f"byte-compiling {mod.filename} to {dfile}")
+                    progress.step_task(task_id)
+                continue
+
+            # Create directories in this process, that
+            # avoids races between the workers.
+            if not os.path.exists(os.path.dirname(cfile)):
+                if progress is not None:
+                    progress.trace(f"create {os.path.dirname(cfile)}")
+                os.makedirs(os.path.dirname(cfile), 0o777, exist_ok=True)
+
+            future = executor.submit(
+                _byte_compile_module, mod.filename, cfile, dfile, optimize, cache
+            )
+            pending[future] = (mod, dfile)
+
+        for future in as_completed(pending):
+            mod, dfile = pending[future]
+            hit = future.result()
+
+            # The workers use a copy of the cache, collect
+            # the statistics here.
+            if hit is True:
+                cache.hits += 1
+            elif hit is False:
+                cache.misses += 1
+
+            if progress is not None:
+                progress.trace(f"byte-compiled {mod.filename} to {dfile}")
+                progress.step_task(task_id)
+
+    if progress is not None:
+        progress.stop_task(task_id)
+
+
 def byte_compile(
     py_files,
     optimize=0,
@@ -282,11 +634,44 @@ def byte_compile(
     progress=None,
     dry_run=0,
     direct=None,
+    cache=None,
+    jobs=None,
 ):
+    """
+    Byte-compile the modulegraph nodes in *py_files* into *target_dir*.
+
+    When *cache* is not None it should be a
+    :class:`py2app._bytecode_cache.BytecodeCache`, source modules
+    are then only compiled when there is no cached bytecode for them.
+    The cache is not pruned, that is done once at the end of a build.
+
+    When *jobs* is larger than 1 modules are compiled using a pool
+    of *jobs* worker processes, the workers compile using the
+    requested optimization level.
+    """
 
     if direct is None:
         direct = __debug__ and optimize == 0
 
+    if jobs is not None and jobs > 1:
+        # The names must match those that would be used by
+        # the serial code paths below, which is run in a
+        # subprocess with the requested optimization flags
+        # when *direct* is false.
+        debug = __debug__ if direct else optimize == 0
+        _byte_compile_parallel(
+            py_files,
+            optimize,
+            force,
+            target_dir,
+            progress,
+            dry_run,
+            debug,
+            cache,
+            jobs,
+        )
+        return
+
     # "Indirect" byte-compilation: write a temporary script and then
     # run it with the appropriate flags.
     if not direct:
@@ -311,12 +696,24 @@ files = [
                 for f in py_files:
                     script.write(repr(f) + ",\n")
                 script.write("]\n")
+                if cache is not None:
+                    script.write(
+                        """
+from py2app._bytecode_cache import BytecodeCache
+cache = BytecodeCache(%r, %r)
+"""
+                        % (cache.directory, cache.max_size)
+                    )
+                else:
+                    script.write("cache = None\n")
                 script.write(
                     """
 byte_compile(files, optimize=%r, force=%r,
              target_dir=%r,
              progress=None, dry_run=0,
-             direct=1)
+             direct=1, cache=cache)
+if cache is not None:
+    print(cache.report())
 """
                     % (optimize, force, target_dir)
                 )
@@ -346,26 +743,10 @@ byte_compile(files, optimize=%r, force=%r,
         )
 
     else:
-        from py_compile import compile
-
         if progress is not None:
             task_id = progress.add_task("Byte compiling", len(py_files))
         for mod in py_files:
-            # Terminology from the py_compile module:
-            #   cfile - byte-compiled file
-            #   dfile - purported source filename (same as 'file' by default)
-            if mod.filename == mod.identifier:
-                cfile = os.path.basename(mod.filename)
-                dfile = cfile + (__debug__ and "c" or "o")
-            else:
-                cfile = mod.identifier.replace(".", os.sep)
-
-                if mod.packagepath:
-                    dfile = cfile + os.sep + "__init__.pyc"
-                else:
-                    dfile = cfile + ".pyc"
-            if target_dir:
-                cfile = os.path.join(target_dir, dfile)
+            cfile, dfile = _byte_compile_names(mod, target_dir, __debug__)
 
             if force or newer(mod.filename, cfile):
                 if progress is not None:
@@ -376,26 +757,8 @@ byte_compile(files, optimize=%r, force=%r,
                         if progress is not None:
                             progress.trace(f"create {os.path.dirname(cfile)}")
                         os.makedirs(os.path.dirname(cfile), 0o777)
-                    suffix = os.path.splitext(mod.filename)[1]
 
-                    if suffix in (".py", ".pyw"):
-                        fn = cfile + ".py"
-
-                        with zipio.open(mod.filename, "rb") as fp_in:
-                            with open(fn, "wb") as fp_out:
-                                fp_out.write(fp_in.read())
-
-                        compile(fn, cfile, dfile)
-                        os.unlink(fn)
-
-                    elif suffix in PY_SUFFIXES:
-                        # Minor problem: This will happily copy a file
-                        # <mod>.pyo to <mod>.pyc or <mod>.pyc to
-                        # <mod>.pyo, but it does seem to work.
-                        copy_file(mod.filename, cfile, preserve_times=True)
-
-                    else:
-                        raise RuntimeError("Don't know how to handle %r" % mod.filename)
+                    _byte_compile_module(mod.filename, cfile, dfile, cache=cache)
             else:
                 if progress is not None:
                     progress.info(
@@ -406,7 +769,97 @@ byte_compile(files, optimize=%r, force=%r,
                 progress.step_task(task_id)
 
         if progress is not None:
-            progress._progress.stop_task(task_id)
+            progress.stop_task(task_id)
+
+
+def byte_compile_to_archive(
+    py_files, archive, optimize=0, progress=None, dry_run=0, cache=None, jobs=None
+):
+    """
+    Byte-compile the modulegraph nodes in *py_files* and add them
+    to *archive*, a :class:`py2app._libarchive.LibArchive`.
+
+    Modules are compiled in this process using the requested
+    optimization level, or in a pool of *jobs* worker processes
+    when *jobs* is larger than 1. Entries are added to the archive
+    in the order of *py_files*.
+    """
+    from modulegraph.find_modules import PY_SUFFIXES
+
+    # Names match those used by byte_compile
+    debug = optimize == 0
+
+    if progress is not None:
+        task_id = progress.add_task("Byte compiling", len(py_files))
+
+    executor = None
+    if jobs is not None and jobs > 1 and not dry_run:
+        executor = process_pool(jobs)
+
+    work = []
+    try:
+        for mod in py_files:
+            _cfile, dfile = _byte_compile_names(mod, None, debug)
+            suffix = os.path.splitext(mod.filename)[1]
+
+            if dry_run:
+                result = None
+            elif suffix in (".py", ".pyw"):
+                if executor is not None:
+                    result = executor.submit(
+                        _compile_source, mod.filename, dfile, optimize, cache
+                    )
+                else:
+                    result = _compile_source(mod.filename, dfile, optimize, cache)
+            elif suffix in PY_SUFFIXES:
+                result = None
+            else:
+                raise RuntimeError("Don't know how to handle %r" % mod.filename)
+            work.append((mod, dfile, result))
+
+        for mod, dfile, result in work:
+            if progress is not None:
+                progress.trace(f"byte-compiling {mod.filename} to {dfile}")
+
+            if not dry_run:
+                if result is None:
+                    archive.add_file(mod.filename, dfile)
+                else:
+                    if executor is not None:
+                        result = result.result()
+                    data, hit = result
+
+                    # The workers use a copy of the cache, collect
+                    # the statistics here.
+                    if executor is not None:
+                        if hit is True:
+                            cache.hits += 1
+                        elif hit is False:
+                            cache.misses += 1
+
+                    if data is not None:
+                        archive.add_bytes(dfile, data, zipio.getmtime(mod.filename))
+                        if progress is not None:
+                            progress.count("bytecode bytes", len(data))
+                            if hit is not True:
+                                progress.count("modules byte-compiled")
+
+            if progress is not None:
+                progress.step_task(task_id)
+
+    except BaseException:
+        if executor is not None:
+            for _mod, _dfile, result in work:
+                if result is not None and not isinstance(result, tuple):
+                    result.cancel()
+        raise
+
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if progress is not None:
+        progress.stop_task(task_id)
 
 
 SCMDIRS = ["CVS", ".svn", ".hg", ".git"]
@@ -454,25 +907,228 @@ def iter_platform_files(path, is_platform_file=macholib.util.is_platform_file):
                 yield fn
 
 
-def strip_files(files, dry_run=0, progress=None):
+# Default tool used by strip_files
+STRIP_TOOL = "/usr/bin/strip"
+
+# Maximum number of files passed to a single invocation
+# of the strip tool by strip_files
+STRIP_BATCH_SIZE = 32
+
+
+def is_stripped(path, macho_cache=None):
     """
-    Strip the given set of files
+    Returns true if the Mach-O file *path* has no local
+    symbols left for "strip -x -S" to remove, for all
+    architectures in the file. The headers are read from
+    *macho_cache* when that is not None.
+    """
+    from py2app._macho_cache import read_headers
+
+    if macho_cache is None:
+        headers = read_headers(path)
+    else:
+        headers = macho_cache.headers(path)
+
+    return bool(headers) and all(header.nlocalsym == 0 for header in headers)
+
+
+def strip_files(
+    files, dry_run=0, progress=None, strip_tool=None, jobs=None, macho_cache=None
+):
+    """
+    Strip the given set of files, and return the total size
+    of the files before and after stripping.
+
+    Files that are already stripped are skipped, the other files
+    are stripped in batches of at most STRIP_BATCH_SIZE files using
+    *strip_tool* (default: STRIP_TOOL), with *jobs* batches running
+    concurrently (default: the number of CPUs). The headers of the
+    files are read from *macho_cache* when that is not None.
     """
     if dry_run:
-        return
+        return 0, 0
 
     # XXX: macholib.util.strip_files just calls strip(1)
     # return macholib.util.strip_files(files)
 
+    from concurrent.futures import ThreadPoolExecutor
+
+    if strip_tool is None:
+        strip_tool = STRIP_TOOL
+    files = list(files)
     task_id = progress.add_task("Stripping binaries", len(files))
+
+    todo = []
+    skipped = 0
     for name in files:
-        progress.trace(f"Stripping {name}")
-        subprocess.check_call(
-            ["/usr/bin/strip", "-x", "-S", "-", name], stderr=subprocess.DEVNULL
-        )
+        if is_stripped(name, macho_cache):
+            progress.trace(f"Skipping {name}: already stripped")
+            skipped += os.stat(name).st_size
+            progress.step_task(task_id)
+        else:
+            todo.append(name)
+    progress.count("files already stripped", len(files) - len(todo))
+
+    def strip(batch):
+        before = sum(os.stat(name).st_size for name in batch)
+        with progress.span("strip batch", "file", files=len(batch)):
+            for name in batch:
+                progress.trace(f"Stripping {name}")
+            progress.count("strip subprocesses")
+            try:
+                subprocess.check_call(
+                    [strip_tool, "-x", "-S", "-"] + batch, stderr=subprocess.DEVNULL
+                )
+            except subprocess.CalledProcessError:
+                if len(batch) == 1:
+                    raise
+
+                # Retry file by file to report the file that
+                # cannot be stripped.
+                for name in batch:
+                    progress.count("strip subprocesses")
+                    subprocess.check_call(
+                        [strip_tool, "-x", "-S", "-", name],
+                        stderr=subprocess.DEVNULL,
+                    )
+
+        after = sum(os.stat(name).st_size for name in batch)
+        progress.step_task(task_id, len(batch))
+        return before, after
+
+    # Use smaller batches when there are few files to
+    # keep all workers busy.
+    workers = jobs or os.cpu_count() or 1
+    size = max(1, min(STRIP_BATCH_SIZE, -(-len(todo) // workers)))
+    batches = [todo[idx : idx + size] for idx in range(0, len(todo), size)]
+    with ThreadPoolExecutor(workers) as executor:
+        sizes = list(executor.map(strip, batches))
+
+    progress.stop_task(task_id)
+    return (
+        skipped + sum(before for before, _ in sizes),
+        skipped + sum(after for _, after in sizes),
+    )
+
+
+# Names of architectures in universal files by CPU type and subtype,
+# only arm64 and x86_64 slices can be selected using --thin-arch.
+_SLICE_NAMES = {
+    (0x100000C, 0): "arm64",  # CPU_SUBTYPE_ARM64_ALL
+    (0x100000C, 1): "arm64",  # CPU_SUBTYPE_ARM64_V8
+    (0x100000C, 2): "arm64e",
+    (0x1000007, 3): "x86_64",  # CPU_SUBTYPE_X86_64_ALL
+    (0x1000007, 8): "x86_64h",
+}
+
+# Capability bits in the CPU subtype (such as the pointer
+# authentication ABI version of arm64e)
+_CPU_SUBTYPE_MASK = 0xFF000000
+
+
+def _slice_name(cputype, cpusubtype):
+    """
+    Return the architecture name for a slice in a universal file
+    """
+    from macholib.mach_o import CPU_TYPE_NAMES
+
+    name = _SLICE_NAMES.get((cputype, cpusubtype))
+    if name is None:
+        name = CPU_TYPE_NAMES.get(cputype, str(cputype)).lower()
+        name = f"{name} (subtype {cpusubtype})"
+    return name
+
+
+def _fat_slices(path):
+    """
+    Return a mapping from (cputype, cpusubtype) to the offset and size
+    of the slice for that architecture in the universal (fat)
+    Mach-O file *path*, or None when *path* is not a universal file.
+    The capability bits are removed from the subtype.
+    """
+    from macholib.mach_o import (
+        FAT_MAGIC,
+        FAT_MAGIC_64,
+        fat_arch,
+        fat_arch64,
+        fat_header,
+    )
+
+    with open(path, "rb") as stream:
+        try:
+            header = fat_header.from_fileobj(stream)
+            if header.magic == FAT_MAGIC:
+                archs = [fat_arch.from_fileobj(stream) for _ in range(header.nfat_arch)]
+            elif header.magic == FAT_MAGIC_64:
+                archs = [
+                    fat_arch64.from_fileobj(stream) for _ in range(header.nfat_arch)
+                ]
+            else:
+                return None
+        except (EOFError, struct.error):
+            return None
+        file_size = os.fstat(stream.fileno()).st_size
+
+    slices = {}
+    for arch in archs:
+        if arch.offset + arch.size > file_size:
+            # Not a Mach-O file, Java class files use the same magic.
+            return None
+        key = (int(arch.cputype), int(arch.cpusubtype) & ~_CPU_SUBTYPE_MASK)
+        slices[key] = (arch.offset, arch.size)
+    return slices
+
+
+def thin_files(files, arch, dry_run=0, progress=None):
+    """
+    Replace the universal (fat) Mach-O files in *files* by their
+    slice for *arch* ("arm64" or "x86_64"), and return the total size
+    of the universal files before and after thinning. Universal files
+    without a slice for *arch* are left alone, an arm64e slice is not
+    used for "arm64".
+    """
+    if dry_run:
+        return 0, 0
+
+    before = after = 0
+    task_id = progress.add_task("Thinning binaries", len(files))
+    for name in files:
+        path = os.path.realpath(name)
+        slices = _fat_slices(path)
+        if slices is None:
+            progress.step_task(task_id)
+            continue
+
+        keys = [key for key in slices if _slice_name(*key) == arch]
+        if not keys:
+            names = sorted(_slice_name(*key) for key in slices)
+            progress.warning(f"{name}: no {arch} code, keeping {', '.join(names)}")
+            progress.step_task(task_id)
+            continue
+
+        progress.trace(f"Thinning {name}")
+        offset, size = slices[keys[0]]
+        with open(path, "rb") as stream:
+            stream.seek(offset)
+            data = stream.read(size)
+
+        tmpname = path + ".thin"
+        with open(tmpname, "wb") as stream:
+            stream.write(data)
+        shutil.copymode(path, tmpname)
+        before += os.stat(path).st_size
+        after += size
+        os.replace(tmpname, path)
+
+        progress.count("files thinned")
         progress.step_task(task_id)
 
-    progress._progress.stop_task(task_id)
+    progress.stop_task(task_id)
+    return before, after
+
+
+# Maximum number of threads used by copy_tree for copying files
+COPY_TREE_THREADS = 8
 
 
 def copy_tree(
@@ -486,6 +1142,7 @@ def copy_tree(
     dry_run=0,
     condition=None,
     progress=None,
+    reuse=None,
 ):
 
     """
@@ -506,11 +1163,15 @@ def copy_tree(
     copied as symlinks (on platforms that support them!); otherwise
     (the default), the destination of the symlink will be copied.
     'update' and 'verbose' are the same as for 'copy_file'.
+
+    Files are copied using a pool of threads, the directory tree
+    itself is scanned on the calling thread. 'reuse' is passed
+    to 'copy_file'.
     """
     assert isinstance(src, str), repr(src)
     assert isinstance(dst, str), repr(dst)
 
-    from distutils.dep_util import newer
+    from concurrent.futures import ThreadPoolExecutor
     from distutils.errors import DistutilsFileError
 
     if condition is None:
@@ -518,6 +1179,146 @@ def copy_tree(
 
     if not dry_run and not zipio.isdir(src):
         raise DistutilsFileError("cannot copy tree '%s': not a directory" % src)
+
+    if not os.path.isdir(src):
+        # A directory in a zipfile
+        return _copy_tree_zipio(
+            src,
+            dst,
+            preserve_mode,
+            preserve_times,
+            preserve_symlinks,
+            update,
+            dry_run=dry_run,
+            condition=condition,
+            progress=progress,
+        )
+
+    outputs = []
+    futures = []
+
+    def copy(src_name, dst_name):
+        futures.append(
+            executor.submit(
+                copy_file,
+                src_name,
+                dst_name,
+                preserve_mode,
+                preserve_times,
+                update,
+                dry_run=dry_run,
+                progress=progress,
+                reuse=reuse,
+            )
+        )
+
+    with ThreadPoolExecutor(max_workers=COPY_TREE_THREADS) as executor:
+        try:
+            _scan_tree(
+                src,
+                dst,
+                preserve_symlinks,
+                update,
+                dry_run,
+                condition,
+                progress,
+                copy,
+                outputs,
+            )
+
+            for future in futures:
+                future.result()
+
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    return outputs
+
+
+def _scan_tree(
+    src, dst, preserve_symlinks, update, dry_run, condition, progress, copy, outputs
+):
+    """
+    Helper for copy_tree: create the directories in *dst* and call
+    *copy* for every file that should be copied.
+    """
+    from distutils.dep_util import newer
+    from distutils.errors import DistutilsFileError
+
+    try:
+        with os.scandir(src) as it:
+            entries = list(it)
+    except OSError as exc:
+        if dry_run:
+            entries = []
+        else:
+            raise DistutilsFileError(f"error listing files in '{src}': {exc.strerror}")
+
+    if not dry_run and not os.path.exists(dst):
+        if progress is not None:
+            progress.trace(f"creating {dst}")
+        os.makedirs(dst, 0o777)
+
+    for entry in entries:
+        src_name = entry.path
+        dst_name = os.path.join(dst, entry.name)
+        if (condition is not None) and (not condition(src_name)):
+            continue
+
+        if entry.is_symlink():
+            link_dest = os.readlink(src_name)
+            if not os.path.exists(os.path.join(src, link_dest)):
+                # Dead symlink
+                continue
+
+            if preserve_symlinks:
+                if progress is not None:
+                    progress.trace(f"linking {dst_name} -> {link_dest}")
+                if not dry_run:
+                    if update and not newer(src, dst_name):
+                        pass
+                    else:
+                        make_symlink(link_dest, dst_name)
+                outputs.append(dst_name)
+                continue
+
+        if entry.is_dir():
+            _scan_tree(
+                src_name,
+                dst_name,
+                preserve_symlinks,
+                update,
+                dry_run,
+                condition,
+                progress,
+                copy,
+                outputs,
+            )
+        else:
+            copy(src_name, dst_name)
+            outputs.append(dst_name)
+
+
+def _copy_tree_zipio(
+    src,
+    dst,
+    preserve_mode=1,
+    preserve_times=1,
+    preserve_symlinks=0,
+    update=0,
+    dry_run=0,
+    condition=None,
+    progress=None,
+):
+    """
+    Helper for copy_tree: copy a directory tree that
+    is located in a zipfile.
+    """
+    from distutils.dep_util import newer
+    from distutils.errors import DistutilsFileError
+
     try:
         names = zipio.listdir(src)
     except os.error as exc:
@@ -562,7 +1363,7 @@ def copy_tree(
             # ^^^ this odd tests ensures that resource files that
             # happen to be a zipfile won't get extracted.
             outputs.extend(
-                copy_tree(
+                _copy_tree_zipio(
                     src_name,
                     dst_name,
                     preserve_mode,
@@ -672,10 +1473,14 @@ def _macho_find(path):
                 yield path
 
 
-def _dosign(*path, progress=None):
+# Default tool used by codesign_adhoc
+CODESIGN_TOOL = "codesign"
+
+
+def _dosign(*path, progress=None, codesign_tool=CODESIGN_TOOL):
     p = subprocess.Popen(
         (
-            "codesign",
+            codesign_tool,
             "-s",
             "-",
             "--preserve-metadata=identifier,entitlements,flags,runtime",
@@ -687,57 +1492,141 @@ def _dosign(*path, progress=None):
     )
     out, _ = p.communicate()
     xit = p.wait()
+    if progress is not None:
+        progress.count("codesign subprocesses")
     if xit != 0:
         progress.warning(f"{path}: {out}")
         raise subprocess.CalledProcessError(xit, "codesign")
 
 
-def codesign_adhoc(bundle, progress):
+def _macho_dependencies(path, executable_path, macho_cache=None):
+    """
+    Return the paths of the libraries that the Mach-O file *path*
+    links to. Paths relative to @executable_path, @loader_path
+    and @rpath are expanded, with *executable_path* as the
+    directory of the main executable.
+    """
+    from py2app._macho_cache import read_headers
+
+    if macho_cache is None:
+        headers = read_headers(path)
+    else:
+        headers = macho_cache.headers(path)
+    if headers is None:
+        return set()
+
+    loader_path = os.path.dirname(path)
+
+    def expand(name):
+        for prefix, base in (
+            ("@executable_path", executable_path),
+            ("@loader_path", loader_path),
+        ):
+            if name == prefix or name.startswith(prefix + "/"):
+                return base + name[len(prefix) :]
+        return name
+
+    result = set()
+    for header in headers:
+        rpaths = [expand(rpath) for rpath in header.rpaths]
+        for _idx, _kind, name in header.walkRelocatables():
+            if name.startswith("@rpath/"):
+                result.update(
+                    os.path.join(rpath, name[len("@rpath/") :]) for rpath in rpaths
+                )
+            else:
+                result.add(expand(name))
+
+    return result
+
+
+def macho_dependency_levels(files, executable_path, macho_cache=None):
+    """
+    Sort the Mach-O *files* into levels, files in a level only link
+    to files in earlier levels (or to files outside of *files*).
+    Files are returned by their real path, and files that are part
+    of a dependency cycle end up in the last level. The load commands
+    are read from *macho_cache* when that is not None.
+    """
+    files = sorted({os.path.realpath(fn) for fn in files})
+    dependencies = {}
+    for fn in files:
+        dependencies[fn] = {
+            os.path.realpath(dep)
+            for dep in _macho_dependencies(fn, executable_path, macho_cache)
+        }
+
+    levels = []
+    done = set()
+    todo = files
+    while todo:
+        level = [
+            fn
+            for fn in todo
+            if all(dep in done or dep not in dependencies for dep in dependencies[fn])
+        ]
+        if not level:
+            level = todo
+        levels.append(level)
+        done.update(level)
+        todo = [fn for fn in todo if fn not in done]
+
+    return levels
+
+
+def codesign_adhoc(bundle, progress, codesign_tool=None, jobs=None, macho_cache=None):
     """
     (Re)sign a bundle
 
     Signing should be done "depth-first", sign
     libraries before signing the libraries/executables
-    linking to them.
-
-    The current implementation is a crude hack,
-    but is better than nothing. Signing properly requires
-    performing a topological sort using dependencies.
+    linking to them. The Mach-O files in the bundle
+    are sorted into levels using their load commands
+    (see macho_dependency_levels), the files in a level
+    are signed using *jobs* concurrent *codesign_tool*
+    processes (default: the number of CPUs). The load commands
+    are read from *macho_cache* when that is not None.
 
     "codesign" will resign the entire bundle, but only
     if partial signatures are valid.
     """
-    # try:
-    #    _dosign(bundle)
-    #    return
-    # except subprocess.CalledProcessError:
-    #    pass
+    from concurrent.futures import ThreadPoolExecutor
 
-    platfiles = list(_macho_find(bundle))
+    if codesign_tool is None:
+        codesign_tool = CODESIGN_TOOL
 
-    task_id = progress.add_task("Signing code", len(platfiles) + 1)
-    while platfiles:
-        for file in platfiles:
-            failed = []
-            try:
-                progress.trace(f"Signing {file}")
-                _dosign(file, progress=progress)
-                progress.step_task(task_id)
-            except subprocess.CalledProcessError:
-                progress.info(f"Signing {file} failed")
-                failed.append(file)
-        if failed == platfiles:
-            raise RuntimeError(f"Cannot sign bundle {bundle!r}")
-        platfiles = failed
+    levels = macho_dependency_levels(
+        _macho_find(bundle), os.path.join(bundle, "Contents", "MacOS"), macho_cache
+    )
+    task_id = progress.add_task("Signing code", sum(map(len, levels)) + 1)
+
+    def sign(file):
+        progress.trace(f"Signing {file}")
+        try:
+            with progress.span(f"codesign {file}", "file"):
+                _dosign(file, progress=progress, codesign_tool=codesign_tool)
+        except subprocess.CalledProcessError:
+            progress.info(f"Signing {file} failed")
+            return file
+        finally:
+            progress.step_task(task_id)
+        return None
+
+    with ThreadPoolExecutor(jobs or os.cpu_count() or 1) as executor:
+        for idx, level in enumerate(levels):
+            with progress.span(f"codesign level {idx}", files=len(level)):
+                failed = [fn for fn in executor.map(sign, level) if fn is not None]
+            if failed:
+                raise RuntimeError(f"Cannot sign bundle {bundle!r}: {failed}")
 
     for _ in range(5):
         try:
             progress.info(f"Signing {bundle}")
-            _dosign(bundle, progress=progress)
+            _dosign(bundle, progress=progress, codesign_tool=codesign_tool)
             break
         except subprocess.CalledProcessError:
             progress.warning(f"Signing {bundle} failed")
             time.sleep(1)
             continue
     progress.step_task(task_id)
-    progress._progress.stop_task(task_id)
+    progress.stop_task(task_id)
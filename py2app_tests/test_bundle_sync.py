@@ -0,0 +1,210 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from py2app import _bundle_sync
+from py2app._bundle_sync import ReusePlan, sync_dist_dir, sync_tree
+from py2app.util import copy_file, copy_tree
+
+
+class TestBundleSync(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dst = os.path.join(self.tmpdir, "dist", "App.app")
+        self.manifest = os.path.join(self.tmpdir, "manifest.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_staging(self, files, links=None):
+        staging = tempfile.mkdtemp(dir=self.tmpdir)
+        for relpath, contents in files.items():
+            path = os.path.join(staging, relpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as stream:
+                stream.write(contents)
+        for relpath, target in (links or {}).items():
+            os.symlink(target, os.path.join(staging, relpath))
+        return staging
+
+    def read(self, relpath):
+        with open(os.path.join(self.dst, relpath)) as stream:
+            return stream.read()
+
+    def test_sync(self):
+        files = {
+            "Contents/Info.plist": "plist",
+            "Contents/MacOS/App": "executable",
+            "Contents/Resources/lib/python.zip": "zip",
+            "Contents/Resources/old.txt": "old",
+        }
+        stats = sync_tree(
+            self.make_staging(files, {"Contents/link": "MacOS/App"}),
+            self.dst,
+            self.manifest,
+        )
+        self.assertEqual(stats.written, 5)
+        self.assertEqual(stats.unchanged, 0)
+        self.assertEqual(self.read("Contents/link"), "executable")
+
+        inode = os.stat(os.path.join(self.dst, "Contents/MacOS/App")).st_ino
+
+        files["Contents/Resources/lib/python.zip"] = "new"
+        files["Contents/Resources/new.txt"] = "new file"
+        del files["Contents/Resources/old.txt"]
+        stats = sync_tree(
+            self.make_staging(files, {"Contents/link": "Info.plist"}),
+            self.dst,
+            self.manifest,
+        )
+        self.assertEqual(stats.written, 3)
+        self.assertEqual(stats.unchanged, 2)
+        self.assertEqual(stats.removed, 1)
+
+        self.assertEqual(self.read("Contents/Resources/lib/python.zip"), "new")
+        self.assertEqual(self.read("Contents/Resources/new.txt"), "new file")
+        self.assertEqual(self.read("Contents/link"), "plist")
+        self.assertFalse(
+            os.path.exists(os.path.join(self.dst, "Contents/Resources/old.txt"))
+        )
+        self.assertEqual(
+            os.stat(os.path.join(self.dst, "Contents/MacOS/App")).st_ino, inode
+        )
+
+    def test_modified_destination(self):
+        files = {"Contents/Info.plist": "plist"}
+        sync_tree(self.make_staging(files), self.dst, self.manifest)
+
+        # Same size, different contents
+        with open(os.path.join(self.dst, "Contents/Info.plist"), "w") as stream:
+            stream.write("PLIST")
+
+        stats = sync_tree(self.make_staging(files), self.dst, self.manifest)
+        self.assertEqual(stats.written, 1)
+        self.assertEqual(self.read("Contents/Info.plist"), "plist")
+
+    def test_mode(self):
+        files = {"Contents/MacOS/App": "executable"}
+        sync_tree(self.make_staging(files), self.dst, self.manifest)
+
+        staging = self.make_staging(files)
+        os.chmod(os.path.join(staging, "Contents/MacOS/App"), 0o755)
+        stats = sync_tree(staging, self.dst, self.manifest)
+        self.assertEqual(stats.unchanged, 1)
+        self.assertEqual(
+            os.stat(os.path.join(self.dst, "Contents/MacOS/App")).st_mode & 0o777,
+            0o755,
+        )
+
+    def test_sync_dist_dir(self):
+        dist = os.path.dirname(self.dst)
+        os.makedirs(dist)
+        with open(os.path.join(dist, "unrelated.txt"), "w") as stream:
+            stream.write("keep")
+
+        staging = self.make_staging(
+            {"App.app/Contents/Info.plist": "plist", "App.dot": "graph"}
+        )
+        stats = sync_dist_dir(staging, dist, os.path.join(self.tmpdir, "manifests"))
+        self.assertEqual(stats.written, 2)
+        self.assertEqual(self.read("Contents/Info.plist"), "plist")
+        self.assertTrue(os.path.exists(os.path.join(dist, "App.dot")))
+        self.assertTrue(os.path.exists(os.path.join(dist, "unrelated.txt")))
+
+    def build_with_reuse(self, source, before_sync=None):
+        # Copy *source* into a bundle in a staging directory and
+        # sync that with the dist directory, like --incremental.
+        dist = os.path.dirname(self.dst)
+        staging = tempfile.mkdtemp(dir=self.tmpdir)
+        manifests = os.path.join(self.tmpdir, "manifests")
+        plan = ReusePlan(staging, dist, manifests)
+
+        resources = os.path.join(staging, "App.app", "Contents", "Resources")
+        copy_tree(source, resources, reuse=plan)
+        copy_file(
+            os.path.join(source, "data.txt"),
+            os.path.join(staging, "App.app", "Contents", "Info.plist"),
+            reuse=plan,
+        )
+        with open(os.path.join(resources, "generated.txt"), "w") as stream:
+            stream.write("generated")
+
+        if before_sync is not None:
+            before_sync(os.path.join(staging, "App.app"))
+
+        os.makedirs(dist, exist_ok=True)
+        return plan, sync_dist_dir(staging, dist, manifests, plan)
+
+    def test_reuse(self):
+        source = self.make_staging({"data.txt": "data", "sub/other.txt": "other"})
+        plan, stats = self.build_with_reuse(source)
+        self.assertEqual(plan.reused, 0)
+        self.assertEqual(stats.written, 4)
+
+        hashed = []
+
+        def hash_file(path):
+            hashed.append(os.path.basename(path))
+            return orig(path)
+
+        orig = _bundle_sync._hash_file
+        _bundle_sync._hash_file = hash_file
+        try:
+            info_plist = os.path.join(self.dst, "Contents/Info.plist")
+            inode = os.stat(info_plist).st_ino
+            plan, stats = self.build_with_reuse(source)
+        finally:
+            _bundle_sync._hash_file = orig
+
+        # generated.txt isn't a copy and is compared
+        self.assertEqual(hashed, ["generated.txt", "generated.txt"])
+        self.assertEqual(plan.reused, 3)
+        self.assertEqual(stats.unchanged, 4)
+        self.assertEqual(stats.written, 0)
+        self.assertEqual(os.stat(info_plist).st_ino, inode)
+
+        # Changed sources and files that were changed in the
+        # dist directory are copied.
+        with open(os.path.join(source, "sub", "other.txt"), "w") as stream:
+            stream.write("changed")
+        with open(os.path.join(self.dst, "Contents/Resources/data.txt"), "w") as stream:
+            stream.write("modified")
+
+        plan, stats = self.build_with_reuse(source)
+        self.assertEqual(plan.reused, 1)
+        self.assertEqual(self.read("Contents/Resources/sub/other.txt"), "changed")
+        self.assertEqual(self.read("Contents/Resources/data.txt"), "data")
+        self.assertEqual(self.read("Contents/Info.plist"), "data")
+
+    def test_reuse_changed_in_place(self):
+        # Reused files in the staging directory don't share
+        # storage with the bundle in the dist directory.
+        source = self.make_staging({"data.txt": "data", "sub/other.txt": "other"})
+        self.build_with_reuse(source)
+
+        def before_sync(bundle):
+            with open(os.path.join(bundle, "Contents/Info.plist"), "r+") as stream:
+                stream.write("DATA")
+            self.assertEqual(self.read("Contents/Info.plist"), "data")
+
+        plan, stats = self.build_with_reuse(source, before_sync)
+        self.assertEqual(plan.reused, 3)
+        self.assertEqual(stats.written, 1)
+        self.assertEqual(self.read("Contents/Info.plist"), "DATA")
+
+    def test_reuse_modified_copy(self):
+        # Files that are changed after copying are not reused
+        source = self.make_staging({"data.txt": "data"})
+        for _ in range(2):
+            staging = tempfile.mkdtemp(dir=self.tmpdir)
+            plan = ReusePlan(staging, os.path.dirname(self.dst), self.tmpdir)
+            path = os.path.join(staging, "App.app", "data.txt")
+            os.makedirs(os.path.dirname(path))
+            copy_file(os.path.join(source, "data.txt"), path, reuse=plan)
+            with open(path, "a") as stream:
+                stream.write(" changed")
+            os.utime(path, ns=(0, 0))
+            sync_dist_dir(staging, os.path.dirname(self.dst), self.tmpdir, plan)
+            self.assertEqual(plan.reused, 0)
+        self.assertEqual(self.read("data.txt"), "data changed")
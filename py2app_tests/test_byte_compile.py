@@ -0,0 +1,125 @@
+import marshal
+import os
+import py_compile
+import shutil
+import tempfile
+import unittest
+
+from modulegraph.modulegraph import Package, SourceModule
+
+from py2app import util
+
+from .tools import run_unguarded_script
+
+MODULE_SOURCE = '''\
+"""docstring"""
+assert False, "assertion"
+
+def function():
+    return __doc__
+'''
+
+
+class TestByteCompile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        srcdir = os.path.join(self.tmpdir, "src")
+        os.mkdir(srcdir)
+        os.mkdir(os.path.join(srcdir, "pkg"))
+
+        self.py_files = []
+        for name in ("mod1", "mod2", "mod3"):
+            fn = os.path.join(srcdir, name + ".py")
+            with open(fn, "w") as stream:
+                stream.write(MODULE_SOURCE)
+            self.py_files.append(SourceModule(name, fn))
+
+        fn = os.path.join(srcdir, "pkg", "__init__.py")
+        with open(fn, "w") as stream:
+            stream.write(MODULE_SOURCE)
+        pkg = Package("pkg", fn)
+        pkg.packagepath = [os.path.dirname(fn)]
+        self.py_files.append(pkg)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read_code(self, path):
+        with open(path, "rb") as stream:
+            data = stream.read()
+        # Skip the header
+        return data[16:]
+
+    def assert_same_output(self, dir1, dir2):
+        for fn in ("mod1.pyc", "mod2.pyc", "mod3.pyc", "pkg/__init__.pyc"):
+            with open(os.path.join(dir1, fn), "rb") as stream:
+                data1 = stream.read()
+            with open(os.path.join(dir2, fn), "rb") as stream:
+                data2 = stream.read()
+            self.assertEqual(data1, data2)
+
+    def test_matches_py_compile(self):
+        outdir = os.path.join(self.tmpdir, "out")
+        util.byte_compile(self.py_files, target_dir=outdir, direct=True)
+
+        for mod in self.py_files:
+            cfile = os.path.join(self.tmpdir, "expected.pyc")
+            dfile = "pkg/__init__.pyc" if mod.packagepath else mod.identifier + ".pyc"
+            py_compile.compile(mod.filename, cfile, dfile, doraise=True)
+
+            with open(cfile, "rb") as stream:
+                expected = stream.read()
+            with open(os.path.join(outdir, dfile), "rb") as stream:
+                self.assertEqual(stream.read(), expected)
+
+    def test_syntax_error(self):
+        fn = os.path.join(self.tmpdir, "src", "invalid.py")
+        with open(fn, "w") as stream:
+            stream.write("def f(:\n")
+
+        outdir = os.path.join(self.tmpdir, "out")
+        util.byte_compile([SourceModule("invalid", fn)], target_dir=outdir)
+        self.assertFalse(os.path.exists(os.path.join(outdir, "invalid.pyc")))
+
+    def test_parallel_matches_serial(self):
+        serial = os.path.join(self.tmpdir, "serial")
+        parallel = os.path.join(self.tmpdir, "parallel")
+
+        util.byte_compile(self.py_files, target_dir=serial, direct=True)
+        util.byte_compile(self.py_files, target_dir=parallel, direct=True, jobs=2)
+        self.assert_same_output(serial, parallel)
+
+    def test_parallel_unguarded_main(self):
+        # Worker processes must not run the __main__ module (the
+        # setup.py file) again, even when "spawn" is the default.
+        outdir = os.path.join(self.tmpdir, "out")
+        proc, runs = run_unguarded_script(
+            self.tmpdir,
+            f"""
+            from modulegraph.modulegraph import SourceModule
+            from py2app import util
+
+            py_files = [
+                SourceModule(name, fn)
+                for name, fn in {[(m.identifier, m.filename) for m in self.py_files[:3]]!r}
+            ]
+            util.byte_compile(py_files, target_dir={outdir!r}, jobs=2)
+            """,
+        )
+        self.assertEqual(proc.returncode, 0, proc.stdout.decode())
+        self.assertEqual(runs, 1)
+        self.assertTrue(os.path.exists(os.path.join(outdir, "mod1.pyc")))
+
+    def test_parallel_optimize(self):
+        for optimize in (1, 2):
+            outdir = os.path.join(self.tmpdir, "out%d" % (optimize,))
+            util.byte_compile(
+                self.py_files, target_dir=outdir, optimize=optimize, jobs=2
+            )
+
+            code = marshal.loads(self.read_code(os.path.join(outdir, "mod1.pyc")))
+            self.assertNotIn("assertion", code.co_consts)
+            if optimize == 2:
+                self.assertNotIn("docstring", code.co_consts)
+            else:
+                self.assertIn("docstring", code.co_consts)
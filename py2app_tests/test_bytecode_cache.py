@@ -0,0 +1,147 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from modulegraph.modulegraph import SourceModule
+
+from py2app import util
+from py2app._bytecode_cache import BytecodeCache
+
+
+class TestBytecodeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.tmpdir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_key(self):
+        cache = BytecodeCache(self.cachedir)
+
+        key = cache.key(b"x = 1\n", "mod.pyc", 0)
+        self.assertEqual(key, cache.key(b"x = 1\n", "mod.pyc", 0))
+        self.assertNotEqual(key, cache.key(b"x = 2\n", "mod.pyc", 0))
+        self.assertNotEqual(key, cache.key(b"x = 1\n", "other.pyc", 0))
+        self.assertNotEqual(key, cache.key(b"x = 1\n", "mod.pyc", 1))
+
+    def test_get_put(self):
+        cache = BytecodeCache(self.cachedir)
+        key = cache.key(b"x = 1\n", "mod.pyc", 0)
+
+        self.assertIs(cache.get(key), None)
+        cache.put(key, b"data")
+        self.assertEqual(cache.get(key), b"data")
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_prune(self):
+        cache = BytecodeCache(self.cachedir, max_size=25)
+
+        keys = [cache.key(b"x = %d" % (i,), "mod.pyc", 0) for i in range(4)]
+        for idx, key in enumerate(keys):
+            cache.put(key, b"0123456789")
+            t = time.time() - 100 + idx
+            os.utime(cache._path(key), (t, t))
+
+        # Use the oldest entry, that should make it the most
+        # recently used one.
+        self.assertEqual(cache.get(keys[0]), b"0123456789")
+
+        self.assertEqual(cache.prune(), 2)
+        self.assertTrue(os.path.exists(cache._path(keys[0])))
+        self.assertFalse(os.path.exists(cache._path(keys[1])))
+        self.assertFalse(os.path.exists(cache._path(keys[2])))
+        self.assertTrue(os.path.exists(cache._path(keys[3])))
+
+    def test_byte_compile(self):
+        srcdir = os.path.join(self.tmpdir, "src")
+        os.mkdir(srcdir)
+        with open(os.path.join(srcdir, "mod.py"), "w") as stream:
+            stream.write("VALUE = 42\n")
+
+        py_files = [SourceModule("mod", os.path.join(srcdir, "mod.py"))]
+
+        cache = BytecodeCache(self.cachedir)
+        out1 = os.path.join(self.tmpdir, "out1")
+        util.byte_compile(py_files, target_dir=out1, direct=True, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        cache = BytecodeCache(self.cachedir)
+        out2 = os.path.join(self.tmpdir, "out2")
+        util.byte_compile(py_files, target_dir=out2, direct=True, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+        with open(os.path.join(out1, "mod.pyc"), "rb") as stream:
+            data1 = stream.read()
+        with open(os.path.join(out2, "mod.pyc"), "rb") as stream:
+            data2 = stream.read()
+        self.assertEqual(data1, data2)
+
+    def test_byte_compile_no_prune(self):
+        # The cache is pruned once per build, not by every
+        # call of byte_compile.
+        srcdir = os.path.join(self.tmpdir, "src")
+        os.mkdir(srcdir)
+        py_files = []
+        for name in ("mod1", "mod2"):
+            path = os.path.join(srcdir, name + ".py")
+            with open(path, "w") as stream:
+                stream.write("VALUE = 42\n")
+            py_files.append(SourceModule(name, path))
+
+        cache = BytecodeCache(self.cachedir, max_size=1)
+        util.byte_compile(
+            py_files,
+            target_dir=os.path.join(self.tmpdir, "out"),
+            direct=True,
+            cache=cache,
+        )
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(self.cachedir)), 2)
+        self.assertEqual(cache.prune(), 2)
+
+    def test_source_date_epoch(self):
+        srcdir = os.path.join(self.tmpdir, "src")
+        os.mkdir(srcdir)
+        path = os.path.join(srcdir, "mod.py")
+        with open(path, "w") as stream:
+            stream.write("VALUE = 42\n")
+        os.utime(path, (1000000, 1000000))
+
+        py_files = [SourceModule("mod", path)]
+
+        def compile_with_cache(outdir):
+            cache = BytecodeCache(self.cachedir)
+            util.byte_compile(py_files, target_dir=outdir, direct=True, cache=cache)
+            with open(os.path.join(outdir, "mod.pyc"), "rb") as stream:
+                return stream.read(), (cache.hits, cache.misses)
+
+        orig = os.environ.pop("SOURCE_DATE_EPOCH", None)
+        try:
+            os.environ["SOURCE_DATE_EPOCH"] = "0"
+            data1, stats = compile_with_cache(os.path.join(self.tmpdir, "out1"))
+            self.assertEqual(stats, (0, 1))
+
+            del os.environ["SOURCE_DATE_EPOCH"]
+            data2, stats = compile_with_cache(os.path.join(self.tmpdir, "out2"))
+            self.assertEqual(stats, (1, 0))
+
+        finally:
+            if orig is None:
+                os.environ.pop("SOURCE_DATE_EPOCH", None)
+            else:
+                os.environ["SOURCE_DATE_EPOCH"] = orig
+
+        # Hash based pyc when SOURCE_DATE_EPOCH is set, timestamp
+        # based otherwise.
+        self.assertEqual(data1[4:8], b"\x03\x00\x00\x00")
+        self.assertEqual(data2[4:8], b"\x00\x00\x00\x00")
+        self.assertEqual(data2[8:12], (1000000).to_bytes(4, "little"))
+        self.assertEqual(data1[16:], data2[16:])
+
+        with open(path, "rb") as stream:
+            source = stream.read()
+        self.assertEqual(data1[8:16], importlib.util.source_hash(source))
@@ -0,0 +1,195 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from py2app._dylib_dedup import dedup_dylibs
+from py2app._macho_cache import MachOCache, read_headers
+from py2app.progress import Progress
+
+from .tools import macho_file
+
+SITE = os.path.join("Contents", "Resources", "lib", "python3.11", "lib-dynload")
+
+
+class TestDedupDylibs(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.bundle = os.path.join(self.tmpdir, "Test.app")
+        self.frameworks = os.path.join(self.bundle, "Contents", "Frameworks")
+        self.progress = Progress(level=0)
+
+    def tearDown(self):
+        self.progress.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def make_file(self, relpath, contents):
+        path = os.path.join(self.bundle, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as stream:
+            stream.write(contents)
+        return os.path.realpath(path)
+
+    def linked(self, path):
+        (header,) = read_headers(path)
+        return [name for _idx, _kind, name in header.walkRelocatables()]
+
+    def make_vendored(self, libz=None):
+        if libz is None:
+            libz = macho_file(padding=256, text=b"libz")
+        files = {
+            "a_libz": self.make_file(
+                os.path.join(SITE, "a", ".dylibs", "libz.dylib"), libz
+            ),
+            "b_libz": self.make_file(
+                os.path.join(SITE, "b", ".dylibs", "libz.dylib"), libz
+            ),
+            "a_ext": self.make_file(
+                os.path.join(SITE, "a", "_ext.so"),
+                macho_file(
+                    padding=256, dylibs=["@loader_path/.dylibs/libz.dylib"], text=b"a"
+                ),
+            ),
+            "b_ext": self.make_file(
+                os.path.join(SITE, "b", "_ext.so"),
+                macho_file(
+                    padding=256,
+                    dylibs=["@rpath/libz.dylib"],
+                    rpaths=["@loader_path/.dylibs"],
+                    text=b"b",
+                ),
+            ),
+        }
+        return files
+
+    def test_dedup(self):
+        files = self.make_vendored()
+        size = os.path.getsize(files["a_libz"])
+
+        result = dedup_dylibs(self.bundle, files.values(), self.progress)
+
+        canonical = os.path.join(self.frameworks, "libz.dylib")
+        self.assertFalse(os.path.islink(canonical))
+        for key in ("a_libz", "b_libz"):
+            self.assertTrue(os.path.islink(files[key]))
+            self.assertEqual(os.path.realpath(files[key]), canonical)
+
+        self.assertEqual(result.duplicates, 2)
+        self.assertEqual(result.saved, size)
+        self.assertEqual(
+            result.files, sorted([files["a_ext"], files["b_ext"], canonical])
+        )
+
+        expected = "@loader_path/../../../../../Frameworks/libz.dylib"
+        self.assertEqual(self.linked(files["a_ext"]), [expected])
+        self.assertEqual(self.linked(files["b_ext"]), [expected])
+
+    def test_canonical_in_frameworks(self):
+        libz = macho_file(padding=256, text=b"libz")
+        files = self.make_vendored(libz)
+        canonical = self.make_file(os.path.join(self.frameworks, "libz.dylib"), libz)
+
+        result = dedup_dylibs(
+            self.bundle, list(files.values()) + [canonical], self.progress
+        )
+
+        self.assertEqual(result.duplicates, 2)
+        self.assertFalse(os.path.islink(canonical))
+        self.assertEqual(os.path.realpath(files["a_libz"]), canonical)
+
+    def test_name_conflict(self):
+        files = self.make_vendored()
+        other = self.make_file(
+            os.path.join(self.frameworks, "libz.dylib"),
+            macho_file(padding=256, text=b"other libz"),
+        )
+
+        result = dedup_dylibs(
+            self.bundle, list(files.values()) + [other], self.progress
+        )
+
+        (canonical,) = {os.path.realpath(files[k]) for k in ("a_libz", "b_libz")}
+        self.assertNotEqual(canonical, other)
+        self.assertEqual(os.path.dirname(canonical), self.frameworks)
+        self.assertIn(canonical, result.files)
+        self.assertIn(other, result.files)
+
+    def test_canonical_loader_path(self):
+        # The copy in Contents/Frameworks uses @loader_path references
+        # relative to the location of the original copy.
+        files = self.make_vendored()
+        libssl = macho_file(
+            padding=256, dylibs=["@loader_path/libcrypto.dylib"], text=b"libssl"
+        )
+        for pkg in ("a", "b"):
+            self.make_file(os.path.join(SITE, pkg, ".dylibs", "libssl.dylib"), libssl)
+        crypto = self.make_file(
+            os.path.join(SITE, "a", ".dylibs", "libcrypto.dylib"),
+            macho_file(padding=256, text=b"libcrypto a"),
+        )
+        self.make_file(
+            os.path.join(SITE, "b", ".dylibs", "libcrypto.dylib"),
+            macho_file(padding=256, text=b"libcrypto b"),
+        )
+        paths = list(files.values())
+        for pkg in ("a", "b"):
+            for name in ("libssl.dylib", "libcrypto.dylib"):
+                paths.append(os.path.join(self.bundle, SITE, pkg, ".dylibs", name))
+
+        dedup_dylibs(self.bundle, paths, self.progress)
+
+        canonical = os.path.join(self.frameworks, "libssl.dylib")
+        self.assertEqual(
+            self.linked(canonical),
+            ["@loader_path/" + os.path.relpath(crypto, self.frameworks)],
+        )
+
+    def test_no_space(self):
+        # The load commands of the copy in Contents/Frameworks can
+        # not be updated, the dylib is not deduplicated.
+        libssl = macho_file(dylibs=["@loader_path/libcrypto.dylib"], text=b"libssl")
+        paths = []
+        for pkg in ("a", "b"):
+            paths.append(
+                self.make_file(
+                    os.path.join(SITE, pkg, ".dylibs", "libssl.dylib"), libssl
+                )
+            )
+            paths.append(
+                self.make_file(
+                    os.path.join(SITE, pkg, ".dylibs", "libcrypto.dylib"),
+                    macho_file(text=pkg.encode()),
+                )
+            )
+
+        result = dedup_dylibs(self.bundle, paths, self.progress)
+
+        self.assertEqual(result.duplicates, 0)
+        self.assertEqual(result.files, sorted(paths))
+        self.assertFalse(any(os.path.islink(path) for path in paths))
+        self.assertFalse(os.path.exists(self.frameworks))
+
+    def test_no_duplicates(self):
+        paths = [
+            self.make_file(
+                os.path.join(SITE, "a", ".dylibs", "libz.dylib"), macho_file(text=b"a")
+            ),
+            self.make_file(
+                os.path.join(SITE, "b", ".dylibs", "libz.dylib"), macho_file(text=b"b")
+            ),
+        ]
+
+        result = dedup_dylibs(self.bundle, paths, self.progress)
+
+        self.assertEqual(result, (sorted(paths), 0, 0))
+
+    def test_macho_cache(self):
+        files = self.make_vendored()
+        cache = MachOCache()
+
+        result = dedup_dylibs(
+            self.bundle, files.values(), self.progress, macho_cache=cache
+        )
+
+        self.assertEqual(result.duplicates, 2)
+        self.assertEqual(cache.misses, 3)
@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 from py2app import filters
@@ -47,3 +50,57 @@ class FilterTest(unittest.TestCase):
             self.assertTrue(filters.not_system_filter(Node("/tmp/foo")))
         finally:
             filters.in_system_path = cur_func
+
+
+class PathClassifierTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_is_stdlib(self):
+        prefix = os.path.join(self.tmpdir, "python")
+        classifier = filters.PathClassifier(prefix)
+
+        self.assertTrue(classifier.is_stdlib(prefix + "/lib/os.py"))
+        self.assertFalse(classifier.is_stdlib(prefix + "/lib/site-packages/foo.py"))
+        self.assertFalse(classifier.is_stdlib(prefix + "/lib/site-python/foo.py"))
+        self.assertFalse(classifier.is_stdlib(prefix + "rest/foo.py"))
+        self.assertFalse(classifier.is_stdlib("/foo/bar.py"))
+
+        for path in (
+            prefix + "/lib/os.py",
+            prefix + "/lib/site-packages/foo.py",
+            "/foo/bar.py",
+        ):
+            self.assertEqual(
+                classifier.is_stdlib(path),
+                not filters.not_stdlib_filter(Node(path), prefix),
+            )
+
+    def test_in_package(self):
+        pkgdir = os.path.join(self.tmpdir, "pkg")
+        os.mkdir(pkgdir)
+        os.symlink(pkgdir, os.path.join(self.tmpdir, "link"))
+
+        classifier = filters.PathClassifier(
+            os.path.join(self.tmpdir, "python"), [pkgdir + os.sep]
+        )
+        self.assertTrue(classifier.in_package(os.path.join(pkgdir, "mod.py")))
+        self.assertTrue(classifier.in_package(os.path.join(pkgdir, "sub", "mod.py")))
+        self.assertTrue(
+            classifier.in_package(os.path.join(self.tmpdir, "link", "mod.py"))
+        )
+        self.assertFalse(classifier.in_package(pkgdir + "2/mod.py"))
+        self.assertFalse(classifier.in_package(os.path.join(self.tmpdir, "mod.py")))
+
+    def test_realpath(self):
+        os.mkdir(os.path.join(self.tmpdir, "dir"))
+        os.symlink("dir", os.path.join(self.tmpdir, "link"))
+        os.symlink("other.py", os.path.join(self.tmpdir, "dir", "mod.py"))
+
+        classifier = filters.PathClassifier()
+        for relpath in ("link/mod.py", "link/other.py", "dir/../link/x.py"):
+            path = os.path.join(self.tmpdir, relpath)
+            self.assertEqual(classifier.realpath(path), os.path.realpath(path))
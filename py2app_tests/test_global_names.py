@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from py2app._global_names import (
+    MIN_PARALLEL_SCAN,
+    GlobalNamesCache,
+    code_key,
+    scan_global_reads,
+)
+
+from .tools import run_unguarded_script
+
+SOURCE = """\
+import os
+
+def function():
+    return __file__, a, b, c, d
+
+class Class:
+    def method(self):
+        return e
+"""
+
+
+class TestGlobalNames(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmpdir, "cache", "names.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_scan(self):
+        names = scan_global_reads(compile(SOURCE, "mod.py", "exec"))
+        self.assertEqual(names, {"__file__", "a", "b", "c", "d", "e", "__name__"})
+
+    def test_code_key(self):
+        self.assertEqual(
+            code_key(compile(SOURCE, "mod.py", "exec")),
+            code_key(compile(SOURCE, "other.py", "exec")),
+        )
+        self.assertNotEqual(
+            code_key(compile(SOURCE, "mod.py", "exec")),
+            code_key(compile(SOURCE.replace("e\n", "f\n"), "mod.py", "exec")),
+        )
+
+    def test_cache(self):
+        codes = {
+            "mod": compile(SOURCE, "mod.py", "exec"),
+            "copy": compile(SOURCE, "copy.py", "exec"),
+            "other": compile("x = y", "other.py", "exec"),
+        }
+        cache = GlobalNamesCache(self.cache_file)
+        result = cache.global_reads(codes)
+        self.assertIn("__file__", result["mod"])
+        self.assertEqual(result["copy"], result["mod"])
+        self.assertEqual(result["other"], {"y"})
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        cache.save()
+
+        cache = GlobalNamesCache(self.cache_file)
+        self.assertEqual(cache.global_reads(codes), result)
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+
+        # Entries that are not used are dropped when saving
+        cache = GlobalNamesCache(self.cache_file)
+        cache.global_reads({"other": codes["other"]})
+        cache.save()
+        cache = GlobalNamesCache(self.cache_file)
+        cache.global_reads(codes)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_detect_dunder_file(self):
+        from modulegraph import modulegraph
+
+        from py2app import filters
+        from py2app.recipes import detect_dunder_file
+
+        class Command:
+            def __init__(self, cache):
+                self.cache = cache
+                self.filtered = []
+
+            def not_stdlib_filter(self, node):
+                self.filtered.append(node.identifier)
+                return node.identifier != "stdlib_mod"
+
+            def get_global_names_cache(self):
+                return self.cache
+
+            class progress:
+                @staticmethod
+                def info(message):
+                    pass
+
+        mf = modulegraph.ModuleGraph()
+        for name, source in (
+            ("pkg.mod", SOURCE),
+            ("other", "x = y"),
+            ("stdlib_mod", SOURCE),
+        ):
+            node = mf.createNode(modulegraph.SourceModule, name)
+            node.filename = os.path.join(self.tmpdir, name + ".py")
+            node.code = compile(source, node.filename, "exec")
+            mf.createReference(None, node)
+
+        filters._stdlib_classifier.cache_clear()
+        cmd = Command(GlobalNamesCache(self.cache_file))
+        self.assertEqual(detect_dunder_file.check(cmd, mf), {"packages": {"pkg"}})
+
+        # The classifier of the build is used, the recipe
+        # doesn't create another one.
+        self.assertEqual(sorted(cmd.filtered), ["other", "pkg.mod", "stdlib_mod"])
+        self.assertEqual(filters._stdlib_classifier.cache_info().currsize, 0)
+
+    def test_parallel(self):
+        codes = {
+            f"mod{i}": compile(f"x = name{i}", f"mod{i}.py", "exec")
+            for i in range(MIN_PARALLEL_SCAN)
+        }
+        result = GlobalNamesCache(max_workers=2).global_reads(codes)
+        for i in range(MIN_PARALLEL_SCAN):
+            self.assertEqual(result[f"mod{i}"], {f"name{i}"})
+
+    def test_parallel_unguarded_main(self):
+        # Worker processes must not run the __main__ module (the
+        # setup.py file) again, even when "spawn" is the default.
+        proc, runs = run_unguarded_script(
+            self.tmpdir,
+            """
+            from py2app._global_names import MIN_PARALLEL_SCAN, GlobalNamesCache
+
+            codes = {
+                f"mod{i}": compile(f"x = name{i}", f"mod{i}.py", "exec")
+                for i in range(MIN_PARALLEL_SCAN)
+            }
+            result = GlobalNamesCache(max_workers=2).global_reads(codes)
+            assert result["mod1"] == {"name1"}, result["mod1"]
+            """,
+        )
+        self.assertEqual(proc.returncode, 0, proc.stdout.decode())
+        self.assertEqual(runs, 1)
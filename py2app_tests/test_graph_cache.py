@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from modulegraph import modulegraph
+from modulegraph.find_modules import find_modules
+
+from py2app._graph_cache import GraphCache
+
+
+class TestGraphCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.srcdir = os.path.join(self.tmpdir, "src")
+        os.mkdir(self.srcdir)
+
+        self.write("script.py", "import mod_a\n")
+        self.write("mod_a.py", "import mod_b\nimport mod_c\n")
+        self.write("mod_b.py", "import mod_d\n")
+        self.write("mod_d.py", "")
+
+        self.script = os.path.join(self.srcdir, "script.py")
+        self.cache_file = os.path.join(self.tmpdir, "cache", "graph.pickle")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, contents):
+        path = os.path.join(self.srcdir, name)
+        with open(path, "w") as stream:
+            stream.write(contents)
+
+        # Make sure the change is visible even on filesystems
+        # with a coarse timestamp resolution.
+        t = time.time() + 10
+        os.utime(path, (t, t))
+        os.utime(self.srcdir, (t + 1, t + 1))
+
+    def build_graph(self):
+        mf = find_modules(scripts=[self.script], path=[self.srcdir])
+        cache = GraphCache(self.cache_file, "key")
+        cache.save(mf, [("recipe", {"includes": ["mod_d"]})])
+        return mf
+
+    def load_graph(self, key="key"):
+        cache = GraphCache(self.cache_file, key)
+        mf, recipes = cache.load(
+            scripts=[self.script], includes=(), packages=(), excludes=()
+        )
+        return cache, mf, recipes
+
+    def test_reuse(self):
+        self.build_graph()
+
+        cache, mf, recipes = self.load_graph()
+        self.assertIsNot(mf, None)
+        self.assertEqual(recipes, [("recipe", {"includes": ["mod_d"]})])
+        self.assertEqual(cache.nodes_reused, cache.nodes_total)
+        self.assertEqual(cache.nodes_rescanned, 0)
+
+        node = mf.findNode("mod_a")
+        self.assertIsInstance(node, modulegraph.SourceModule)
+        self.assertIsNot(node.code, None)
+
+    def test_changed_distribution(self):
+        # Recipe results are not reused when distributions
+        # on the search path were installed or changed.
+        dist_info = os.path.join(self.srcdir, "dist-1.0.dist-info")
+        os.mkdir(dist_info)
+        self.write("dist-1.0.dist-info/RECORD", "mod_d.py,,\n")
+        self.build_graph()
+
+        cache, mf, recipes = self.load_graph()
+        self.assertIsNot(recipes, None)
+        self.assertTrue(cache.report().endswith("recipes replayed"))
+
+        with open(os.path.join(dist_info, "RECORD"), "a") as stream:
+            stream.write("mod_c.py,,\n")
+
+        cache, mf, recipes = self.load_graph()
+        self.assertIsNot(mf, None)
+        self.assertIs(recipes, None)
+        self.assertEqual(cache.nodes_reused, cache.nodes_total)
+        self.assertTrue(cache.report().endswith("recipes run"))
+
+        self.build_graph()
+        shutil.rmtree(dist_info)
+        cache, mf, recipes = self.load_graph()
+        self.assertIs(recipes, None)
+
+    def test_different_key(self):
+        self.build_graph()
+
+        cache, mf, recipes = self.load_graph("other")
+        self.assertIs(mf, None)
+        self.assertIs(recipes, None)
+
+    def test_no_cache(self):
+        cache, mf, recipes = self.load_graph()
+        self.assertIs(mf, None)
+        self.assertIs(recipes, None)
+
+    def test_changed_module(self):
+        self.build_graph()
+        self.write("mod_b.py", "import mod_e\n")
+        self.write("mod_e.py", "")
+
+        cache, mf, recipes = self.load_graph()
+        self.assertIs(recipes, None)
+        self.assertEqual(cache.nodes_rescanned, 1)
+
+        self.assertIsInstance(mf.findNode("mod_e"), modulegraph.SourceModule)
+        self.assertIn(mf.findNode("mod_e"), mf.getReferences(mf.findNode("mod_b")))
+        self.assertIn(mf.findNode("mod_b"), mf.getReferences(mf.findNode("mod_a")))
+
+        # mod_d is no longer imported by anything
+        self.assertIs(mf.findNode("mod_d"), None)
+
+    def test_resolved_missing_module(self):
+        mf = self.build_graph()
+        self.assertIsInstance(mf.findNode("mod_c"), modulegraph.MissingModule)
+
+        self.write("mod_c.py", "import mod_d\n")
+
+        cache, mf, recipes = self.load_graph()
+        self.assertIs(recipes, None)
+        self.assertIsInstance(mf.findNode("mod_c"), modulegraph.SourceModule)
+        self.assertIn(mf.findNode("mod_c"), mf.getReferences(mf.findNode("mod_a")))
+        self.assertIn(mf.findNode("mod_d"), mf.getReferences(mf.findNode("mod_c")))
+
+    def test_touched_module(self):
+        self.build_graph()
+        self.write("mod_b.py", "import mod_d\n")
+
+        cache, mf, recipes = self.load_graph()
+        self.assertIsNot(recipes, None)
+        self.assertEqual(cache.nodes_reused, cache.nodes_total)
@@ -0,0 +1,105 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from py2app import _import_check
+from py2app._import_check import (
+    ATTRIBUTE,
+    MISSING,
+    MODULE,
+    ImportChecker,
+    resolve_isolated,
+    resolve_static,
+)
+
+
+class TestImportCheck(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.site = os.path.join(self.tmpdir, "site")
+        self.cache_file = os.path.join(self.tmpdir, "cache", "check.json")
+
+        self.write(
+            "pkg_ic/__init__.py",
+            "import os\n"
+            "from .mod import function\n"
+            "if True:\n"
+            "    value = 1\n"
+            "raise RuntimeError('imported')\n",
+        )
+        self.write("pkg_ic/mod.py", "def function(): pass\n")
+        self.write(
+            "dynamic_ic.py",
+            "import sys\n"
+            "def __getattr__(name):\n"
+            "    if name == 'lazy':\n"
+            "        return sys\n"
+            "    raise AttributeError(name)\n",
+        )
+        sys.path.insert(0, self.site)
+
+    def tearDown(self):
+        sys.path.remove(self.site)
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, relpath, contents):
+        path = os.path.join(self.site, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as stream:
+            stream.write(contents)
+
+    def test_static(self):
+        self.assertEqual(resolve_static("pkg_ic"), MODULE)
+        self.assertEqual(resolve_static("pkg_ic.mod"), MODULE)
+        self.assertEqual(resolve_static("pkg_ic.os"), MODULE)
+        self.assertEqual(resolve_static("pkg_ic.value"), ATTRIBUTE)
+        self.assertEqual(resolve_static("pkg_ic.nosuchname"), MISSING)
+        self.assertEqual(resolve_static("pkg_ic.nosuchmod.name"), MISSING)
+        self.assertEqual(resolve_static("nosuchmodule_ic"), MISSING)
+        self.assertEqual(resolve_static("nosuchmodule_ic.name"), MISSING)
+        self.assertEqual(resolve_static("os.path"), MODULE)
+        self.assertEqual(resolve_static("sys.nosuchname"), MISSING)
+
+        for name in ("pkg_ic.function", "dynamic_ic.lazy"):
+            with self.assertRaises(_import_check._Unknown):
+                resolve_static(name)
+
+        self.assertNotIn("pkg_ic", sys.modules)
+        self.assertNotIn("dynamic_ic", sys.modules)
+
+    def test_isolated(self):
+        self.assertEqual(resolve_isolated("dynamic_ic.lazy", sys.path), MODULE)
+        self.assertEqual(resolve_isolated("dynamic_ic.other", sys.path), MISSING)
+        self.assertEqual(resolve_isolated("pkg_ic.function", sys.path), MISSING)
+        self.assertNotIn("dynamic_ic", sys.modules)
+
+    def test_timeout(self):
+        self.write("slow_ic.py", "import time\ntime.sleep(30)\n")
+        self.assertIs(resolve_isolated("slow_ic.name", sys.path, timeout=0.5), None)
+
+    def test_checker(self):
+        names = ["pkg_ic.value", "dynamic_ic.lazy", "nosuchmodule_ic"]
+        checker = ImportChecker(self.cache_file)
+        result = checker.check(names)
+        self.assertEqual(
+            result,
+            {
+                "pkg_ic.value": ATTRIBUTE,
+                "dynamic_ic.lazy": MODULE,
+                "nosuchmodule_ic": MISSING,
+            },
+        )
+        self.assertEqual((checker.static, checker.isolated), (2, 1))
+        checker.save()
+
+        checker = ImportChecker(self.cache_file)
+        self.assertEqual(checker.check(names), result)
+        self.assertEqual((checker.isolated, checker.cached), (0, 1))
+
+        # Changes to the environment invalidate the cache
+        self.write("new_ic.py", "")
+        checker = ImportChecker(self.cache_file)
+        self.assertEqual(checker.check(names), result)
+        self.assertEqual((checker.isolated, checker.cached), (1, 0))
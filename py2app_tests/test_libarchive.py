@@ -0,0 +1,324 @@
+import importlib.util
+import marshal
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from modulegraph.find_modules import find_modules
+from modulegraph.modulegraph import Package, SourceModule
+
+from py2app import _libarchive
+from py2app._libarchive import (
+    CompressionPolicy,
+    LibArchive,
+    ParallelZipWriter,
+    parse_compression_rule,
+    startup_entries,
+)
+from py2app.util import byte_compile_to_archive
+
+from .tools import run_unguarded_script
+
+
+class TestParallelZipWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = []
+
+        for idx in range(20):
+            relpath = os.path.join("pkg%d" % (idx % 3,), "mod%d.py" % (idx,))
+            path = os.path.join(self.tmpdir, relpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as stream:
+                stream.write(b"value = %d\n" % (idx,) * (idx * 100))
+            self.files.append(relpath)
+
+        with open(os.path.join(self.tmpdir, "random.bin"), "wb") as stream:
+            stream.write(os.urandom(100000))
+        self.files.append("random.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_archive(self, name, compression, parallel, max_workers=4):
+        archive = os.path.join(self.tmpdir, name)
+        with zipfile.ZipFile(archive, "w", compression=compression) as zf:
+            writer = ParallelZipWriter(zf, max_workers) if parallel else zf
+            seen = set()
+            for relpath in self.files:
+                dirname = os.path.dirname(relpath)
+                if dirname and dirname not in seen:
+                    writer.write(os.path.join(self.tmpdir, dirname), dirname)
+                    seen.add(dirname)
+                writer.write(os.path.join(self.tmpdir, relpath), relpath)
+            if parallel:
+                writer.close()
+
+        with open(archive, "rb") as stream:
+            return stream.read()
+
+    def test_same_as_serial(self):
+        for compression in (zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED):
+            serial = self.make_archive("serial.zip", compression, False)
+            parallel = self.make_archive("parallel.zip", compression, True)
+            self.assertEqual(serial, parallel)
+
+    def test_single_worker(self):
+        serial = self.make_archive("serial.zip", zipfile.ZIP_DEFLATED, False)
+        parallel = self.make_archive("parallel.zip", zipfile.ZIP_DEFLATED, True, 1)
+        self.assertEqual(serial, parallel)
+
+    def test_large_files(self):
+        orig = _libarchive.MAX_BUFFERED_SIZE
+        _libarchive.MAX_BUFFERED_SIZE = 1000
+        try:
+            serial = self.make_archive("serial.zip", zipfile.ZIP_DEFLATED, False)
+            parallel = self.make_archive("parallel.zip", zipfile.ZIP_DEFLATED, True)
+        finally:
+            _libarchive.MAX_BUFFERED_SIZE = orig
+        self.assertEqual(serial, parallel)
+
+    def test_public_api_fallback(self):
+        # Entries are compressed on the writer thread when the
+        # internals of ZipFile cannot be used.
+        orig = _libarchive.PRECOMPRESSED_VERSIONS
+        _libarchive.PRECOMPRESSED_VERSIONS = ((0, 0), (0, 0))
+        try:
+            serial = self.make_archive("serial.zip", zipfile.ZIP_DEFLATED, False)
+            parallel = self.make_archive("parallel.zip", zipfile.ZIP_DEFLATED, True)
+        finally:
+            _libarchive.PRECOMPRESSED_VERSIONS = orig
+        self.assertEqual(serial, parallel)
+
+    def test_contents(self):
+        self.make_archive("parallel.zip", zipfile.ZIP_DEFLATED, True)
+        with zipfile.ZipFile(os.path.join(self.tmpdir, "parallel.zip")) as zf:
+            self.assertIs(zf.testzip(), None)
+            for relpath in self.files:
+                with open(os.path.join(self.tmpdir, relpath), "rb") as stream:
+                    self.assertEqual(zf.read(relpath), stream.read())
+
+
+class TestLibArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.archive = os.path.join(self.tmpdir, "python.zip")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, relpath, contents):
+        path = os.path.join(self.tmpdir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as stream:
+            stream.write(contents)
+        return path
+
+    def test_entries(self):
+        data_dir = os.path.dirname(self.write("data/sub/file.txt", "data"))
+        self.write("data/.git/config", "junk")
+        self.write("data/top.txt", "x" * 1000)
+
+        with LibArchive(self.archive, CompressionPolicy("startup-optimized")) as lib:
+            lib.add_bytes("ns/mod.pyc", b"bytecode", 0)
+            lib.add_file(self.write("other.txt", "other"), "ns/other.txt")
+            lib.add_tree(
+                os.path.dirname(data_dir),
+                "pkg/data",
+                lambda path: os.path.basename(path) != ".git",
+            )
+
+        with zipfile.ZipFile(self.archive) as zf:
+            self.assertIs(zf.testzip(), None)
+            self.assertEqual(
+                zf.namelist(),
+                [
+                    "ns/",
+                    "ns/mod.pyc",
+                    "ns/other.txt",
+                    "pkg/data/sub/",
+                    "pkg/data/sub/file.txt",
+                    "pkg/data/",
+                    "pkg/data/top.txt",
+                ],
+            )
+            self.assertEqual(zf.read("ns/mod.pyc"), b"bytecode")
+            self.assertEqual(zf.read("pkg/data/sub/file.txt"), b"data")
+            self.assertEqual(zf.getinfo("ns/mod.pyc").date_time, (1980, 1, 1, 0, 0, 0))
+            self.assertEqual(
+                zf.getinfo("pkg/data/top.txt").compress_type, zipfile.ZIP_DEFLATED
+            )
+            self.assertEqual(
+                zf.getinfo("pkg/data/sub/file.txt").compress_type, zipfile.ZIP_STORED
+            )
+
+    def test_duplicates(self):
+        data_dir = os.path.dirname(self.write("data/mod.pyc", "data"))
+
+        with LibArchive(self.archive, CompressionPolicy("deflate")) as lib:
+            lib.add_bytes("pkg/mod.pyc", b"bytecode", 0)
+            lib.add_bytes("pkg/mod.pyc", b"other", 0)
+            lib.add_tree(data_dir, "pkg")
+            lib.add_file(self.write("other.txt", "other"), "pkg/mod.pyc")
+
+        self.assertEqual(lib.skipped, ["pkg/mod.pyc"] * 3)
+        with zipfile.ZipFile(self.archive) as zf:
+            self.assertEqual(zf.namelist(), ["pkg/", "pkg/mod.pyc"])
+            self.assertEqual(zf.read("pkg/mod.pyc"), b"bytecode")
+
+    def test_from_zipfile(self):
+        source = os.path.join(self.tmpdir, "source.zip")
+        with zipfile.ZipFile(source, "w") as zf:
+            zf.writestr("pkg/data/file.txt", "data")
+
+        with LibArchive(self.archive, CompressionPolicy("deflate")) as lib:
+            lib.add_tree(os.path.join(source, "pkg", "data"), "pkg/data")
+
+        with zipfile.ZipFile(self.archive) as zf:
+            self.assertEqual(zf.read("pkg/data/file.txt"), b"data")
+
+    def test_byte_compile(self):
+        py_files = [
+            SourceModule("mod", self.write("mod.py", "value = __debug__\n")),
+            Package("pkg", self.write("pkg/__init__.py", "")),
+            SourceModule("broken", self.write("broken.py", "def\n")),
+        ]
+        py_files[1].packagepath = [os.path.dirname(py_files[1].filename)]
+
+        for jobs in (None, 2):
+            for optimize in (0, 1):
+                with LibArchive(self.archive, CompressionPolicy("deflate")) as lib:
+                    byte_compile_to_archive(py_files, lib, optimize=optimize, jobs=jobs)
+
+                with zipfile.ZipFile(self.archive) as zf:
+                    self.assertEqual(
+                        zf.namelist(), ["mod.pyc", "pkg/", "pkg/__init__.pyc"]
+                    )
+                    data = zf.read("mod.pyc")
+
+                self.assertEqual(data[:4], importlib.util.MAGIC_NUMBER)
+                code = marshal.loads(data[16:])
+                self.assertEqual(code.co_filename, "mod.pyc")
+                namespace = {}
+                exec(code, namespace)
+                self.assertEqual(namespace["value"], optimize == 0)
+
+    def test_byte_compile_unguarded_main(self):
+        # Worker processes must not run the __main__ module (the
+        # setup.py file) again, even when "spawn" is the default.
+        source = self.write("mod.py", "value = 1\n")
+        proc, runs = run_unguarded_script(
+            self.tmpdir,
+            f"""
+            from modulegraph.modulegraph import SourceModule
+            from py2app._libarchive import CompressionPolicy, LibArchive
+            from py2app.util import byte_compile_to_archive
+
+            py_files = [SourceModule("mod", {source!r})]
+            with LibArchive({self.archive!r}, CompressionPolicy("deflate")) as lib:
+                byte_compile_to_archive(py_files, lib, jobs=2)
+            """,
+        )
+        self.assertEqual(proc.returncode, 0, proc.stdout.decode())
+        self.assertEqual(runs, 1)
+        with zipfile.ZipFile(self.archive) as zf:
+            self.assertEqual(zf.namelist(), ["mod.pyc"])
+
+
+class TestCompressionPolicy(unittest.TestCase):
+    def test_presets(self):
+        policy = CompressionPolicy("deflate")
+        self.assertEqual(policy.compression_for("a.pyc", 1), zipfile.ZIP_DEFLATED)
+
+        policy = CompressionPolicy("store")
+        self.assertEqual(policy.compression_for("a.pyc", 10000), zipfile.ZIP_STORED)
+
+        policy = CompressionPolicy("startup-optimized", startup_entries={"a.pyc"})
+        self.assertEqual(policy.compression_for("a.pyc", 10000), zipfile.ZIP_STORED)
+        self.assertEqual(policy.compression_for("b.pyc", 10000), zipfile.ZIP_DEFLATED)
+        self.assertEqual(policy.compression_for("b.pyc", 10), zipfile.ZIP_STORED)
+        self.assertEqual(
+            policy.compression_for("pkg/image.PNG", 10000), zipfile.ZIP_STORED
+        )
+
+        self.assertRaises(ValueError, CompressionPolicy, "fast")
+
+    def test_rules(self):
+        policy = CompressionPolicy(
+            "startup-optimized",
+            ["pkg/*=deflate", "*.dat = store"],
+            startup_entries={"pkg/a.pyc"},
+        )
+        self.assertEqual(
+            policy.compression_for("pkg/a.pyc", 10000), zipfile.ZIP_DEFLATED
+        )
+        self.assertEqual(
+            policy.compression_for("pkg/data.dat", 10000), zipfile.ZIP_DEFLATED
+        )
+        self.assertEqual(
+            policy.compression_for("other/data.dat", 10000), zipfile.ZIP_STORED
+        )
+
+    def test_parse_rule(self):
+        self.assertEqual(
+            parse_compression_rule("*.pyc=store"), ("*.pyc", zipfile.ZIP_STORED)
+        )
+        self.assertRaises(ValueError, parse_compression_rule, "*.pyc")
+        self.assertRaises(ValueError, parse_compression_rule, "=store")
+        self.assertRaises(ValueError, parse_compression_rule, "*.pyc=bzip2")
+
+    def test_per_entry_compression(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for name in ("a.txt", "b.txt"):
+                with open(os.path.join(tmpdir, name), "w") as stream:
+                    stream.write("x" * 10000)
+
+            archive = os.path.join(tmpdir, "archive.zip")
+            with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+                with ParallelZipWriter(zf, 2) as writer:
+                    writer.write(
+                        os.path.join(tmpdir, "a.txt"), "a.txt", zipfile.ZIP_STORED
+                    )
+                    writer.write(os.path.join(tmpdir, "b.txt"), "b.txt")
+
+            with zipfile.ZipFile(archive) as zf:
+                self.assertEqual(zf.getinfo("a.txt").compress_type, zipfile.ZIP_STORED)
+                self.assertEqual(
+                    zf.getinfo("b.txt").compress_type, zipfile.ZIP_DEFLATED
+                )
+                self.assertEqual(zf.read("a.txt"), zf.read("b.txt"))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class TestStartupEntries(unittest.TestCase):
+    def test_startup_entries(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            files = {
+                "script.py": "import mod_a\nimport pkg.sub\n"
+                "try:\n    import mod_b\nexcept ImportError:\n    pass\n",
+                "mod_a.py": "def f():\n    import mod_c\n",
+                "mod_b.py": "",
+                "mod_c.py": "",
+                "pkg/__init__.py": "",
+                "pkg/sub.py": "if True:\n    import mod_d\n",
+                "mod_d.py": "",
+            }
+            for relpath, contents in files.items():
+                path = os.path.join(tmpdir, relpath)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as stream:
+                    stream.write(contents)
+
+            script = os.path.join(tmpdir, "script.py")
+            mf = find_modules(scripts=[script], path=[tmpdir])
+            self.assertEqual(
+                startup_entries(mf, [script]),
+                {"mod_a.pyc", "pkg/__init__.pyc", "pkg/sub.pyc"},
+            )
+        finally:
+            shutil.rmtree(tmpdir)
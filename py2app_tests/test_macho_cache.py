@@ -0,0 +1,145 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from macholib.MachO import MachO
+
+from py2app._macho_cache import CachedMachO, MachOCache, _header_digest, read_headers
+
+from .tools import fat_file, macho_file
+
+
+class TestMachOCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmpdir, "cache", "macho.json")
+        self.path = self.make_file(
+            "libfoo.dylib",
+            macho_file(
+                nlocalsym=3,
+                install_name="/opt/lib/libfoo.dylib",
+                dylibs=["@rpath/libbar.dylib", "/usr/lib/libSystem.B.dylib"],
+                rpaths=["@loader_path/../lib"],
+            ),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_file(self, name, contents):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "wb") as stream:
+            stream.write(contents)
+        return path
+
+    def test_read_headers(self):
+        (header,) = read_headers(self.path)
+        self.assertEqual(header.filetype, "dylib")
+        self.assertEqual(header.install_name, "/opt/lib/libfoo.dylib")
+        self.assertEqual(header.rpaths, ["@loader_path/../lib"])
+        self.assertEqual(header.nlocalsym, 3)
+        self.assertEqual(
+            list(header.walkRelocatables()),
+            [
+                (0, "load_dylib", "@rpath/libbar.dylib"),
+                (1, "load_dylib", "/usr/lib/libSystem.B.dylib"),
+            ],
+        )
+
+        self.assertIs(read_headers(self.make_file("text.txt", b"hello")), None)
+        self.assertIs(read_headers(os.path.join(self.tmpdir, "missing")), None)
+
+    def test_cache(self):
+        cache = MachOCache(self.cache_file)
+        headers = cache.headers(self.path)
+        self.assertEqual(headers, read_headers(self.path))
+        self.assertIs(cache.headers(self.path), headers)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.save()
+
+        # A copy of the file uses the same entry
+        copy = os.path.join(self.tmpdir, "copy.dylib")
+        shutil.copyfile(self.path, copy)
+        cache = MachOCache(self.cache_file)
+        self.assertEqual(cache.headers(self.path), headers)
+        self.assertEqual(cache.headers(copy), headers)
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+
+        # Changing the file invalidates the entry
+        with open(copy, "wb") as stream:
+            stream.write(macho_file(nlocalsym=0))
+        self.assertEqual(cache.headers(copy)[0].nlocalsym, 0)
+        self.assertEqual(cache.misses, 1)
+        cache.save()
+
+        with open(self.cache_file) as stream:
+            data = json.load(stream)
+        self.assertEqual(len(data["paths"]), 2)
+        self.assertEqual(len(data["files"]), 2)
+
+    def test_header_digest(self):
+        # Only the headers and load commands are hashed, other
+        # parts of the file don't affect the digest.
+        path1 = self.make_file("lib1.dylib", macho_file(text=b"AAAA"))
+        path2 = self.make_file("lib2.dylib", macho_file(text=b"BBBB"))
+        path3 = self.make_file("lib3.dylib", macho_file(nlocalsym=1, text=b"AAAA"))
+        self.assertEqual(_header_digest(path1), _header_digest(path2))
+        self.assertNotEqual(_header_digest(path1), _header_digest(path3))
+
+        fat1 = self.make_file(
+            "fat1.dylib", fat_file(macho_file(text=b"AAAA"), macho_file(cpusubtype=2))
+        )
+        fat2 = self.make_file(
+            "fat2.dylib", fat_file(macho_file(text=b"BBBB"), macho_file(cpusubtype=2))
+        )
+        fat3 = self.make_file(
+            "fat3.dylib",
+            fat_file(macho_file(text=b"AAAA"), macho_file(cpusubtype=2, nlocalsym=1)),
+        )
+        self.assertEqual(_header_digest(fat1), _header_digest(fat2))
+        self.assertNotEqual(_header_digest(fat1), _header_digest(fat3))
+
+        cache = MachOCache()
+        self.assertEqual(cache.headers(fat1), read_headers(fat1))
+        self.assertEqual(cache.headers(fat2), read_headers(fat2))
+        self.assertEqual(cache.headers(fat3), read_headers(fat3))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        self.assertNotEqual(
+            _header_digest(self.make_file("text1.txt", b"hello")),
+            _header_digest(self.make_file("text2.txt", b"world")),
+        )
+
+    def test_invalid_cache(self):
+        os.makedirs(os.path.dirname(self.cache_file))
+        with open(self.cache_file, "w") as stream:
+            stream.write("{")
+        cache = MachOCache(self.cache_file)
+        self.assertEqual(cache.headers(self.path), read_headers(self.path))
+        self.assertEqual(cache.misses, 1)
+
+    def test_cached_macho(self):
+        cache = MachOCache()
+        node = CachedMachO(self.path, cache)
+        self.assertEqual(node.headers, read_headers(self.path))
+        self.assertEqual(node.loader_path, self.tmpdir)
+
+        self.assertFalse(node.rewriteLoadCommands(lambda path: None))
+        self.assertIs(node._macho, None)
+
+        def changefunc(path):
+            if path == "/usr/lib/libSystem.B.dylib":
+                return "/usr/lib/libSystem.dylib"
+            return None
+
+        self.assertTrue(node.rewriteLoadCommands(changefunc))
+        self.assertIsInstance(node._macho, MachO)
+        self.assertEqual(
+            [name for _idx, _kind, name in node._macho.headers[0].walkRelocatables()],
+            ["@rpath/libbar.dylib", "/usr/lib/libSystem.dylib"],
+        )
+
+        with self.assertRaises(ValueError):
+            CachedMachO(self.make_file("text.txt", b"hello"), cache)
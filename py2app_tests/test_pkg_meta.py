@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from py2app._pkg_meta import MetadataIndex, scan_for_metadata
+
+
+class TestMetadataIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.site = os.path.join(self.tmpdir, "site-packages")
+        self.index_file = os.path.join(self.tmpdir, "cache", "index.json")
+
+        self.write("pkg/__init__.py", "")
+        self.write("pkg/mod.py", "")
+        self.write(
+            "pkg-1.0.dist-info/RECORD",
+            "pkg/__init__.py,,\n"
+            '"pkg/mod.py",sha256=abc,10\n'
+            "pkg-1.0.dist-info/RECORD,,\n",
+        )
+        self.write("other-1.0.dist-info/RECORD", "other.py,,\n")
+        self.write("other.py", "")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, relpath, contents):
+        path = os.path.join(self.site, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as stream:
+            stream.write(contents)
+        return path
+
+    def test_owner(self):
+        index = MetadataIndex([self.site, "/no/such/dir"], self.index_file)
+        dist_info = os.path.join(os.path.realpath(self.site), "pkg-1.0.dist-info")
+
+        self.assertEqual(index.distributions, 2)
+        self.assertEqual(index.owner(os.path.join(self.site, "pkg/mod.py")), dist_info)
+        self.assertEqual(index.owner(os.path.join(self.site, "pkg/mod.pyc")), dist_info)
+        self.assertIs(index.owner(os.path.join(self.site, "pkg/missing.py")), None)
+
+    def test_same_as_scan(self):
+        infos = scan_for_metadata([self.site])
+        index = MetadataIndex([self.site])
+        for fn, dist_info in infos.items():
+            self.assertEqual(
+                os.path.realpath(index.owner(fn)), os.path.realpath(dist_info)
+            )
+
+    def test_symlinked_site_dir(self):
+        link = os.path.join(self.tmpdir, "link")
+        os.symlink(self.site, link)
+
+        index = MetadataIndex([link])
+        self.assertEqual(
+            index.owner(os.path.join(link, "other.py")),
+            os.path.join(os.path.realpath(self.site), "other-1.0.dist-info"),
+        )
+
+    def test_incremental(self):
+        MetadataIndex([self.site], self.index_file).save()
+
+        index = MetadataIndex([self.site], self.index_file)
+        self.assertEqual(index.rescanned, 0)
+        self.assertIsNot(index.owner(os.path.join(self.site, "other.py")), None)
+
+        self.write("other-1.0.dist-info/RECORD", "other2.py,,\n")
+        index = MetadataIndex([self.site], self.index_file)
+        self.assertEqual(index.rescanned, 1)
+        self.assertIs(index.owner(os.path.join(self.site, "other.py")), None)
+        self.assertIsNot(index.owner(os.path.join(self.site, "other2.py")), None)
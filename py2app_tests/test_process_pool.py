@@ -0,0 +1,84 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from py2app._process_pool import BrokenWorker, ProcessPool
+from py2app.util import _compile_source
+
+
+class LockedStream:
+    # Stand-in for the console proxy of the progress display,
+    # writing blocks while the lock is held.
+    def __init__(self, lock):
+        self.lock = lock
+
+    def write(self, data):
+        with self.lock:
+            pass
+
+    def flush(self):
+        pass
+
+
+class TestProcessPool(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_submit(self):
+        with ProcessPool(2) as pool:
+            futures = [pool.submit(divmod, idx, 3) for idx in range(10)]
+            self.assertEqual(
+                [future.result() for future in futures],
+                [divmod(idx, 3) for idx in range(10)],
+            )
+            pids = {pool.submit(os.getpid).result() for _ in range(10)}
+        self.assertNotIn(os.getpid(), pids)
+
+    def test_map(self):
+        with ProcessPool(2) as pool:
+            self.assertEqual(
+                list(pool.map(pow, range(10), [2] * 10, chunksize=3)),
+                [idx**2 for idx in range(10)],
+            )
+
+    def test_exception(self):
+        with ProcessPool(1) as pool:
+            with self.assertRaises(ZeroDivisionError):
+                pool.submit(divmod, 1, 0).result()
+
+            # The worker is still usable
+            self.assertEqual(pool.submit(divmod, 7, 2).result(), (3, 1))
+
+            with self.assertRaises(Exception):
+                pool.submit(divmod, lambda: 1, 2).result()
+
+    def test_broken_worker(self):
+        with ProcessPool(1) as pool:
+            with self.assertRaises(BrokenWorker):
+                pool.submit(os._exit, 1).result()
+            with self.assertRaises(BrokenWorker):
+                pool.submit(divmod, 7, 2).result()
+
+    def test_locked_stderr(self):
+        # Workers report errors on their own standard error stream,
+        # even when the one in the build process is blocked.
+        path = os.path.join(self.tmpdir, "broken.py")
+        with open(path, "w") as stream:
+            stream.write("def\n")
+
+        lock = threading.Lock()
+        orig = sys.stderr
+        sys.stderr = LockedStream(lock)
+        try:
+            with lock:
+                with ProcessPool(2) as pool:
+                    result = pool.submit(_compile_source, path, "broken.pyc", 0)
+                    self.assertEqual(result.result(timeout=60), (None, None))
+        finally:
+            sys.stderr = orig
@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from py2app._profile import BuildProfile
+from py2app.progress import Progress
+
+
+class TestBuildProfile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_trace(self):
+        profile = BuildProfile()
+        with profile.span("outer", modules=3) as info:
+            with profile.span("file.py", "file"):
+                pass
+            info["bytes"] = 42
+
+        def in_thread():
+            with profile.span("thread"):
+                pass
+
+        thread = threading.Thread(target=in_thread)
+        thread.start()
+        thread.join()
+
+        profile.add("bytes copied", 10)
+        profile.add("bytes copied", 5)
+        profile.add("files copied")
+
+        path = os.path.join(self.tmpdir, "trace", "build.json")
+        profile.save(path)
+        with open(path) as stream:
+            data = json.load(stream)
+
+        spans = {
+            event["name"]: event for event in data["traceEvents"] if event["ph"] == "X"
+        }
+        self.assertEqual(set(spans), {"outer", "file.py", "thread"})
+        self.assertNotEqual(spans["thread"]["tid"], spans["outer"]["tid"])
+        self.assertEqual(spans["outer"]["args"], {"modules": 3, "bytes": 42})
+        self.assertEqual(spans["outer"]["cat"], "phase")
+        self.assertEqual(spans["file.py"]["cat"], "file")
+        self.assertNotIn("args", spans["file.py"])
+        self.assertLessEqual(spans["outer"]["ts"], spans["file.py"]["ts"])
+        self.assertGreaterEqual(spans["outer"]["dur"], spans["file.py"]["dur"])
+
+        totals = {"bytes copied": 15, "files copied": 1}
+        self.assertEqual(data["otherData"]["totals"], totals)
+        self.assertEqual(data["traceEvents"][-1]["ph"], "C")
+        self.assertEqual(data["traceEvents"][-1]["args"], totals)
+
+    def test_span_on_error(self):
+        profile = BuildProfile()
+        with self.assertRaises(ValueError):
+            with profile.span("failing"):
+                raise ValueError
+
+        path = os.path.join(self.tmpdir, "build.json")
+        profile.save(path)
+        with open(path) as stream:
+            data = json.load(stream)
+        self.assertEqual(data["traceEvents"][0]["name"], "failing")
+
+    def test_progress(self):
+        progress = Progress(level=0)
+        try:
+            with progress.span("phase") as info:
+                info["value"] = 1
+            progress.count("files")
+
+            progress.profile = BuildProfile()
+            with progress.span("phase", value=1):
+                pass
+            progress.count("files", 2)
+            self.assertEqual(progress.profile.totals, {"files": 2})
+        finally:
+            progress.stop()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from py2app import util
+from py2app.progress import Progress, _format_size
+
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.tmpdir, "build.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read_log(self):
+        with open(self.log_file) as stream:
+            return [line.split("] ", 1)[1] for line in stream.read().splitlines()]
+
+    def test_format_size(self):
+        self.assertEqual(_format_size(10), "10 B")
+        self.assertEqual(_format_size(10.5), "10 B")
+        self.assertEqual(_format_size(2048), "2.0 KB")
+        self.assertEqual(_format_size(3 * 1024 * 1024), "3.0 MB")
+        self.assertEqual(_format_size(5 * 1024**4), "5120.0 GB")
+
+    def test_summary(self):
+        progress = Progress(level=1, log_file=self.log_file)
+        try:
+            progress.info("phase")
+            progress.trace("detail")
+            for idx in range(3):
+                progress.file_event("Copying files", f"copy {idx}", 100)
+            progress.warning("warning")
+
+            summary = progress._summaries["Copying files"]
+            self.assertEqual((summary.files, summary.nbytes), (3, 300))
+        finally:
+            progress.stop()
+
+        task = progress._progress.tasks[summary.task_id]
+        self.assertTrue(task.description.startswith("Copying files: 3 files, 300 B"))
+
+        self.assertEqual(
+            self.read_log(),
+            ["phase", "detail", "copy 0", "copy 1", "copy 2", "warning"],
+        )
+
+    def test_trace_level(self):
+        progress = Progress(level=2)
+        try:
+            progress.file_event("Copying files", "copy", 100)
+            self.assertEqual(progress._summaries, {})
+        finally:
+            progress.stop()
+
+    def test_copy_file(self):
+        src = os.path.join(self.tmpdir, "src")
+        with open(src, "w") as stream:
+            stream.write("hello")
+
+        progress = Progress(level=0, log_file=self.log_file)
+        try:
+            util.copy_file(src, os.path.join(self.tmpdir, "dst"), progress=progress)
+            self.assertEqual(progress._summaries["Copying files"].nbytes, 5)
+        finally:
+            progress.stop()
+
+        self.assertEqual(len(self.read_log()), 1)
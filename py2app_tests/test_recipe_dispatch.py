@@ -0,0 +1,213 @@
+import os
+import re
+import subprocess
+import sys
+import unittest
+
+from py2app import recipes
+from py2app._recipe_dispatch import RecipeDispatcher
+
+
+class Graph:
+    def __init__(self, names):
+        self.nodes = {name: object() for name in names}
+
+    def findNode(self, name):
+        return self.nodes.get(name)
+
+    def add(self, name):
+        self.nodes[name] = object()
+
+
+def make_check(trigger, adds=(), requires=(), calls=None, name=None):
+    def check(cmd, mf):
+        if calls is not None:
+            calls.append(name)
+        if mf.findNode(trigger) is None:
+            return None
+        if any(mf.findNode(req) is None for req in requires):
+            return None
+        return {"adds": list(adds)}
+
+    return check
+
+
+def restart_loop(checks, mf):
+    # The dispatch algorithm used before triggers were introduced
+    rdict = dict(checks)
+    result = []
+    while True:
+        for name, check in rdict.items():
+            rval = check(None, mf)
+            if rval is None:
+                continue
+            del rdict[name]
+            result.append(name)
+            for nm in rval["adds"]:
+                mf.add(nm)
+            break
+        else:
+            break
+    return result
+
+
+class TestRecipeDispatcher(unittest.TestCase):
+    def make_checks(self, calls=None):
+        return {
+            "a": make_check("mod_a", adds=["mod_b"], calls=calls, name="a"),
+            "b": make_check("mod_b", adds=["mod_c"], calls=calls, name="b"),
+            "c": make_check("mod_c", calls=calls, name="c"),
+            "d": make_check("mod_d", calls=calls, name="d"),
+            "e": make_check(
+                "mod_a", requires=["mod_c"], adds=["mod_e"], calls=calls, name="e"
+            ),
+        }
+
+    def dispatch(self, checks, triggers, mf):
+        dispatcher = RecipeDispatcher(checks, triggers)
+        result = []
+        for name, rval in dispatcher.run(None, mf):
+            result.append(name)
+            for nm in rval["adds"]:
+                mf.add(nm)
+        return dispatcher, result
+
+    def test_same_order(self):
+        expected = restart_loop(self.make_checks(), Graph(["mod_a"]))
+        self.assertEqual(expected, ["a", "b", "c", "e"])
+
+        triggers = {
+            "a": ("mod_a",),
+            "b": ("mod_b",),
+            "c": ("mod_c",),
+            "d": ("mod_d",),
+            "e": ("mod_a", "mod_c"),
+        }
+        _, result = self.dispatch(self.make_checks(), triggers, Graph(["mod_a"]))
+        self.assertEqual(result, expected)
+
+    def test_only_checked_when_triggered(self):
+        calls = []
+        triggers = {
+            "a": ("mod_a",),
+            "b": ("mod_b",),
+            "c": ("mod_c",),
+            "d": ("mod_d",),
+        }
+        checks = self.make_checks(calls)
+        checks = {"e": checks.pop("e"), **checks}
+
+        dispatcher, result = self.dispatch(checks, triggers, Graph(["mod_a"]))
+        self.assertEqual(result, ["a", "b", "e", "c"])
+
+        # "d" isn't triggered, "e" has no triggers and is checked
+        # again after every recipe that was applied.
+        self.assertEqual(calls.count("d"), 0)
+        self.assertEqual(calls.count("e"), 3)
+        for name in ("a", "b", "c"):
+            self.assertEqual(calls.count(name), 1)
+        self.assertEqual(dispatcher.checks_run, len(calls))
+
+    def test_not_rechecked_without_changes(self):
+        calls = []
+        checks = self.make_checks(calls)
+        triggers = {name: ("mod_" + name,) for name in checks}
+        triggers["e"] = ("mod_a", "mod_c")
+
+        dispatcher, result = self.dispatch(checks, triggers, Graph(["mod_a", "mod_d"]))
+        self.assertEqual(result, ["a", "b", "c", "d", "e"])
+        self.assertEqual(calls, ["a", "b", "c", "d", "e"])
+
+
+class TestRecipeRegistry(unittest.TestCase):
+    def test_all_registered(self):
+        dirname = os.path.dirname(recipes.__file__)
+        names = set()
+        for fn in os.listdir(dirname):
+            # cjkcodecs is not used
+            if fn.startswith("_") or fn == "cjkcodecs.py":
+                continue
+            if fn.endswith(".py"):
+                path, name = os.path.join(dirname, fn), fn[:-3]
+            else:
+                path, name = os.path.join(dirname, fn, "__init__.py"), fn
+                if not os.path.exists(path):
+                    continue
+
+            with open(path) as stream:
+                if re.search(r"^(def )?check\b", stream.read(), re.M):
+                    names.add(name)
+
+        self.assertEqual(set(recipes.RECIPES), names)
+        for name, (module, _triggers) in recipes.RECIPES.items():
+            self.assertEqual(module, "py2app.recipes." + name)
+
+    def test_auto_triggers(self):
+        from py2app.recipes import automissing, autopackages
+
+        self.assertEqual(
+            set(recipes.RECIPES["automissing"][1]),
+            {name for name, _missing in automissing.AUTO_MISSING},
+        )
+        self.assertEqual(
+            set(recipes.RECIPES["autopackages"][1]), set(autopackages.AUTO_PACKAGES)
+        )
+
+    def test_lazy_check(self):
+        check = recipes.LazyCheck("black")
+        self.assertIs(check._check, None)
+        self.assertIs(check(None, Graph([])), None)
+
+        from py2app.recipes import black
+
+        self.assertIs(check._check, black.check)
+
+    def test_not_imported(self):
+        script = (
+            "import sys, py2app.build_app\n"
+            "print(sorted(nm for nm in sys.modules"
+            " if nm.startswith('py2app.recipes.') or nm == 'rich'))\n"
+        )
+        output = subprocess.check_output(
+            [sys.executable, "-c", script], universal_newlines=True
+        )
+        self.assertEqual(output.strip(), "[]")
+
+    def test_always_run(self):
+        self.assertLessEqual(recipes.ALWAYS_RUN, set(recipes.RECIPES))
+
+
+class TestProcessRecipes(unittest.TestCase):
+    def test_always_run_not_recorded(self):
+        from setuptools import Distribution
+
+        from py2app.build_app import py2app
+
+        dist = Distribution()
+        dist.app = ["main.py"]
+        dist.plugin = None
+        cmd = py2app(dist)
+        cmd.progress_level = 0
+        cmd.ensure_finalized()
+
+        applied = []
+        cmd.collect_recipedict = lambda: {
+            "tkinter": make_check("mod_a", name="tkinter"),
+            "other": make_check("mod_a", name="other"),
+        }
+        cmd.collect_recipe_triggers = lambda: {"tkinter": None, "other": None}
+        cmd.apply_recipe = lambda mf, rval, *args, **kwds: applied.append(rval)
+
+        try:
+            results = []
+            cmd.process_recipes(Graph(["mod_a"]), [], {}, [], results)
+            self.assertEqual(len(applied), 2)
+            self.assertEqual([name for name, _ in results], ["other"])
+
+            # Replaying the recorded results only runs the
+            # recipes that must always run.
+            del applied[:]
+            cmd.process_recipes(Graph(["mod_a"]), [], {}, [], names=recipes.ALWAYS_RUN)
+            self.assertEqual(len(applied), 1)
+        finally:
+            cmd.progress.stop()
@@ -0,0 +1,181 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+from py2app._pkg_meta import MetadataIndex
+from py2app._size_report import Owner, SizeAttribution, distribution_name
+from py2app.filters import PathClassifier
+
+PYDIR = os.path.join(
+    "Contents", "Resources", "lib", "python%d.%d" % sys.version_info[:2]
+)
+ZIPFILE = os.path.join(
+    "Contents", "Resources", "lib", "python%d%d.zip" % sys.version_info[:2]
+)
+
+
+class TestSizeReport(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.site = os.path.join(self.tmpdir, "site-packages")
+        self.bundle = os.path.join(self.tmpdir, "dist", "Test.app")
+
+        self.write(self.site, "pkg/__init__.py", 10)
+        self.write(self.site, "pkg/_ext.so", 10)
+        self.write(self.site, "pkg/.dylibs/libfoo.dylib", 10)
+        self.write(
+            self.site,
+            "pkg-1.0.dist-info/RECORD",
+            "pkg/__init__.py,,\npkg/_ext.so,,\npkg/.dylibs/libfoo.dylib,,\n",
+        )
+        self.write(self.site, "loose/__init__.py", 10)
+        self.recipe_data = self.write(self.tmpdir, "recipe/data.txt", 10)
+
+        self.write(self.bundle, "Contents/MacOS/Test", 100)
+        self.write(self.bundle, "Contents/Info.plist", 50)
+        self.write(self.bundle, "Contents/Frameworks/libfoo.dylib", 1000)
+        self.write(self.bundle, "Contents/Frameworks/libother.dylib", 70)
+        self.write(
+            self.bundle, "Contents/Frameworks/Python.framework/Versions/X/Python", 500
+        )
+        self.write(self.bundle, os.path.join(PYDIR, "lib-dynload/pkg/_ext.so"), 200)
+        self.write(self.bundle, os.path.join(PYDIR, "site.pyc"), 20)
+        self.write(self.bundle, "Contents/Resources/data.txt", 30)
+        self.write(self.bundle, "Contents/Resources/icon.icns", 40)
+        os.symlink("site.pyc", os.path.join(self.bundle, PYDIR, "link.pyc"))
+
+        zip_path = os.path.join(self.bundle, ZIPFILE)
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("pkg/__init__.pyc", b"a" * 1000)
+            archive.writestr("loose/__init__.pyc", b"b" * 100)
+            archive.writestr("json/__init__.pyc", b"c" * 100)
+            archive.writestr("pkg-1.0.dist-info/METADATA", b"d" * 100)
+            archive.writestr("recipedata/x.txt", b"e" * 100)
+        with zipfile.ZipFile(zip_path) as archive:
+            self.compressed = {
+                info.filename: info.compress_size for info in archive.infolist()
+            }
+
+        self.attribution = SizeAttribution()
+        self.attribution.add_module("pkg", os.path.join(self.site, "pkg/__init__.py"))
+        self.attribution.add_module("pkg._ext", os.path.join(self.site, "pkg/_ext.so"))
+        self.attribution.add_module(
+            "loose", os.path.join(self.site, "loose/__init__.py")
+        )
+        self.attribution.add_module("json", json.__file__)
+        self.attribution.add_origin(
+            os.path.join(self.bundle, "Contents/Frameworks/libfoo.dylib"),
+            os.path.join(self.site, "pkg/.dylibs/libfoo.dylib"),
+        )
+        self.attribution.add_origin(
+            os.path.join(self.bundle, "Contents/Resources/data.txt"), self.recipe_data
+        )
+        self.attribution.add_recipe_source(
+            "myrecipe", os.path.dirname(self.recipe_data)
+        )
+        self.attribution.add_recipe_entry("myrecipe", "recipedata")
+
+        self.report = self.attribution.report(
+            self.bundle,
+            self.bundle,
+            MetadataIndex([self.site]),
+            PathClassifier(sys.prefix),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, root, relpath, contents):
+        path = os.path.join(root, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(contents, int):
+            contents = "x" * contents
+        with open(path, "w") as stream:
+            stream.write(contents)
+        return path
+
+    def test_distribution_name(self):
+        self.assertEqual(distribution_name("/site/foo_bar-1.0.dist-info"), "foo_bar")
+        self.assertEqual(distribution_name("foo-1.0-py3.11.egg-info"), "foo")
+
+    def test_all_bytes(self):
+        total = 0
+        for dirpath, _dirnames, filenames in os.walk(self.bundle):
+            for fn in filenames:
+                path = os.path.join(dirpath, fn)
+                if not os.path.islink(path):
+                    total += os.path.getsize(path)
+        self.assertEqual(self.report.total, total)
+
+    def test_owners(self):
+        owners = {
+            (info["owner"], info["kind"]): info["size"] for info in self.report.owners()
+        }
+        zipsize = os.path.getsize(os.path.join(self.bundle, ZIPFILE))
+
+        self.assertEqual(
+            owners,
+            {
+                ("pkg", "distribution"): 1000
+                + 200
+                + self.compressed["pkg/__init__.pyc"]
+                + self.compressed["pkg-1.0.dist-info/METADATA"],
+                ("loose", "package"): self.compressed["loose/__init__.pyc"],
+                ("stdlib", "python"): self.compressed["json/__init__.pyc"],
+                ("myrecipe", "recipe"): 30 + self.compressed["recipedata/x.txt"],
+                ("runtime", "python"): 500 + 20,
+                ("executables", "bundle"): 100,
+                ("frameworks", "bundle"): 70,
+                ("resources", "bundle"): 40,
+                ("bundle files", "bundle"): 50,
+                ("zipfile overhead", "bundle"): zipsize - sum(self.compressed.values()),
+            },
+        )
+
+        sizes = [info["size"] for info in self.report.owners()]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+
+    def test_entries(self):
+        entries = {entry.path: entry for entry in self.report.entries}
+        entry = entries[os.path.join(PYDIR, "lib-dynload", "pkg", "_ext.so")]
+        self.assertEqual(entry.owner, Owner("distribution", "pkg"))
+        self.assertEqual(entry.kind, "extension")
+
+        entry = entries[ZIPFILE + "/pkg-1.0.dist-info/METADATA"]
+        self.assertEqual(entry.kind, "metadata")
+        self.assertNotIn(os.path.join(PYDIR, "link.pyc"), entries)
+
+    def test_save(self):
+        path = os.path.join(self.tmpdir, "report.json")
+        self.report.save(path)
+
+        with open(path) as stream:
+            data = json.load(stream)
+
+        self.assertEqual(data["bundle"], self.bundle)
+        self.assertEqual(data["size"], self.report.total)
+        self.assertEqual(data["owners"], self.report.owners())
+        self.assertEqual(len(data["files"]), len(self.report.entries))
+        self.assertEqual(data["files"][0]["path"], "Contents/Frameworks/libfoo.dylib")
+
+    def test_format_table(self):
+        lines = self.report.format_table()
+        self.assertEqual(lines[0].split(), ["owner", "size", "share", "files"])
+        self.assertTrue(lines[1].startswith("pkg (distribution)"))
+        self.assertTrue(lines[-1].startswith("total"))
+        self.assertEqual(len(lines), len(self.report.owners()) + 2)
+
+    def test_staging_location(self):
+        # Origins are recorded for the location where the bundle
+        # is assembled, which can differ from the final location.
+        final = os.path.join(self.tmpdir, "final", "Test.app")
+        shutil.copytree(self.bundle, final, symlinks=True)
+
+        report = self.attribution.report(
+            final, self.bundle, MetadataIndex([self.site]), PathClassifier(sys.prefix)
+        )
+        self.assertEqual(report.owners(), self.report.owners())
@@ -1,8 +1,17 @@
+import os
+import shutil
+import subprocess
+import sys
 import tempfile
 import textwrap
 import unittest
+import zipfile
 
 from py2app import util
+from py2app._macho_cache import MachOCache
+from py2app.progress import Progress
+
+from .tools import macho_file
 
 
 class TestVersionExtraction(unittest.TestCase):
@@ -109,3 +118,579 @@ class TestVersionExtraction(unittest.TestCase):
             ),
             "a",
         )
+
+
+class TestCopyFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.data = os.urandom(3 * util.COPY_BUFSIZE + 17)
+
+        self.source = os.path.join(self.tmpdir, "source.bin")
+        with open(self.source, "wb") as stream:
+            stream.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, path):
+        with open(path, "rb") as stream:
+            return stream.read()
+
+    def test_copy(self):
+        destination = os.path.join(self.tmpdir, "dest.bin")
+        util.copy_file(self.source, destination)
+        self.assertEqual(self.read(destination), self.data)
+
+        # Copying again replaces the file
+        with open(self.source, "wb") as stream:
+            stream.write(b"short")
+        util.copy_file(self.source, destination)
+        self.assertEqual(self.read(destination), b"short")
+
+    def test_copy_to_directory(self):
+        os.mkdir(os.path.join(self.tmpdir, "subdir"))
+        util.copy_file(self.source, os.path.join(self.tmpdir, "subdir"))
+        self.assertEqual(
+            self.read(os.path.join(self.tmpdir, "subdir", "source.bin")), self.data
+        )
+
+    def test_preserve_mode(self):
+        os.chmod(self.source, 0o750)
+        destination = os.path.join(self.tmpdir, "dest.bin")
+        util.copy_file(self.source, destination, preserve_mode=True)
+        self.assertEqual(os.stat(destination).st_mode & 0o777, 0o750)
+
+    def test_empty_file(self):
+        source = os.path.join(self.tmpdir, "empty")
+        open(source, "wb").close()
+
+        destination = os.path.join(self.tmpdir, "dest")
+        util.copy_file(source, destination)
+        self.assertEqual(self.read(destination), b"")
+
+    def test_fast_copy(self):
+        destination = os.path.join(self.tmpdir, "dest.bin")
+        with open(self.source, "rb") as fp_in:
+            with open(destination, "wb") as fp_out:
+                copied = util._fast_copy(fp_in.fileno(), fp_out.fileno())
+                if not copied:
+                    self.skipTest("no zero-copy primitives for this filesystem")
+        self.assertEqual(copied, len(self.data))
+        self.assertEqual(self.read(destination), self.data)
+
+    @unittest.skipUnless(sys.platform == "linux", "Linux only")
+    def test_fast_copy_incomplete(self):
+        # copy_file_range and sendfile can stop before the end of
+        # the file, the rest of the file is copied normally.
+        calls = []
+
+        def copy_file_range(fd_in, fd_out, count, offset_src, offset_dst):
+            calls.append("copy_file_range")
+            if offset_src == 0:
+                return orig_copy_file_range(fd_in, fd_out, 1000, 0, 0)
+            return 0
+
+        def sendfile(fd_out, fd_in, offset, count):
+            calls.append("sendfile")
+            return 0
+
+        orig_ficlone = util._FICLONE
+        orig_copy_file_range = os.copy_file_range
+        orig_sendfile = os.sendfile
+        util._FICLONE = 0
+        os.copy_file_range = copy_file_range
+        os.sendfile = sendfile
+        try:
+            destination = os.path.join(self.tmpdir, "dest.bin")
+            util.copy_file(self.source, destination)
+        finally:
+            util._FICLONE = orig_ficlone
+            os.copy_file_range = orig_copy_file_range
+            os.sendfile = orig_sendfile
+
+        self.assertEqual(calls, ["copy_file_range", "copy_file_range", "sendfile"])
+        self.assertEqual(self.read(destination), self.data)
+
+    def test_copy_file_darwin(self):
+        # shutil.copyfile uses fcopyfile on macOS
+        calls = []
+
+        def copyfile(src, dst):
+            calls.append((src, dst))
+            return orig_copyfile(src, dst)
+
+        orig_platform = sys.platform
+        orig_copyfile = shutil.copyfile
+        sys.platform = "darwin"
+        shutil.copyfile = copyfile
+        try:
+            destination = os.path.join(self.tmpdir, "dest.bin")
+            util.copy_file(self.source, destination)
+        finally:
+            sys.platform = orig_platform
+            shutil.copyfile = orig_copyfile
+
+        self.assertEqual(calls, [(self.source, destination)])
+        self.assertEqual(self.read(destination), self.data)
+
+    def test_copy_from_zipfile(self):
+        archive = os.path.join(self.tmpdir, "archive.zip")
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("pkg/data.bin", self.data)
+
+        destination = os.path.join(self.tmpdir, "dest.bin")
+        util.copy_file(os.path.join(archive, "pkg", "data.bin"), destination)
+        self.assertEqual(self.read(destination), self.data)
+
+        self.assertRaises(
+            OSError,
+            util.copy_file,
+            os.path.join(archive, "pkg", "missing.bin"),
+            destination,
+        )
+
+
+class TestCopyTree(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, "src")
+
+        for relpath in (
+            "a.txt",
+            "sub/b.txt",
+            "sub/deeper/c.txt",
+            "CVS/skipped.txt",
+            "other/d.txt",
+        ):
+            path = os.path.join(self.src, relpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as stream:
+                stream.write(relpath)
+
+        os.symlink("a.txt", os.path.join(self.src, "link.txt"))
+        os.symlink("other", os.path.join(self.src, "linkdir"))
+        os.symlink("missing.txt", os.path.join(self.src, "dead.txt"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assert_same_tree(self, dir1, dir2):
+        for dirpath, dirnames, filenames in os.walk(dir1):
+            rel = os.path.relpath(dirpath, dir1)
+            other = os.path.join(dir2, rel)
+            self.assertEqual(sorted(os.listdir(dirpath)), sorted(os.listdir(other)))
+            for fn in filenames:
+                self.assertEqual(
+                    os.path.islink(os.path.join(dirpath, fn)),
+                    os.path.islink(os.path.join(other, fn)),
+                )
+
+    def test_matches_sequential(self):
+        for preserve_symlinks in (False, True):
+            dst1 = os.path.join(self.tmpdir, "dst1-%d" % (preserve_symlinks,))
+            dst2 = os.path.join(self.tmpdir, "dst2-%d" % (preserve_symlinks,))
+
+            outputs = util.copy_tree(
+                self.src, dst1, preserve_symlinks=preserve_symlinks
+            )
+            expected = util._copy_tree_zipio(
+                self.src,
+                dst2,
+                preserve_symlinks=preserve_symlinks,
+                condition=util.skipscm,
+            )
+
+            self.assertEqual(
+                [os.path.relpath(p, dst1) for p in outputs],
+                [os.path.relpath(p, dst2) for p in expected],
+            )
+            self.assert_same_tree(dst1, dst2)
+
+            self.assertFalse(os.path.exists(os.path.join(dst1, "CVS")))
+            self.assertFalse(os.path.lexists(os.path.join(dst1, "dead.txt")))
+            self.assertEqual(
+                os.path.islink(os.path.join(dst1, "linkdir")), preserve_symlinks
+            )
+
+    def test_condition(self):
+        dst = os.path.join(self.tmpdir, "dst")
+        outputs = util.copy_tree(
+            self.src, dst, condition=lambda fn: os.path.basename(fn) != "sub"
+        )
+        self.assertNotIn(os.path.join(dst, "sub", "b.txt"), outputs)
+        self.assertFalse(os.path.exists(os.path.join(dst, "sub")))
+        self.assertTrue(os.path.exists(os.path.join(dst, "CVS", "skipped.txt")))
+
+    def test_from_zipfile(self):
+        archive = os.path.join(self.tmpdir, "archive.zip")
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("pkg/a.txt", "a")
+            zf.writestr("pkg/sub/b.txt", "b")
+
+        dst = os.path.join(self.tmpdir, "dst")
+        outputs = util.copy_tree(os.path.join(archive, "pkg"), dst)
+        self.assertEqual(
+            sorted(outputs),
+            [os.path.join(dst, "a.txt"), os.path.join(dst, "sub", "b.txt")],
+        )
+        with open(os.path.join(dst, "sub", "b.txt")) as stream:
+            self.assertEqual(stream.read(), "b")
+
+    def test_not_a_directory(self):
+        from distutils.errors import DistutilsFileError
+
+        self.assertRaises(
+            DistutilsFileError,
+            util.copy_tree,
+            os.path.join(self.src, "a.txt"),
+            os.path.join(self.tmpdir, "dst"),
+        )
+
+
+STRIP_SCRIPT = """\
+import sys
+
+with open({log!r}, "a") as stream:
+    stream.write(" ".join(sys.argv[1:]) + "\\n")
+
+for fn in sys.argv[sys.argv.index("-") + 1 :]:
+    if fn.endswith("bad.so"):
+        sys.exit(1)
+    with open(fn, "wb") as stream:
+        stream.write({stripped!r})
+"""
+
+
+class TestStripFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmpdir, "strip.log")
+
+        script = os.path.join(self.tmpdir, "strip.py")
+        with open(script, "w") as stream:
+            stream.write(STRIP_SCRIPT.format(log=self.log, stripped=macho_file(0)))
+
+        self.strip_tool = os.path.join(self.tmpdir, "strip")
+        with open(self.strip_tool, "w") as stream:
+            stream.write(f'#!/bin/sh\nexec {sys.executable} {script} "$@"\n')
+        os.chmod(self.strip_tool, 0o755)
+
+        self.progress = Progress(level=0)
+
+    def tearDown(self):
+        self.progress.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def make_file(self, name, contents):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "wb") as stream:
+            stream.write(contents)
+        return path
+
+    def read_log(self):
+        with open(self.log) as stream:
+            return [line.split() for line in stream.read().splitlines()]
+
+    def test_is_stripped(self):
+        self.assertFalse(util.is_stripped(self.make_file("a.so", macho_file(4))))
+        self.assertTrue(util.is_stripped(self.make_file("b.so", macho_file(0))))
+        self.assertFalse(util.is_stripped(self.make_file("c.so", b"not macho")))
+        self.assertFalse(util.is_stripped(os.path.join(self.tmpdir, "missing")))
+
+    def test_strip(self):
+        unstripped = [
+            self.make_file(f"mod{idx}.so", macho_file(4, padding=100))
+            for idx in range(5)
+        ]
+        stripped = [
+            self.make_file(f"lib{idx}.dylib", macho_file(0)) for idx in range(2)
+        ]
+        size = len(macho_file(0))
+
+        result = util.strip_files(
+            unstripped + stripped,
+            progress=self.progress,
+            strip_tool=self.strip_tool,
+            jobs=2,
+        )
+        self.assertEqual(result, (7 * size + 500, 7 * size))
+
+        calls = self.read_log()
+        self.assertEqual(len(calls), 2)
+        for call in calls:
+            self.assertEqual(call[:3], ["-x", "-S", "-"])
+        self.assertEqual(sorted(fn for call in calls for fn in call[3:]), unstripped)
+
+        for fn in unstripped:
+            self.assertTrue(util.is_stripped(fn))
+
+    def test_failure(self):
+        files = [
+            self.make_file("good.so", macho_file(4)),
+            self.make_file("bad.so", macho_file(4)),
+        ]
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            util.strip_files(
+                files, progress=self.progress, strip_tool=self.strip_tool, jobs=1
+            )
+
+        # The batch is retried file by file to find the failing file
+        self.assertEqual(cm.exception.cmd[-1], files[1])
+        self.assertEqual(len(self.read_log()), 3)
+
+    def test_dry_run(self):
+        files = [self.make_file("mod.so", macho_file(4))]
+        self.assertEqual(
+            util.strip_files(
+                files, dry_run=1, progress=self.progress, strip_tool=self.strip_tool
+            ),
+            (0, 0),
+        )
+        self.assertFalse(os.path.exists(self.log))
+
+
+CODESIGN_SCRIPT = """\
+import sys
+
+with open({log!r}, "a") as stream:
+    stream.write(sys.argv[-1] + "\\n")
+if sys.argv[-1].endswith("bad.so"):
+    sys.exit(1)
+"""
+
+
+class TestCodesign(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.bundle = os.path.join(self.tmpdir, "Test.app")
+        self.log = os.path.join(self.tmpdir, "codesign.log")
+
+        script = os.path.join(self.tmpdir, "codesign.py")
+        with open(script, "w") as stream:
+            stream.write(CODESIGN_SCRIPT.format(log=self.log))
+
+        self.codesign_tool = os.path.join(self.tmpdir, "codesign")
+        with open(self.codesign_tool, "w") as stream:
+            stream.write(f'#!/bin/sh\nexec {sys.executable} {script} "$@"\n')
+        os.chmod(self.codesign_tool, 0o755)
+
+        self.progress = Progress(level=0)
+
+    def tearDown(self):
+        self.progress.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def make_file(self, relpath, **kwds):
+        path = os.path.join(self.bundle, "Contents", relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as stream:
+            stream.write(macho_file(**kwds))
+        return path
+
+    def make_bundle(self):
+        return {
+            "main": self.make_file(
+                "MacOS/main",
+                dylibs=[
+                    "@executable_path/../Frameworks/libpython.dylib",
+                    "/usr/lib/libSystem.B.dylib",
+                ],
+            ),
+            "python": self.make_file(
+                "Frameworks/libpython.dylib",
+                dylibs=["@rpath/libssl.dylib"],
+                rpaths=["@loader_path"],
+            ),
+            "ssl": self.make_file(
+                "Frameworks/libssl.dylib", dylibs=["@loader_path/libcrypto.dylib"]
+            ),
+            "crypto": self.make_file("Frameworks/libcrypto.dylib"),
+            "ext": self.make_file(
+                "Resources/lib/_ssl.so",
+                dylibs=["@executable_path/../Frameworks/libssl.dylib"],
+            ),
+        }
+
+    def test_levels(self):
+        files = self.make_bundle()
+        levels = util.macho_dependency_levels(
+            files.values(), os.path.join(self.bundle, "Contents", "MacOS")
+        )
+        self.assertEqual(
+            levels,
+            [
+                [files["crypto"]],
+                [files["ssl"]],
+                sorted([files["python"], files["ext"]]),
+                [files["main"]],
+            ],
+        )
+
+        cache = MachOCache()
+        self.assertEqual(
+            util.macho_dependency_levels(
+                files.values(), os.path.join(self.bundle, "Contents", "MacOS"), cache
+            ),
+            levels,
+        )
+        self.assertEqual(cache.misses, len(files))
+
+    def test_cycle(self):
+        first = self.make_file(
+            "Frameworks/liba.dylib", dylibs=["@loader_path/libb.dylib"]
+        )
+        second = self.make_file(
+            "Frameworks/libb.dylib", dylibs=["@loader_path/liba.dylib"]
+        )
+        main = self.make_file(
+            "MacOS/main",
+            dylibs=["@rpath/liba.dylib"],
+            rpaths=["@executable_path/../Frameworks"],
+        )
+        other = self.make_file("Frameworks/libc.dylib")
+
+        levels = util.macho_dependency_levels(
+            [first, second, main, other],
+            os.path.join(self.bundle, "Contents", "MacOS"),
+        )
+        self.assertEqual(levels, [[other], [first, second, main]])
+
+    def test_codesign(self):
+        files = self.make_bundle()
+        util.codesign_adhoc(
+            self.bundle, self.progress, codesign_tool=self.codesign_tool, jobs=2
+        )
+
+        with open(self.log) as stream:
+            signed = stream.read().splitlines()
+
+        self.assertEqual(sorted(signed[:-1]), sorted(files.values()))
+        self.assertEqual(signed[-1], self.bundle)
+        for dependency, user in [
+            ("crypto", "ssl"),
+            ("ssl", "python"),
+            ("ssl", "ext"),
+            ("python", "main"),
+        ]:
+            self.assertLess(signed.index(files[dependency]), signed.index(files[user]))
+
+    def test_failure(self):
+        self.make_bundle()
+        self.make_file("Resources/lib/bad.so")
+        with self.assertRaises(RuntimeError):
+            util.codesign_adhoc(
+                self.bundle, self.progress, codesign_tool=self.codesign_tool
+            )
+
+        with open(self.log) as stream:
+            signed = stream.read().splitlines()
+
+        # Signing stops after the level with the failure
+        self.assertEqual(len(signed), 2)
+
+
+PREBUILT = os.path.join(
+    os.path.dirname(util.__file__), "apptemplate", "prebuilt", "main-universal2"
+)
+
+
+class TestThinFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.progress = Progress(level=0)
+
+    def tearDown(self):
+        self.progress.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def copy(self, src, name):
+        dst = os.path.join(self.tmpdir, name)
+        shutil.copy(src, dst)
+        return dst
+
+    def read(self, path):
+        with open(path, "rb") as stream:
+            return stream.read()
+
+    def fat_file(self, name, slices):
+        from macholib.mach_o import FAT_MAGIC, fat_arch, fat_header
+
+        data = fat_header(magic=FAT_MAGIC, nfat_arch=len(slices)).to_str()
+        offset = 4096
+        contents = b""
+        for cputype, cpusubtype, slice_data in slices:
+            data += fat_arch(
+                cputype=cputype,
+                cpusubtype=cpusubtype,
+                offset=offset + len(contents),
+                size=len(slice_data),
+                align=12,
+            ).to_str()
+            contents += slice_data
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "wb") as stream:
+            stream.write(data.ljust(offset, b"\0") + contents)
+        return path
+
+    def test_thin(self):
+        from macholib.mach_o import CPU_TYPE_NAMES
+        from macholib.MachO import MachO
+
+        slices = {
+            util._slice_name(*key): value
+            for key, value in util._fat_slices(PREBUILT).items()
+        }
+        self.assertEqual(set(slices), {"arm64", "x86_64"})
+        original = self.read(PREBUILT)
+
+        for arch in ("arm64", "x86_64"):
+            path = self.copy(PREBUILT, f"main-{arch}")
+            before, after = util.thin_files([path], arch, progress=self.progress)
+            offset, size = slices[arch]
+            self.assertEqual((before, after), (len(original), size))
+            self.assertEqual(self.read(path), original[offset : offset + size])
+            self.assertTrue(os.access(path, os.X_OK))
+
+            macho = MachO(path)
+            self.assertIs(macho.fat, None)
+            self.assertEqual(
+                CPU_TYPE_NAMES[macho.headers[0].header.cputype].lower(), arch
+            )
+            self.assertIs(util._fat_slices(path), None)
+
+    def test_arm64e(self):
+        # arm64 and arm64e slices have the same CPU type
+        arm64 = macho_file(nlocalsym=1)
+        arm64e = macho_file(nlocalsym=2, cpusubtype=2)
+        path = self.fat_file(
+            "arm64e.so", [(0x100000C, 0x80000002, arm64e), (0x100000C, 0, arm64)]
+        )
+        self.assertEqual(
+            sorted(util._fat_slices(path)), [(0x100000C, 0), (0x100000C, 2)]
+        )
+
+        util.thin_files([path], "arm64", progress=self.progress)
+        self.assertEqual(self.read(path), arm64)
+
+        path = self.fat_file("arm64e-only.so", [(0x100000C, 0x80000002, arm64e)])
+        contents = self.read(path)
+        self.assertEqual(
+            util.thin_files([path], "arm64", progress=self.progress), (0, 0)
+        )
+        self.assertEqual(self.read(path), contents)
+
+    def test_not_thinned(self):
+        x86_64 = self.fat_file("x86_64.so", [(0x1000007, 3, macho_file())])
+        thin = os.path.join(self.tmpdir, "thin.so")
+        with open(thin, "wb") as stream:
+            stream.write(macho_file())
+        java = os.path.join(self.tmpdir, "Class.class")
+        with open(java, "wb") as stream:
+            stream.write(bytes.fromhex("cafebabe00000034") + b"\0" * 32)
+
+        files = [x86_64, thin, java]
+        contents = [self.read(fn) for fn in files]
+        self.assertEqual(
+            util.thin_files(files, "arm64", progress=self.progress), (0, 0)
+        )
+        self.assertEqual([self.read(fn) for fn in files], contents)
@@ -1,6 +1,8 @@
 import os
 import signal
 import subprocess
+import sys
+import textwrap
 
 
 def kill_child_processes():
@@ -40,3 +42,145 @@ def kill_child_processes():
         os.waitpid(0, 0)
     except os.error:
         pass
+
+
+def run_unguarded_script(tmpdir, body):
+    """
+    Run *body* as a script without a ``__name__ == "__main__"``
+    guard, like a setup.py file, with "spawn" as the default
+    start method for worker processes (as on macOS).
+
+    Returns the completed process and the number of times the
+    script was started.
+    """
+    counter = os.path.join(tmpdir, "runs.txt")
+    script = os.path.join(tmpdir, "unguarded.py")
+    with open(script, "w") as stream:
+        stream.write(
+            textwrap.dedent(
+                f"""\
+                import multiprocessing
+                multiprocessing.set_start_method("spawn", force=True)
+                with open({counter!r}, "a") as stream:
+                    stream.write("run\\n")
+                """
+            )
+            + textwrap.dedent(body)
+        )
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+        + env.get("PYTHONPATH", "").split(os.pathsep)
+    )
+    proc = subprocess.run(
+        [sys.executable, script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        env=env,
+        timeout=120,
+    )
+    with open(counter) as stream:
+        runs = len(stream.readlines())
+    return proc, runs
+
+
+def macho_file(
+    nlocalsym=0,
+    padding=0,
+    dylibs=(),
+    rpaths=(),
+    install_name=None,
+    text=b"",
+    cputype=0x100000C,  # arm64
+    cpusubtype=0,
+):
+    """
+    Contents of a minimal Mach-O file with *nlocalsym* local symbols,
+    that links to *dylibs* using *rpaths*. When *text* is not empty
+    it is stored in a segment after *padding* bytes of free space
+    for load commands.
+    """
+    from macholib import mach_o
+
+    def command(cmd, body, data=b""):
+        size = mach_o.load_command._size_ + body._size_ + len(data)
+        data += b"\0" * (-size % 8)
+        lc = mach_o.load_command(cmd=cmd, cmdsize=size + (-size % 8))
+        return lc.to_str() + body.to_str() + data
+
+    commands = [
+        command(mach_o.LC_DYSYMTAB, mach_o.dysymtab_command(nlocalsym=nlocalsym))
+    ]
+    offset = mach_o.load_command._size_ + mach_o.dylib_command._size_
+    if install_name is not None:
+        commands.append(
+            command(
+                mach_o.LC_ID_DYLIB,
+                mach_o.dylib_command(name=offset),
+                install_name.encode() + b"\0",
+            )
+        )
+    for name in dylibs:
+        commands.append(
+            command(
+                mach_o.LC_LOAD_DYLIB,
+                mach_o.dylib_command(name=offset),
+                name.encode() + b"\0",
+            )
+        )
+    for path in rpaths:
+        offset = mach_o.load_command._size_ + mach_o.rpath_command._size_
+        commands.append(
+            command(
+                mach_o.LC_RPATH,
+                mach_o.rpath_command(path=offset),
+                path.encode() + b"\0",
+            )
+        )
+
+    if text:
+        size = mach_o.load_command._size_ + mach_o.segment_command_64._size_
+        fileoff = (
+            mach_o.mach_header_64._size_ + sum(map(len, commands)) + size + padding
+        )
+        commands.append(
+            command(
+                mach_o.LC_SEGMENT_64,
+                mach_o.segment_command_64(
+                    segname=b"__TEXT", fileoff=fileoff, filesize=len(text)
+                ),
+            )
+        )
+
+    header = mach_o.mach_header_64(
+        magic=mach_o.MH_MAGIC_64,
+        cputype=cputype,
+        cpusubtype=cpusubtype,
+        filetype=mach_o.MH_DYLIB,
+        ncmds=len(commands),
+        sizeofcmds=sum(map(len, commands)),
+    )
+    return header.to_str() + b"".join(commands) + b"\0" * padding + text
+
+
+def fat_file(*slices):
+    """
+    Contents of a fat Mach-O file with *slices*, which are
+    the contents of thin files like those from :func:`macho_file`.
+    """
+    import struct
+
+    from macholib import mach_o
+
+    align = 12
+    header = struct.pack(">II", mach_o.FAT_MAGIC, len(slices))
+    offset = 1 << align
+    data = b""
+    for contents in slices:
+        cputype, cpusubtype = struct.unpack(">II", contents[4:12])
+        header += struct.pack(
+            ">IIIII", cputype, cpusubtype, offset + len(data), len(contents), align
+        )
+        data += contents + b"\0" * (-len(contents) % (1 << align))
+    return header + b"\0" * (offset - len(header)) + data